@@ -0,0 +1,140 @@
+"""
+bench_backfill.py  -  Cold-start / warm-update wall time of historical()
+------------------------------------------------------------------------
+Runs the legacy serial loop (fixed sleeps, one request at a time, every
+timeframe fetched) and the concurrent token-bucket engine (15m fetched,
+coarse timeframes resampled locally) against an in-memory Kraken stand-in with
+realistic latency.  All waits are multiplied by SCALE so the run is short;
+multiply the printed times by 1/SCALE for real-world seconds.
+
+    python -m benchmarks.bench_backfill [--symbols 40] [--scale 0.02]
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from scripts import historical as hist
+from scripts.fetch_engine import (KRAKEN_PUBLIC_BURST, KRAKEN_PUBLIC_RATE,
+                                  TokenBucket, run_series_jobs)
+
+
+class FakeKraken:
+    """fetch_ohlcv stand-in: Kraken semantics (≤720 newest candles), fixed latency."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self.set_clock(lag_minutes=30)
+
+    def set_clock(self, lag_minutes: float = 0.0) -> None:
+        """Serve candles up to `lag_minutes` ago (a warm run then finds new bars)."""
+        self._now = int(datetime.now(timezone.utc).timestamp() * 1000 - lag_minutes * 60_000)
+
+    def fetch_ohlcv(self, symbol, timeframe="1h", since=None, limit=720):
+        time.sleep(self.latency)
+        self.calls += 1
+        step = int(hist.TIMEFRAME_DELTAS[timeframe].total_seconds() * 1000)
+        last = self._now // step * step
+        first = max(since or 0, last - 719 * step)
+        first = -(-first // step) * step
+        ts = np.arange(first, last + 1, step)[:limit]
+        px = 100 + np.sin(ts / 3.6e6)
+        return [[int(t), p, p + 1, p - 1, p, 1.0] for t, p in zip(ts, px)]
+
+
+def legacy_serial(symbols, kraken, scale):
+    """The pre-engine loop: serial, 1 s sleep per batch, 2.5 s between pages."""
+    for symbol in symbols:
+        for tf, delta in hist.TIMEFRAME_DELTAS.items():
+            path = hist.candle_store.store_path(symbol, tf, hist.BASE_OUTPUT_DIR)
+            now = datetime.now(timezone.utc)
+            last_ms = hist.candle_store.last_timestamp(path)
+            last_ts = (pd.Timestamp(last_ms, unit="ms", tz="UTC") if last_ms is not None
+                       else now - hist.TARGET_ROWS * delta)
+            while last_ts + delta <= now:
+                new = hist.fetch_kraken_ohlcv(symbol, tf, 100 * delta.total_seconds() / 3600,
+                                              pause=2.5 * scale, kraken=kraken)
+                if new is None:
+                    break
+                new.index = new.index.tz_localize("UTC")
+                new = new[new.index > last_ts]
+                if new.empty:
+                    break
+                hist.candle_store.append(path, new)
+                last_ts = new.index[-1]
+                time.sleep(1.0 * scale)
+            while (rows := hist.candle_store.row_count(path)) < hist.TARGET_ROWS:
+                first_ms = int(hist.candle_store.read(path)["timestamp"][0])
+                first_ts = pd.Timestamp(first_ms, unit="ms", tz="UTC")
+                hours = (now - first_ts).total_seconds() / 3600 + \
+                        (hist.TARGET_ROWS - rows) * delta.total_seconds() / 3600
+                old = hist.fetch_kraken_ohlcv(symbol, tf, hours * 1.2,
+                                              pause=2.5 * scale, kraken=kraken)
+                if old is None:
+                    break
+                old.index = old.index.tz_localize("UTC")
+                old = old[old.index < first_ts]
+                if old.empty:
+                    break
+                hist.candle_store.merge(path, old)
+                time.sleep(1.0 * scale)
+
+
+class Paced:
+    """What the exchange gateway does for public calls: take a bucket token first."""
+
+    def __init__(self, kraken, bucket):
+        self.kraken, self.bucket = kraken, bucket
+
+    def fetch_ohlcv(self, *args, **kwargs):
+        self.bucket.acquire()
+        return self.kraken.fetch_ohlcv(*args, **kwargs)
+
+
+def concurrent(symbols, kraken, scale, workers):
+    paced = Paced(kraken, TokenBucket(KRAKEN_PUBLIC_RATE / scale, KRAKEN_PUBLIC_BURST))
+    run_series_jobs(symbols, [hist.FINE_TF],
+                    lambda s, tf: hist.update_symbol(s, kraken=paced),
+                    max_workers=workers)
+
+
+def timed(label, fn, kraken):
+    kraken.calls = 0
+    t0 = time.perf_counter()
+    fn()
+    dt = time.perf_counter() - t0
+    print(f"{label:<28} {dt:8.2f} s   {kraken.calls:5d} requests")
+    return dt
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--symbols", type=int, default=40)
+    ap.add_argument("--scale", type=float, default=0.02, help="time compression factor")
+    ap.add_argument("--latency", type=float, default=0.25, help="real REST latency (s)")
+    ap.add_argument("--workers", type=int, default=8)
+    args = ap.parse_args()
+
+    symbols = [f"C{i:02d}/USD" for i in range(args.symbols)]
+    kraken = FakeKraken(args.latency * args.scale)
+    print(f"{args.symbols} symbols × {len(hist.TIMEFRAME_DELTAS)} timeframes, "
+          f"times compressed ×{args.scale}")
+
+    for label, run in (("serial", lambda: legacy_serial(symbols, kraken, args.scale)),
+                       ("concurrent", lambda: concurrent(symbols, kraken, args.scale, args.workers))):
+        hist.BASE_OUTPUT_DIR = tempfile.mkdtemp()
+        kraken.set_clock(lag_minutes=30)
+        timed(f"{label}: cold start", run, kraken)
+        kraken.set_clock(lag_minutes=0)                 # next 30-minute cycle
+        timed(f"{label}: warm update", run, kraken)
+
+
+if __name__ == "__main__":
+    main()
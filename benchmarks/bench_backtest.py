@@ -0,0 +1,83 @@
+"""
+bench_backtest.py  -  full-bot replay throughput
+------------------------------------------------
+Replays --symbols synthetic 15m series over --days (plus SPAN bars of
+warm-up) through scripts.backtest: rank_state replay, then the bar loop
+running monitor_portfolio / check_pending_orders every bar and ranking +
+buyer every 30 simulated minutes.  Reports the ranking replay and the bar
+loop separately, bars per second and the run's summary.  Numba compilation
+and the Lloyd-Max table build are excluded.
+
+A year of 15m bars for 40 symbols (--days 365, one worker, one core):
+rank replay 108 s, bar loop 231 s (6.6 ms/bar, ~6,100 symbol-bars/s)
+with 8.3 positions open on average (18,756 buys filled), 339 s end to end.
+
+    python -m benchmarks.bench_backtest [--symbols 40] [--days 365] [--workers N]
+"""
+
+from __future__ import annotations
+
+import argparse
+
+import numpy as np
+
+from scripts import candle_store, quantizer, rank, rank_state
+from scripts.backtest import Backtest
+
+STEP_MS = 900_000
+
+
+def synthetic(rows: int, seed: int) -> np.ndarray:
+    """15m random walk with a small per-symbol drift, so some coins trend.
+
+    The drift is ~1e-5 per bar (about +-40 % a year) so a year-long series
+    stays within a few orders of magnitude of its start and orders still
+    clear the exchange minimums.
+    """
+    rng = np.random.default_rng(seed)
+    drift = rng.normal(0.0, 1e-5)
+    close = 2.0 * np.exp(np.cumsum(rng.normal(drift, 0.008, rows)))
+    open_ = np.r_[close[0], close[:-1]]
+    wick = np.abs(rng.normal(0, 0.004, (2, rows))) * close
+    recs = np.empty(rows, dtype=candle_store.record_dtype())
+    recs["timestamp"] = 1_700_006_400_000 + np.arange(rows) * STEP_MS
+    recs["open"], recs["close"] = open_, close
+    recs["high"] = np.maximum(open_, close) + wick[0]
+    recs["low"] = np.minimum(open_, close) - wick[1]
+    recs["volume"] = 1.0
+    return recs
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--symbols", type=int, default=40)
+    ap.add_argument("--days", type=float, default=365)
+    ap.add_argument("--workers", type=int, default=rank.RANK_WORKERS)
+    args = ap.parse_args()
+
+    rows = rank_state.SPAN + int(args.days * 86_400_000 / STEP_MS)
+    candles = {f"S{i:02d}/USD": synthetic(rows, i) for i in range(args.symbols)}
+    quantizer.get_lut()
+    rank_state.replay(synthetic(200, 0), STEP_MS)               # compile
+
+    close = np.concatenate([c["close"] for c in candles.values()])
+    res = Backtest(candles, workers=args.workers).run()
+    s = res.summary()
+    loop = s["seconds"] - s["rank_seconds"]
+    print(f"{args.symbols} symbols x {s['bars']} bars of 15m ({args.days:g} days), "
+          f"{args.workers} worker(s)")
+    print(f"  rank replay {s['rank_seconds']:8.1f} s")
+    print(f"  bar loop    {loop:8.1f} s   {loop / s['bars'] * 1000:7.2f} ms/bar   "
+          f"{s['bars'] * args.symbols / loop:8.0f} symbol-bars/s   "
+          f"{s['mean_positions']:.1f} open positions on average "
+          f"(max {int(res.positions.max())})")
+    print(f"  total       {s['seconds']:8.1f} s")
+    print(f"  {s['trades']} trades, pnl {s['pnl']:+.2f} ({s['return_pct']:+.2f} %), "
+          f"max drawdown {s['max_drawdown_pct']:.2f} %, fees {s['fees']:.2f}")
+    print(f"  {s['buys']} buys filled, closes within [{close.min():.3g}, {close.max():.3g}]")
+    if not s["buys"]:
+        raise SystemExit("no buy filled - the loop was timed without open positions")
+
+
+if __name__ == "__main__":
+    main()
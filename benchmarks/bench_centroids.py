@@ -0,0 +1,82 @@
+"""
+bench_centroids.py  -  get_centroids(): legacy per-row loop vs batched engine
+-----------------------------------------------------------------------------
+Times the original Python loop at step=5 (stale centroids between refits)
+and step=1 (exact) against the batched engine at step=1, solving exactly
+and looking centroids up in the Lloyd-Max table, on TARGET_ROWS synthetic
+candles per series.  Numba compilation and the table build are excluded.
+
+    python -m benchmarks.bench_centroids [--rows 700] [--series 20]
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from scripts import rank
+
+
+def legacy_get_centroids(df: pd.DataFrame, step: int = 5, grid_pts: int = 300) -> list[np.ndarray]:
+    """The per-row loop get_centroids() replaced."""
+    ohlc = df[["open", "high", "low", "close"]].to_numpy(dtype=np.float32)
+    hist = np.zeros(rank.n_bins)
+    x_grid = np.linspace(rank.bin_centers[0], rank.bin_centers[-1], grid_pts)
+    prev, out = None, []
+    for i, row in enumerate(ohlc):
+        hist *= rank.decay_rate
+        hist += np.histogram(row - row[0], bins=rank.bins)[0]
+        if i == 0 or i % step == 0:
+            b_l, b_r = rank.fit_asymmetric_laplace_from_histogram(rank.bin_centers, hist)
+            y = np.where(x_grid < 0, 0.5 * np.exp(x_grid / b_l) / b_l,
+                         0.5 * np.exp(-x_grid / b_r) / b_r)
+            y *= hist.sum() * rank.bin_width
+            prev = rank.lloyd_max_quantizer(x_grid, y, rank.n_centroids)
+        out.append(prev)
+    return out
+
+
+def synthetic(rows: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 1.0 + np.cumsum(rng.normal(0, 0.05, rows))
+    open_ = np.r_[close[0], close[:-1]]
+    wick = np.abs(rng.normal(0, 0.05, (2, rows)))
+    return pd.DataFrame({"open": open_, "high": np.maximum(open_, close) + wick[0],
+                         "low": np.minimum(open_, close) - wick[1], "close": close})
+
+
+def timed(fn, frames) -> float:
+    t0 = time.perf_counter()
+    for df in frames:
+        fn(df)
+    return time.perf_counter() - t0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--rows", type=int, default=rank.TARGET_ROWS)
+    ap.add_argument("--series", type=int, default=20)
+    args = ap.parse_args()
+
+    frames = [synthetic(args.rows, s) for s in range(args.series)]
+    rank.get_centroids(frames[0], exact=True)          # compile
+    rank.get_centroids(frames[0])                      # load / build the table
+
+    runs = {
+        "legacy step=5": timed(lambda df: legacy_get_centroids(df, step=5), frames),
+        "legacy step=1": timed(lambda df: legacy_get_centroids(df, step=1), frames),
+        "exact step=1": timed(lambda df: rank.get_centroids(df, exact=True), frames),
+        "table step=1": timed(rank.get_centroids, frames),
+    }
+    base = runs["legacy step=5"]
+    print(f"{args.series} series x {args.rows} rows")
+    for name, secs in runs.items():
+        print(f"  {name:<15} {secs:8.3f} s   {secs / args.series * 1000:8.2f} ms/series   "
+              f"{base / secs:6.1f}x vs step=5")
+
+
+if __name__ == "__main__":
+    main()
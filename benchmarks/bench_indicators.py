@@ -0,0 +1,81 @@
+"""
+bench_indicators.py  -  `ta` momentum vs scripts/indicators.py
+---------------------------------------------------------------
+Times the momentum score the way each caller computes it:
+  • rank:     rsi/macd_diff/roc/sma20 + score columns for a TARGET_ROWS
+              series (rank.add_momentum_columns);
+  • history:  the same over a --rows series (backfills, sweeps);
+  • monitor:  the score of the last of MOM_WINDOW closes, once per open
+              position per loop (monitor_portfolio.momentum_score);
+  • stream:   one new close into a running MomentumState, against
+              re-scoring the whole window with `ta`.
+"ta" is the pandas/ta code these replaced.  Also prints the largest
+difference between the two.  Numba compilation is excluded.
+
+    python -m benchmarks.bench_indicators [--rows 100000] [--repeat 200]
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from ta.momentum import RSIIndicator, ROCIndicator
+from ta.trend import MACD
+
+from scripts import indicators, monitor_portfolio, rank
+from scripts.indicators import MomentumState
+
+
+def ta_columns(close: pd.Series) -> np.ndarray:
+    macd = MACD(close)
+    raw = np.column_stack([RSIIndicator(close, 14).rsi(), macd.macd() - macd.macd_signal(),
+                           ROCIndicator(close, 5).roc(), close.rolling(20).mean()])
+    return indicators.momentum_score(raw, close.to_numpy(), close.std())
+
+
+def timed(fn, repeat: int) -> float:
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    close = 50 * np.exp(np.cumsum(rng.normal(0, 0.01, args.rows)))
+    window = close[-monitor_portfolio.MOM_WINDOW:]
+    st = MomentumState()
+    st.update_many(close[:-1])
+
+    cases = {
+        "rank": (lambda: ta_columns(pd.Series(close[:rank.TARGET_ROWS])),
+                 lambda: indicators.score_series(close[:rank.TARGET_ROWS])),
+        "history": (lambda: ta_columns(pd.Series(close)),
+                    lambda: indicators.score_series(close)),
+        "monitor": (lambda: ta_columns(pd.Series(window))[-1],
+                    lambda: indicators.latest_score(window)),
+        "stream": (lambda: ta_columns(pd.Series(window))[-1],
+                   lambda: st.update(close[-1])),
+    }
+    print(f"{args.rows} rows, {args.repeat} repeats")
+    for name, (old, new) in cases.items():
+        reps = max(1, args.repeat * 1000 // args.rows) if name == "history" else args.repeat
+        t_old, t_new = timed(old, reps), timed(new, reps)
+        print(f"  {name:<8} ta {t_old * 1e3:9.3f} ms   indicators {t_new * 1e3:9.3f} ms   "
+              f"{t_old / t_new:8.1f}x")
+
+    diff = np.nanmax(np.abs(ta_columns(pd.Series(close)) - indicators.score_series(close)[1]))
+    print(f"  max |score difference| over {args.rows} rows: {diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
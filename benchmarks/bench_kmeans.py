@@ -0,0 +1,93 @@
+"""
+bench_kmeans.py  -  safe_cluster(): sklearn KMeans vs numba k-means
+-------------------------------------------------------------------
+Clusters the Lloyd-Max centroid vectors of synthetic series the way a
+ranking cycle does: a window of TARGET_ROWS rows, refit after the window
+slides by --slide rows.  Reports time per fit, inertia relative to sklearn,
+and how many rows keep their cluster number from one fit to the next
+(label stability).  Numba compilation is excluded.
+
+    python -m benchmarks.bench_kmeans [--series 20] [--slide 50]
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+import warnings
+
+import numpy as np
+from sklearn.cluster import KMeans                    # type: ignore
+from sklearn.exceptions import ConvergenceWarning     # type: ignore
+
+from benchmarks.bench_centroids import synthetic
+from scripts import rank
+from scripts.kmeans import kmeans
+
+
+def sklearn_fit(x, prev):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", ConvergenceWarning)
+        km = KMeans(n_clusters=8, random_state=42).fit(x)
+    return km.cluster_centers_, km.inertia_
+
+
+def cold_fit(x, prev):
+    fit = kmeans(x, 8)
+    return fit.cluster_centers_, fit.inertia_
+
+
+def warm_fit(x, prev):
+    fit = kmeans(x, 8, init=prev)
+    return fit.cluster_centers_, fit.inertia_
+
+
+def run(fit, windows, slide):
+    """(seconds, inertias, stability) over consecutive windows of each series."""
+    secs, inertia, kept = 0.0, [], []
+    for series in windows:
+        prev = None
+        for x in series:
+            t0 = time.perf_counter()
+            centers, err = fit(x, prev)
+            secs += time.perf_counter() - t0
+            inertia.append(err)
+            if prev is not None:                  # rows shared by both windows
+                shared = x[:-slide]
+                kept.append(np.mean(nearest(prev, shared) == nearest(centers, shared)))
+            prev = centers
+    return secs, np.array(inertia), float(np.mean(kept))
+
+
+def nearest(centers, x):
+    return ((x[:, None] - centers[None]) ** 2).sum(axis=2).argmin(axis=1)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--series", type=int, default=20)
+    ap.add_argument("--slide", type=int, default=50)
+    ap.add_argument("--fits", type=int, default=10, help="windows per series")
+    args = ap.parse_args()
+
+    rows = rank.TARGET_ROWS
+    windows = []
+    for s in range(args.series):
+        cents = rank.get_centroids(synthetic(rows + args.slide * args.fits, s))
+        windows.append([cents[i * args.slide:i * args.slide + rows] for i in range(args.fits)])
+    warm_fit(windows[0][0], None)                  # compile
+
+    runs = {name: run(fit, windows, args.slide)
+            for name, fit in (("sklearn", sklearn_fit), ("numba cold", cold_fit),
+                              ("numba warm", warm_fit))}
+    base_secs, base_inertia, _ = runs["sklearn"]
+    n = args.series * args.fits
+    print(f"{n} fits of {rows} x 8 vectors, window slides {args.slide} rows")
+    for name, (secs, inertia, kept) in runs.items():
+        print(f"  {name:<11} {secs / n * 1000:7.2f} ms/fit  {base_secs / secs:5.1f}x   "
+              f"inertia {np.mean(inertia / base_inertia):6.3f} x sklearn   "
+              f"labels kept {kept:6.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+bench_rank.py  -  rank_coins(): serial vs warm process pool
+-----------------------------------------------------------
+Writes synthetic candle stores for every ranked timeframe of --symbols
+symbols into a temp dir and times a cold rank (fresh states, SPAN rows per
+series) at each worker count.  Pool start-up and worker warm-up are excluded:
+the pool is warmed on a throw-away state dir first, as it would be after the
+bot's first cycle.
+
+    python -m benchmarks.bench_rank [--symbols 40] [--workers 1 2 4 8]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from scripts import candle_store, rank, rank_state
+
+
+def synthetic(rows: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    close = 2.0 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, rows)))
+    open_ = np.r_[close[0], close[:-1]]
+    wick = np.abs(rng.normal(0, 0.01, (2, rows))) * close
+    recs = np.empty(rows, dtype=candle_store.record_dtype())
+    recs["timestamp"] = 1_700_000_000_000 + np.arange(rows) * 60_000
+    recs["open"], recs["close"] = open_, close
+    recs["high"] = np.maximum(open_, close) + wick[0]
+    recs["low"] = np.minimum(open_, close) - wick[1]
+    recs["volume"] = 1.0
+    return recs
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--symbols", type=int, default=40)
+    ap.add_argument("--workers", type=int, nargs="+",
+                    default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        hist = Path(tmp) / "historical"
+        for s in range(args.symbols):
+            for t, tf in enumerate(rank.MAX_LOOKBACK_FOR_720_HOURS):
+                store = str(hist / f"c{s:03d}_usd" / f"{tf}{candle_store.EXTENSION}")
+                candle_store.create(store)
+                candle_store.append(store, synthetic(rank_state.SPAN, 100 * s + t))
+
+        series = args.symbols * len(rank.MAX_LOOKBACK_FOR_720_HOURS)
+        print(f"{args.symbols} symbols x {len(rank.MAX_LOOKBACK_FOR_720_HOURS)} timeframes "
+              f"({series} series), {os.cpu_count()} cores")
+        base = None
+        for workers in args.workers:
+            kw = {"workers": workers, "hist_dir": hist, "output": Path(tmp) / "ranked.json"}
+            rank.rank_coins(state_dir=f"{tmp}/warm_{workers}", **kw)       # warm-up
+            t0 = time.perf_counter()
+            rank.rank_coins(state_dir=f"{tmp}/state_{workers}", **kw)
+            secs = time.perf_counter() - t0
+            base = base or secs
+            print(f"  workers={workers:<3} {secs:8.3f} s   {secs / series * 1000:8.2f} ms/series   "
+                  f"{base / secs:5.1f}x")
+        rank.shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
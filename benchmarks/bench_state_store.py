@@ -0,0 +1,74 @@
+"""
+bench_state_store.py  -  JSON full rewrite vs the SQLite state store
+--------------------------------------------------------------------
+Times one monitor-style update, in which a single position's stop moves, for
+a book of --positions rows:
+  • json:   load the whole file, change one row, json.dump(indent=2) it
+            all back.  This is the old utilities.load_json / save_json;
+  • store:  state_store load() + save(), which commits only the changed
+            row.  The dashboard export of the table is included.
+Also times a load() on its own, which the cache serves.
+
+    python -m benchmarks.bench_state_store [--positions 200] [--repeat 500]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from scripts.state_store import close_store, get_store
+
+
+def book(n: int) -> dict:
+    return {f"C{i:04d}/USD": {"qty": 1.0 + i, "entry_price": 10.0 + i, "stop_price": 9.2 + i,
+                              "peak_price": 10.0 + i, "filled_at": "2024-01-01T00:00:00",
+                              "stop_order_id": f"S{i}", "triggered": False} for i in range(n)}
+
+
+def timed(fn, repeat: int) -> float:
+    fn()
+    t0 = time.perf_counter()
+    for k in range(repeat):
+        fn(k)
+    return (time.perf_counter() - t0) / repeat * 1e3
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--positions", type=int, default=200)
+    ap.add_argument("--repeat", type=int, default=500)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "positions.json"
+        path.write_text(json.dumps(book(args.positions), indent=2))
+
+        def json_update(k=0):
+            data = json.loads(path.read_text())
+            data["C0000/USD"]["stop_price"] = 9.2 + k * 1e-3
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+
+        store = get_store(tmp)
+        store.save("positions", book(args.positions))
+
+        def store_update(k=0):
+            data = store.load("positions")
+            data["C0000/USD"]["stop_price"] = 9.2 + k * 1e-3
+            store.save("positions", data)
+
+        rows = {"json": timed(json_update, args.repeat), "store": timed(store_update, args.repeat),
+                "store load": timed(lambda k=0: store.load("positions"), args.repeat)}
+        close_store(tmp)
+
+    print(f"{args.positions} positions, one row changed per update")
+    for name, ms in rows.items():
+        print(f"  {name:<12} {ms:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
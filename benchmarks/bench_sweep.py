@@ -0,0 +1,93 @@
+"""
+bench_sweep.py  -  one ranking replay per setting vs the batched sweep
+----------------------------------------------------------------------
+For --series synthetic TARGET_ROWS-row series and a --combos-sized grid,
+times:
+  • replay:    a fresh rank_state.SeriesState over the series once per
+               combination with the strategy constants set, i.e. what
+               re-running the live ranking per setting costs (measured on
+               10 combinations, extrapolated);
+  • single:    sweep.sweep_series one combination at a time on a series
+               whose walk plan is prepared once;
+  • sweep:     sweep.sweep_series, all combinations in one pass.
+Numba compilation and the Lloyd-Max table build are excluded.
+
+    python -m benchmarks.bench_sweep [--series 8] [--combos 1000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_rank import synthetic
+from scripts import rank, rank_state, sweep
+
+STEP_MS = 60_000                                                 # bench_rank.synthetic spacing
+
+CONSTANTS = ("BUY_FEE", "STOP_LOSS", "TRIGGER", "MOM_WINDOW")     # sweep.PARAMS order
+
+
+def grid(n: int) -> dict[str, list]:
+    """About n combinations over the four strategy parameters."""
+    side = max(2, round(n ** 0.25))
+    return {"buy_fee": list(np.linspace(0.0, 0.005, side)),
+            "stop_loss_pct": list(np.linspace(0.02, 0.15, side)),
+            "trigger_profit": list(np.linspace(0.005, 0.06, side)),
+            "momentum_window": [int(w) for w in np.linspace(10, 120, side)]}
+
+
+def replay_once(recs, p) -> None:
+    saved = [getattr(rank_state, n) for n in CONSTANTS]
+    for name, value in zip(CONSTANTS, p):
+        setattr(rank_state, name, value)
+    try:
+        rank_state.replay(recs, STEP_MS)
+    finally:
+        for name, value in zip(CONSTANTS, saved):
+            setattr(rank_state, name, value)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--series", type=int, default=8)
+    ap.add_argument("--combos", type=int, default=1000)
+    args = ap.parse_args()
+
+    combos = sweep.expand_grid(grid(args.combos))
+    settings = list(combos.itertuples(index=False, name=None))
+    series = [synthetic(rank.TARGET_ROWS, s) for s in range(args.series)]
+    thresholds = sweep.DEFAULT_THRESHOLDS
+
+    replay_once(series[0], settings[0])                             # compile, load table
+    sweep.sweep_series(sweep.prepare_series(series[0], STEP_MS), combos[:2], thresholds)
+
+    t0 = time.perf_counter()
+    for recs in series:
+        for p in settings[:10]:
+            replay_once(recs, p)
+    replay = (time.perf_counter() - t0) * len(settings) / 10
+
+    t0 = time.perf_counter()
+    for recs in series:
+        prepared = sweep.prepare_series(recs, STEP_MS)
+        for k in range(len(combos)):
+            sweep.sweep_series(prepared, combos[k:k + 1], thresholds)
+    single = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for recs in series:
+        sweep.sweep_series(sweep.prepare_series(recs, STEP_MS), combos, thresholds)
+    batched = time.perf_counter() - t0
+
+    print(f"{args.series} series x {rank.TARGET_ROWS} rows, {len(combos)} combinations "
+          f"x {len(thresholds)} thresholds")
+    for name, secs in (("replay", replay), ("single", single), ("sweep", batched)):
+        print(f"  {name:<9} {secs:9.2f} s   {secs / args.series:8.3f} s/series   "
+              f"{replay / secs:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
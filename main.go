@@ -2,12 +2,15 @@
 package main
 
 import (
+	"bufio"
 	"bytes"
+	"encoding/binary"
 	"encoding/csv"
 	"encoding/json"
 	"fmt"
 	"html/template"
 	"log"
+	"math"
 	"net/http"
 	"os"
 	"path/filepath"
@@ -293,6 +296,52 @@ type CoinPayload struct {
 }
 
 
+// loadEventsLog reads one fill per line, skipping ids already seen (a line
+// can be replayed if the bot stopped between appending and saving its cursor).
+func loadEventsLog(path string) ([]CoinEvent, error) {
+	f, err := os.Open(path)
+	if err != nil {
+		return nil, err
+	}
+	defer f.Close()
+
+	var events []CoinEvent
+	seen := map[string]bool{}
+	sc := bufio.NewScanner(f)
+	for sc.Scan() {
+		line := sc.Bytes()
+		if len(line) == 0 {
+			continue
+		}
+		var e struct {
+			CoinEvent
+			ID string `json:"id"`
+		}
+		if err := json.Unmarshal(line, &e); err != nil {
+			return events, err
+		}
+		if e.ID != "" {
+			if seen[e.ID] {
+				continue
+			}
+			seen[e.ID] = true
+		}
+		events = append(events, e.CoinEvent)
+	}
+	return events, sc.Err()
+}
+
+func loadEventsJSON(path string) ([]CoinEvent, error) {
+	f, err := os.Open(path)
+	if err != nil {
+		return nil, err
+	}
+	defer f.Close()
+	var events []CoinEvent
+	err = json.NewDecoder(f).Decode(&events)
+	return events, err
+}
+
 // -----------------------------------------------------------------------------
 // Helper
 // -----------------------------------------------------------------------------
@@ -300,49 +349,24 @@ func loadCoinPayload(sym, tf string) (CoinPayload, error) {
 	folder := symbolDir(sym) // e.g. btc_usd
 	base := filepath.Join("data", "historical", folder)
 
-	// ---- candles CSV ----------------------------------------------------------
-	csvPath := filepath.Join(base, tf+".csv")
-	f, err := os.Open(csvPath)
-	if err != nil {
-		return CoinPayload{}, fmt.Errorf("open csv: %w", err)
+	// ---- candles (binary store, CSV fallback) ----------------------------------
+	series, err := loadCandleStore(filepath.Join(base, tf+".ohlcv"), chartRows)
+	if os.IsNotExist(err) {
+		series, err = loadCandleCSV(filepath.Join(base, tf+".csv"))
 	}
-	defer f.Close()
-
-	r := csv.NewReader(f)
-	records, err := r.ReadAll()
 	if err != nil {
-		return CoinPayload{}, fmt.Errorf("csv read: %w", err)
+		return CoinPayload{}, err
 	}
 
-	var series []CoinPoint
-	for i, rec := range records {
-		if i == 0 {
-			if _, err := strconv.ParseFloat(rec[1], 64); err != nil {
-				continue // skip header
-			}
-		}
-		if len(rec) < 5 {
-			continue
-		}
-
-		o, _ := strconv.ParseFloat(rec[1], 64)
-		h, _ := strconv.ParseFloat(rec[2], 64)
-		l, _ := strconv.ParseFloat(rec[3], 64)
-		c_, _ := strconv.ParseFloat(rec[4], 64)
-
-		series = append(series, CoinPoint{rec[0], o, h, l, c_})
+	// ---- events (optional; append-only jsonl, legacy json fallback) ----------
+	events, err := loadEventsLog(filepath.Join(base, "events.jsonl"))
+	if os.IsNotExist(err) {
+		events, err = loadEventsJSON(filepath.Join(base, "events.json"))
 	}
-
-	// ---- events (optional) ----------------------------------------------------
-	evtPath := filepath.Join(base, "events.json")
-	var events []CoinEvent
-	if ef, err := os.Open(evtPath); err == nil {
-		defer ef.Close()
-		if err := json.NewDecoder(ef).Decode(&events); err != nil {
-			log.Printf("warning: could not decode events.json for %s: %v", sym, err)
-		}
-	} else {
-		log.Printf("info: no events.json for %s", sym)
+	if os.IsNotExist(err) {
+		log.Printf("info: no events for %s", sym)
+	} else if err != nil {
+		log.Printf("warning: could not decode events for %s: %v", sym, err)
 	}
 
 	// ---- monitor (optional) ---------------------------------------------------
@@ -384,6 +408,88 @@ func loadCoinPayload(sym, tf string) (CoinPayload, error) {
 	}, nil
 }
 
+// chartRows is how many of the newest candles the coin page plots.
+const chartRows = 700
+
+// loadCandleStore reads the tail of a <tf>.ohlcv file written by
+// scripts/candle_store.py: a 32-byte header followed by fixed-width
+// little-endian records (int64 ms timestamp + 5 float32/float64 columns).
+func loadCandleStore(path string, tail int) ([]CoinPoint, error) {
+	raw, err := os.ReadFile(path)
+	if err != nil {
+		return nil, err
+	}
+	if len(raw) < 32 || string(raw[:8]) != "NPTOHLCV" {
+		return nil, fmt.Errorf("%s: not a candle store", path)
+	}
+	width := int(binary.LittleEndian.Uint16(raw[10:12]))
+	if width != 4 && width != 8 {
+		return nil, fmt.Errorf("%s: bad float width %d", path, width)
+	}
+	recSize := 8 + 5*width
+	n := (len(raw) - 32) / recSize
+	start := 0
+	if n > tail {
+		start = n - tail
+	}
+
+	float := func(b []byte) float64 {
+		if width == 4 {
+			return float64(math.Float32frombits(binary.LittleEndian.Uint32(b)))
+		}
+		return math.Float64frombits(binary.LittleEndian.Uint64(b))
+	}
+
+	series := make([]CoinPoint, 0, n-start)
+	for i := start; i < n; i++ {
+		rec := raw[32+i*recSize : 32+(i+1)*recSize]
+		ts := time.UnixMilli(int64(binary.LittleEndian.Uint64(rec[:8]))).UTC()
+		series = append(series, CoinPoint{
+			T: ts.Format("2006-01-02 15:04:05+00:00"),
+			O: float(rec[8:]),
+			H: float(rec[8+width:]),
+			L: float(rec[8+2*width:]),
+			C: float(rec[8+3*width:]),
+		})
+	}
+	return series, nil
+}
+
+// loadCandleCSV reads a legacy <tf>.csv (timestamp,open,high,low,close,volume).
+func loadCandleCSV(csvPath string) ([]CoinPoint, error) {
+	f, err := os.Open(csvPath)
+	if err != nil {
+		return nil, fmt.Errorf("open csv: %w", err)
+	}
+	defer f.Close()
+
+	r := csv.NewReader(f)
+	records, err := r.ReadAll()
+	if err != nil {
+		return nil, fmt.Errorf("csv read: %w", err)
+	}
+
+	var series []CoinPoint
+	for i, rec := range records {
+		if i == 0 {
+			if _, err := strconv.ParseFloat(rec[1], 64); err != nil {
+				continue // skip header
+			}
+		}
+		if len(rec) < 5 {
+			continue
+		}
+
+		o, _ := strconv.ParseFloat(rec[1], 64)
+		h, _ := strconv.ParseFloat(rec[2], 64)
+		l, _ := strconv.ParseFloat(rec[3], 64)
+		c_, _ := strconv.ParseFloat(rec[4], 64)
+
+		series = append(series, CoinPoint{rec[0], o, h, l, c_})
+	}
+	return series, nil
+}
+
 // btc_usd folder path for "BTC/USD"
 func symbolDir(sym string) string {
 	return strings.ReplaceAll(strings.ToLower(sym), "/", "_")
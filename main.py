@@ -12,7 +12,6 @@ import time
 import logging
 from typing import Dict
 from datetime import datetime
-import ccxt # type: ignore
 import os
 import threading
 
@@ -26,6 +25,10 @@ from scripts.buyer import buyer
 from scripts.check_pending_orders import check_pending_orders
 from scripts.monitor_portfolio import monitor_portfolio
 from scripts.pnl_tracker import update_account_pnl
+from scripts.exchange import get_exchange
+from scripts.stream import get_bus, start_stream
+from scripts.candle_buffer import get_buffers
+from scripts.stop_engine import get_engine
 
 
 # ───────────────────────────── Logging / Rich setup ──────────────────────────
@@ -106,14 +109,6 @@ ASSETS: Dict[str, str] = {
 }
 
 
-def kraken_client():
-    return ccxt.kraken({
-        "apiKey"         : os.getenv("KRAKEN_API_KEY"),
-        "secret"         : os.getenv("KRAKEN_API_SECRET"),
-        "enableRateLimit": True,
-    })
-
-
 def loop_monitor_portfolio():
     while True:
         try:
@@ -129,7 +124,10 @@ def loop_monitor_portfolio():
 
 
 def main() -> None:
-    kraken = kraken_client()
+    kraken = get_exchange()        # shared with every module and the monitor thread
+    start_stream(ASSETS)           # live prices/candles; readers fall back to REST when down
+    get_bus().subscribe(get_buffers().on_price)      # ticks into the monitor's candle buffers
+    get_bus().subscribe(get_engine().on_tick)        # stops fire on the crossing tick
 
     # Start background threads
     threading.Thread(target=loop_monitor_portfolio, daemon=True).start()
@@ -0,0 +1,353 @@
+"""
+backtest.py  -  Event-driven replay of the whole bot over stored candles
+------------------------------------------------------------------------
+• Replays the FINE_TF candles in data/historical bar by bar through the
+  bot's own code: ranking (rank_state + rank.combine), buyer(),
+  monitor_portfolio() and check_pending_orders().  The cadence is main.py's:
+  rank and buy every RANK_EVERY_MS, monitor and pending checks on every bar.
+• Orders go to a SimExchange (scripts/sim_exchange.py) on a simulated clock.
+  For the length of the run, the exchange, the price snapshot, the clock
+  (utilities.utc_now), the monitor's candle buffers, the stop engine
+  (selling inline, on the simulated clock) and the JSON state root
+  (utilities.BASE, a throw-away workspace) are all swapped in, then
+  restored.  The buffers seed from the SimExchange, so the stored candles
+  past the simulated time are never seen, and every replayed bar is fed to
+  them.
+• Ranking uses rank_state, as rank_coins does.  Each symbol/timeframe
+  series is replayed once, before the run, through one SeriesState that
+  records current() after every row (in the rank pool when workers > 1).
+  A ranking cycle then reads the entry for the last closed bar, which
+  equals advancing the saved states cycle by cycle.  Timeframes are
+  resampled from FINE_TF, so the finer ones (1m/5m) are not scored.  As
+  on a fresh deployment, every state starts SPAN rows before `start`.
+• portfolio.json is written from the simulated balances before each buyer
+  call; this replaces update_all's exchange sync.
+• The result holds the equity curve, the fills, the round-trip trades and a
+  summary.  PnL is latency-free: orders fill at the prices the code saw,
+  less FEE.
+• `python -m scripts.backtest [--symbols ...] [--start 2024-01-01] [--days 365]`
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from rich.console import Console      # type: ignore
+
+from scripts import buyer as buyer_mod
+from scripts import (candle_buffer, candle_store, exchange, order_submit, prices, rank, rank_state,
+                     state_store, stop_engine, utilities)
+from scripts.buyer import buyer
+from scripts.check_pending_orders import check_pending_orders
+from scripts.monitor_portfolio import monitor_portfolio
+from scripts.resample import FINE_TF, period_ms
+from scripts.sim_exchange import FEE, QUOTE, SimExchange
+
+logger = logging.getLogger(__name__)
+
+# ───────────────────────────── Config ────────────────────────────────────────
+HIST_DIR      = candle_store.BASE_OUTPUT_DIR
+OUTPUT_DIR    = "data/backtest"
+START_CASH    = 10_000.0
+RANK_EVERY_MS = 1800 * 1000                  # main.py's "every 30 min" block
+SCRATCH_DIR   = "/dev/shm" if os.path.isdir("/dev/shm") else None   # tmpfs for the state store
+
+STATE_FILES = {"data/positions.json": {}, "data/pending_orders.json": [],
+               "data/monitor.json": {}, "data/ranked_coins.json": {}}
+
+
+def scored_timeframes(fine_tf: str = FINE_TF) -> list[str]:
+    """rank's timeframes that can be resampled from fine_tf, in rank's order."""
+    return [tf for tf in rank.MAX_LOOKBACK_FOR_720_HOURS if period_ms(tf) >= period_ms(fine_tf)]
+
+
+def to_datetime(ms: int) -> datetime:
+    return datetime.fromtimestamp(ms / 1000, timezone.utc)
+
+
+# ───────────────────────────── Result ────────────────────────────────────────
+class BacktestResult:
+    """Equity curve, fills and round-trip trades of one run."""
+
+    def __init__(self, equity: pd.Series, fills: pd.DataFrame, seconds: float, symbols: int,
+                 rank_seconds: float = 0.0, positions: pd.Series | None = None):
+        self.equity  = equity
+        self.positions = positions if positions is not None else pd.Series(0, index=equity.index)
+        self.fills   = fills
+        self.trades  = round_trips(fills)
+        self.seconds = seconds
+        self.symbols = symbols
+        self.rank_seconds = rank_seconds
+
+    def summary(self) -> dict[str, float]:
+        eq = self.equity
+        start, end = (float(eq.iloc[0]), float(eq.iloc[-1])) if len(eq) else (np.nan, np.nan)
+        drawdown = (eq / eq.cummax() - 1).min() if len(eq) else np.nan
+        trades = self.trades
+        return {
+            "start_equity": start,
+            "end_equity":   end,
+            "pnl":          end - start,
+            "return_pct":   (end / start - 1) * 100,
+            "max_drawdown_pct": float(drawdown) * 100,
+            "trades":       len(trades),
+            "win_rate":     float((trades["pnl"] > 0).mean()) if len(trades) else np.nan,
+            "fees":         float(self.fills["fee"].sum()) if len(self.fills) else 0.0,
+            "buys":         int((self.fills["side"] == "buy").sum()) if len(self.fills) else 0,
+            "mean_positions": float(self.positions.mean()) if len(self.positions) else 0.0,
+            "bars":         len(eq),
+            "symbols":      self.symbols,
+            "seconds":      self.seconds,
+            "rank_seconds": self.rank_seconds,
+        }
+
+    def save(self, out_dir: str = OUTPUT_DIR) -> None:
+        os.makedirs(out_dir, exist_ok=True)
+        self.equity.to_csv(os.path.join(out_dir, "equity.csv"), header=True)
+        self.fills.to_csv(os.path.join(out_dir, "fills.csv"), index=False)
+        self.trades.to_csv(os.path.join(out_dir, "trades.csv"), index=False)
+
+
+def round_trips(fills: pd.DataFrame) -> pd.DataFrame:
+    """Pair each sell with the buys it closes (FIFO per symbol); PnL net of both fees."""
+    rows, lots = [], {}
+    for f in fills.itertuples(index=False):
+        book = lots.setdefault(f.symbol, deque())
+        if f.side == "buy":
+            book.append([f.time, f.qty, f.price, f.fee / f.qty])
+            continue
+        qty, sell_fee = f.qty, f.fee / f.qty
+        while qty > 1e-12 and book:
+            lot = book[0]
+            take = min(qty, lot[1])
+            cost = take * (lot[2] + lot[3])
+            pnl = take * (f.price - sell_fee) - cost
+            rows.append({"symbol": f.symbol, "entry_time": lot[0], "exit_time": f.time,
+                         "qty": take, "entry_price": lot[2], "exit_price": f.price,
+                         "pnl": pnl, "return": pnl / cost})
+            lot[1] -= take
+            qty -= take
+            if lot[1] <= 1e-12:
+                book.popleft()
+    return pd.DataFrame(rows, columns=["symbol", "entry_time", "exit_time", "qty", "entry_price",
+                                       "exit_price", "pnl", "return"])
+
+
+# ───────────────────────────── Runner ────────────────────────────────────────
+class Backtest:
+    """One replay of `candles` ({symbol: fine records}) from `start` to `end` (ms)."""
+
+    def __init__(self, candles: dict[str, np.ndarray], start: int | None = None,
+                 end: int | None = None, cash: float = START_CASH, fee: float = FEE,
+                 fine_tf: str = FINE_TF, workspace: str | None = None,
+                 workers: int = rank.RANK_WORKERS):
+        self.candles = {s: np.asarray(r) for s, r in candles.items() if len(r)}
+        self.fine_tf = fine_tf
+        self.step_ms = period_ms(fine_tf)
+        self.sim     = SimExchange(self.candles, cash, fee, fine_tf)
+        self.tfs     = scored_timeframes(fine_tf)
+        first = min((int(r["timestamp"][min(rank_state.SPAN, len(r) - 1)])
+                     for r in self.candles.values()), default=0)
+        self.start   = first if start is None else int(start)
+        self.end     = end
+        self.workspace = workspace
+        self.workers = workers
+        self.traces: dict[tuple[str, str], tuple[np.ndarray, list]] = {}
+
+    # -- ranking ----------------------------------------------------------------
+    def prepare(self, until: int) -> None:
+        """
+        Replay every symbol/timeframe series once, from SPAN rows before
+        `start` to `until`, keeping current() after each row.  current()
+        only depends on the last SPAN rows, so this equals advancing the
+        live states cycle by cycle.
+        """
+        jobs = {}
+        for symbol in self.candles:
+            for tf in self.tfs:
+                recs = self.sim.series(symbol, tf)
+                close = recs["timestamp"] + period_ms(tf)
+                lo = max(0, int(np.searchsorted(close, self.start, side="right")) - rank_state.SPAN)
+                hi = int(np.searchsorted(close, until, side="right"))
+                jobs[(symbol, tf)] = (close[lo:hi], recs[lo:hi])
+
+        if self.workers <= 1:
+            traces = {key: rank_state.replay(recs, period_ms(key[1]))
+                      for key, (_, recs) in jobs.items()}
+        else:
+            pool = rank.get_pool(self.workers)
+            futures = {key: pool.submit(rank_state.replay, recs, period_ms(key[1]))
+                       for key, (_, recs) in jobs.items()}
+            traces = {key: fut.result() for key, fut in futures.items()}
+        self.traces = {key: (jobs[key][0], traces[key]) for key in jobs}
+
+    def rank(self) -> dict[str, dict[str, float]]:
+        """rank_coins as of the simulated time; writes data/ranked_coins.json."""
+        ranking = {}
+        for symbol in self.candles:
+            currents = []
+            for tf in self.tfs:
+                close, trace = self.traces[(symbol, tf)]
+                i = int(np.searchsorted(close, self.sim.now, side="right")) - 1
+                currents.append(trace[i] if i >= 0 else None)
+            result = rank.combine(symbol, self.sim.last.get(symbol), currents)
+            if result:
+                ranking[symbol] = result
+        ranking = dict(sorted(ranking.items(), key=lambda x: x[1]["score"], reverse=True))
+        utilities.save_json(ranking, "data/ranked_coins.json")
+        return ranking
+
+    def sync_portfolio(self) -> None:
+        """update_portfolio from the simulated balances."""
+        portfolio = {QUOTE: round(self.sim.balance[QUOTE], 6)}
+        for coin, qty in self.sim.balance.items():
+            symbol = f"{coin}/{QUOTE}"
+            if coin != QUOTE and qty > 0 and symbol in self.sim.last:
+                portfolio[symbol] = round(qty * self.sim.last[symbol], 6)
+        utilities.save_json(portfolio, "data/portfolio.json")
+
+    # -- replay -----------------------------------------------------------------
+    def timeline(self) -> np.ndarray:
+        stamps = np.unique(np.concatenate([r["timestamp"] for r in self.candles.values()]))
+        stamps = stamps[stamps >= self.start]
+        return stamps if self.end is None else stamps[stamps < self.end]
+
+    def run(self, quiet: bool = True) -> BacktestResult:
+        """Replay every bar from `start`; `quiet` silences the bot's log output meanwhile."""
+        t0 = time.perf_counter()
+        stamps = self.timeline()
+        if not len(stamps):
+            raise ValueError("no candles in the backtest window")
+        cursor = {s: int(np.searchsorted(r["timestamp"], stamps[0])) for s, r in self.candles.items()}
+        times = {s: r["timestamp"].tolist() for s, r in self.candles.items()}
+        self.prepare(int(stamps[-1]) + self.step_ms)
+        prepared = time.perf_counter() - t0
+        equity = np.empty(len(stamps))
+        held = np.empty(len(stamps), dtype=np.int64)      # coins held after each bar
+        last_rank = None
+
+        with self._installed(quiet):
+            for k, ts in enumerate(stamps.tolist()):
+                bars = {}
+                for symbol, i in cursor.items():
+                    if i < len(times[symbol]) and times[symbol][i] == ts:
+                        bars[symbol] = self.candles[symbol][i]
+                        cursor[symbol] = i + 1
+                now = ts + self.step_ms
+                self.sim.advance(now, bars)
+                buffers = candle_buffer.get_buffers()
+                for symbol, bar in bars.items():
+                    buffers.on_candle(symbol, bar)
+
+                monitor_portfolio()
+                check_pending_orders()
+                if last_rank is None or now - last_rank >= RANK_EVERY_MS:
+                    self.sync_portfolio()
+                    self.rank()
+                    buyer()
+                    last_rank = now
+                equity[k] = self.sim.equity()
+                held[k] = sum(qty > 0 for coin, qty in self.sim.balance.items() if coin != QUOTE)
+
+        index = pd.to_datetime(stamps + self.step_ms, unit="ms", utc=True)
+        fills = pd.DataFrame(self.sim.fills, columns=["time", "order_id", "symbol", "side",
+                                                      "qty", "price", "fee"])
+        fills["time"] = pd.to_datetime(fills["time"], unit="ms", utc=True)
+        return BacktestResult(pd.Series(equity, index=index, name="equity"), fills,
+                              time.perf_counter() - t0, len(self.candles), prepared,
+                              pd.Series(held, index=index, name="positions"))
+
+    @contextmanager
+    def _installed(self, quiet: bool):
+        """Swap the bot's exchange, prices, clock and state root for the simulation."""
+        tmp = None if self.workspace else tempfile.TemporaryDirectory(prefix="backtest_",
+                                                                      dir=SCRATCH_DIR)
+        root = Path(self.workspace or tmp.name)
+        saved = (utilities.BASE, logging.root.manager.disable, buyer_mod.console)
+        snapshot = prices.PriceSnapshot(exchange=lambda: self.sim,
+                                        clock=lambda: self.sim.now / 1000)
+        try:
+            utilities.BASE = root
+            for path, empty in STATE_FILES.items():
+                utilities.save_json(empty, path)
+            exchange.set_exchange(self.sim)
+            prices.set_snapshot(snapshot)
+            utilities.set_clock(lambda: to_datetime(self.sim.now))
+            candle_buffer.set_buffers(candle_buffer.CandleBuffers(base=None))   # seed from the sim
+            stop_engine.set_engine(stop_engine.StopEngine(workers=None,       # sells inline
+                                                          clock=lambda: self.sim.now / 1000))
+            order_submit.set_submitter(order_submit.OrderSubmitter(workers=None))  # ids in rank order
+            if quiet:
+                logging.disable(logging.WARNING)
+                buyer_mod.console = Console(quiet=True)
+                buyer_mod.console.log = lambda *a, **k: None      # skip rendering too
+            yield root
+        finally:
+            utilities.BASE, disabled, buyer_mod.console = saved
+            logging.disable(disabled)
+            exchange.set_exchange(None)
+            prices.set_snapshot(None)
+            utilities.set_clock(None)
+            candle_buffer.set_buffers(None)
+            stop_engine.set_engine(None)
+            order_submit.set_submitter(None)
+            state_store.close_store(root)
+            if tmp is not None:
+                tmp.cleanup()
+
+
+# ───────────────────────────── Driver ────────────────────────────────────────
+def load_candles(symbols=None, base: str = HIST_DIR, fine_tf: str = FINE_TF) -> dict[str, np.ndarray]:
+    """{symbol: fine records} for `symbols`, or every store under `base`."""
+    if symbols is None:
+        symbols = [d.replace("_", "/").upper() for d in sorted(os.listdir(base))
+                   if os.path.isdir(os.path.join(base, d))] if os.path.isdir(base) else []
+    out = {}
+    for symbol in symbols:
+        recs = candle_store.read(candle_store.store_path(symbol, fine_tf, base))
+        if len(recs):
+            out[symbol] = np.array(recs)                 # off the mmap
+        else:
+            logger.warning("%s: no %s candles under %s", symbol, fine_tf, base)
+    return out
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Replay the bot over the stored candle history")
+    ap.add_argument("--symbols", nargs="+", help="default: every store under --base")
+    ap.add_argument("--start", help="ISO date; default: SPAN bars into the history")
+    ap.add_argument("--days", type=float, help="length of the replay; default: to the end")
+    ap.add_argument("--cash", type=float, default=START_CASH)
+    ap.add_argument("--fee", type=float, default=FEE)
+    ap.add_argument("--base", default=HIST_DIR)
+    ap.add_argument("--out", default=OUTPUT_DIR)
+    return ap.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    candles = load_candles(args.symbols, args.base)
+    start = (int(pd.Timestamp(args.start, tz="UTC").timestamp() * 1000)
+             if args.start else None)
+    bt = Backtest(candles, start=start, cash=args.cash, fee=args.fee)
+    if args.days:
+        bt.end = bt.start + int(args.days * 86_400_000)
+    result = bt.run()
+    result.save(args.out)
+    for key, value in result.summary().items():
+        print(f"{key:<18} {value:,.4f}" if isinstance(value, float) else f"{key:<18} {value}")
+    print(f"equity, fills and trades -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 """
 buyer.py  -  Scans ranked_coins.json and places limit-buy orders
 ---------------------------------------------------------------
+• Candidates that pass the checks are submitted together
+  (scripts/order_submit.py).  Their USD is reserved up front and the
+  failed orders are refunded afterwards, so a refund can fund the next
+  candidates in another batch.
 • Full event history (INFO+) is written to log.txt
 • Terminal shows only a start / end notice through Rich
 """
@@ -8,15 +12,16 @@ buyer.py  -  Scans ranked_coins.json and places limit-buy orders
 from __future__ import annotations
 
 import os, logging
-from datetime import datetime, timezone
-from typing import Dict, Any
+from itertools import islice
+from typing import Dict, Any, Iterator
 
-import ccxt                           # type: ignore
 from dotenv import load_dotenv        # type: ignore
 from rich.console import Console      # type: ignore
 from rich.logging import RichHandler  # type: ignore
 
-from scripts.utilities import load_json, save_json
+from scripts.utilities import load_json, save_json, utc_now
+from scripts.order_submit import OrderRequest, get_submitter
+from scripts.order_sync import reconcile_orders
 
 # ───────────────────────────── Config ────────────────────────────────────────
 load_dotenv()
@@ -39,60 +44,35 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# ───────────────────────────── Kraken connection ────────────────────────────
-kraken = ccxt.kraken({
-    "apiKey":  os.getenv("KRAKEN_API_KEY"),
-    "secret":  os.getenv("KRAKEN_API_SECRET"),
-    "enableRateLimit": True,
-})
-
-
 # sync open orders
 def sync_open_orders() -> None:
-    """Ensure pending_orders.json includes all live Kraken orders."""
-    try:
-        open_orders = kraken.fetch_open_orders()
-        existing = load_json("data/pending_orders.json")
-        if not isinstance(existing, list):
-            existing = []
-
-        known_ids = {o["order_id"] for o in existing if "order_id" in o}
-        new_pending = list(existing)  # shallow copy
-
-        for order in open_orders:
-            oid = order.get("id")
-            symbol = order.get("symbol", "")
-            timestamp = order.get("timestamp")
-
-            if oid in known_ids or not oid:
-                continue
-
-            # Safely parse timestamp
-            try:
-                ts = datetime.utcfromtimestamp(timestamp / 1000) if timestamp else datetime.utcnow()
-                placed_at = ts.replace(tzinfo=timezone.utc).isoformat()
-
-            except Exception as e:
-                logger.warning("Invalid timestamp on order %s: %s", oid, e)
-                placed_at = datetime.utcnow().replace(tzinfo=timezone.utc).isoformat()
-
-            logger.info("Re-synced open order %s (%s)", oid, symbol)
-
-            new_pending.append({
-                "order_id": oid,
-                "symbol": symbol,
-                "price": order.get("price"),
-                "qty": order.get("amount"),
-                "placed_at": placed_at,
-            })
+    """Ensure pending_orders.json includes all live Kraken orders (and drops resolved ones)."""
+    reconcile_orders()
 
-        save_json(new_pending, "data/pending_orders.json")
 
-    except Exception as e:
-        logger.error("sync_open_orders failed: %s", e)
+def _candidates(ranked_coins: Dict[str, Any], positions: Dict[str, Any],
+                pending_symbols: set, max_alloc: float) -> Iterator[OrderRequest]:
+    """Limit buys for the coins that pass the checks, best score first."""
+    for symbol, data in sorted(ranked_coins.items(),
+                               key=lambda x: x[1].get("score", 0),
+                               reverse=True):
 
+        score = data.get("score", 0.0)
+        price = data.get("price", 0.0)
 
+        if score < MIN_SCORE_THRESHOLD:
+            continue
+        if symbol in positions:             # ← NEW check
+            logger.info("Skip %s - position already open", symbol)
+            continue
+        if symbol in pending_symbols:
+            logger.info("Skip %s - order already pending", symbol)
+            continue
+        if price <= 0:
+            logger.warning("Skip %s - invalid price %.6f", symbol, price)
+            continue
 
+        yield OrderRequest(symbol, round(max_alloc / price, 6), price)
 
 
 # ───────────────────────────── Core function ────────────────────────────────
@@ -104,9 +84,13 @@ def buyer() -> None:
 
     portfolio: Dict[str, float]  = load_json("data/portfolio.json")
     ranked_coins: Dict[str, Any] = load_json("data/ranked_coins.json")
-    pending_orders: Dict[str, Any] = load_json("data/pending_orders.json")
+    pending_orders: list           = load_json("data/pending_orders.json")
     positions: Dict[str, Any]      = load_json("data/positions.json")   # ← NEW
 
+    if not isinstance(pending_orders, list):    # same list sync_open_orders writes
+        pending_orders = []
+    pending_symbols = {o.get("symbol") for o in pending_orders}
+
     total_value    = sum(portfolio.values())
     available_usd  = portfolio.get("USD", 0.0)
     max_alloc      = total_value * BUY_PORTFOLIO_PERCENT
@@ -114,54 +98,34 @@ def buyer() -> None:
     logger.info("Portfolio %.2f USD (cash %.2f USD) - max allocation per coin %.2f USD",
                 total_value, available_usd, max_alloc)
 
-    # iterate coins ordered by score descending
-    for symbol, data in sorted(ranked_coins.items(),
-                               key=lambda x: x[1].get("score", 0),
-                               reverse=True):
-
-        score = data.get("score", 0.0)
-        price = data.get("price", 0.0)
-
-        if score < MIN_SCORE_THRESHOLD:
-            continue
-        if symbol in positions:             # ← NEW check
-            logger.info("Skip %s - position already open", symbol)
-            continue
-        if symbol in pending_orders:
-            logger.info("Skip %s - order already pending", symbol)
-            continue
-        if price <= 0:
-            logger.warning("Skip %s - invalid price %.6f", symbol, price)
-            continue
-        if available_usd < max_alloc:
-            logger.info("Skip %s - insufficient USD (%.2f left)", symbol, available_usd)
+    # coins ordered by score descending, as many per batch as the cash covers
+    candidates = _candidates(ranked_coins, positions, pending_symbols, max_alloc)
+    while max_alloc > 0:
+        batch = list(islice(candidates, int(available_usd // max_alloc)))
+        if not batch:
             break
-
-        amount = round(max_alloc / price, 6)
-        logger.info("Placing limit buy: %s %.6f @ %.5f USD", symbol, amount, price)
-
-        try:
-            order = kraken.create_limit_buy_order(symbol, amount, price)
-            if isinstance(order, dict):
-                order_id = order.get("id") or order.get("orderId")
-            elif isinstance(order, list) and len(order) > 0:
-                # Maybe Kraken returned [ order_id, … ]?
-                order_id = order[0]
-            else:
-                raise ValueError(f"Unexpected order format: {order}")
-
-            logger.info("Order placed - id %s", order_id)
-
-            pending_orders[symbol] = {
-                "order_id":  order_id,
-                "symbol":    symbol,
-                "price":     price,
-                "timestamp": datetime.utcnow().isoformat(),
-            }
-            available_usd -= max_alloc
-
-        except Exception as exc:
-            logger.error("Error placing order for %s: %s", symbol, exc)
+        available_usd -= max_alloc * len(batch)            # reserve, refund failures below
+        for req in batch:
+            logger.info("Placing limit buy: %s %.6f @ %.5f USD", req.symbol, req.amount, req.price)
+        placed_at = utc_now().isoformat()
+        for res in get_submitter().submit(batch):
+            req = res.request
+            if not res.ok:
+                logger.error("Error placing order for %s: %s", req.symbol, res.error)
+                available_usd += max_alloc
+                continue
+            logger.info("Order placed - %s id %s", req.symbol, res.order_id)
+            pending_orders.append({
+                "order_id":  res.order_id,
+                "symbol":    req.symbol,
+                "price":     req.price,
+                "qty":       req.amount,
+                "placed_at": placed_at,
+            })
+            pending_symbols.add(req.symbol)
+    unfunded = next(candidates, None)
+    if unfunded is not None:
+        logger.info("Skip %s - insufficient USD (%.2f left)", unfunded.symbol, available_usd)
 
     save_json(pending_orders, "data/pending_orders.json")
     console.log("[green]Buyer finished")
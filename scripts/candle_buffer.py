@@ -0,0 +1,192 @@
+"""
+candle_buffer.py  -  Rolling candles and momentum for open positions
+--------------------------------------------------------------------
+• One CandleBuffer per held symbol keeps the last `window` closed
+  TIMEFRAME candles plus the forming one, and a MomentumState over the
+  closed closes.
+• It is seeded once: SEED_BARS closed bars are read from the local store,
+  and one REST fetch_ohlcv covers whatever the store is missing up to now
+  (only the newest `bars` when the store is further behind than that).
+  After that, each price tick (stream listener or monitor loop) or finer
+  candle only updates the forming bar.  When a bucket rolls over, the
+  previous bar closes into the ring and the state.
+• score() is the momentum of the closes with the forming bar last, as
+  indicators.latest_score gives for the same closes.  MACD is scaled by
+  the std of the last `window` closes.  The EWMs keep their full history
+  rather than restarting `window` bars back.
+• Cost per position per loop is O(1): no OHLCV request and no DataFrame.
+  CandleBuffers is the thread-safe pool (get_buffers / set_buffers).
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+from scripts import candle_store, indicators
+from scripts.exchange import get_exchange
+from scripts.indicators import MomentumState
+from scripts.resample import period_ms
+from scripts.utilities import utc_now
+
+logger = logging.getLogger(__name__)
+
+# ───────────────────────────── Config ────────────────────────────────────────
+TIMEFRAME = "30m"          # monitor_portfolio.TIMEFRAME
+WINDOW    = 60             # monitor_portfolio.MOM_WINDOW
+SEED_BARS = 240            # closed bars replayed into the state (EWM warm-up)
+
+
+def load_history(symbol: str, timeframe: str = TIMEFRAME, bars: int = SEED_BARS,
+                 base: str | None = candle_store.BASE_OUTPUT_DIR,
+                 now_ms: int | None = None) -> np.ndarray:
+    """
+    Last `bars` closed candles of `symbol` as of `now_ms`: the local store
+    first (skipped when `base` is None), then REST for the rest.
+    """
+    now_ms = int(utc_now().timestamp() * 1000) if now_ms is None else now_ms
+    period = period_ms(timeframe)
+    recs = np.empty(0, dtype=candle_store.record_dtype())
+    if base is not None:
+        path = candle_store.store_path(symbol, timeframe, base)
+        if candle_store.exists(path):
+            recs = candle_store.read(path, tail=bars + 2)
+            recs = recs[recs["timestamp"] + period <= now_ms].astype(candle_store.record_dtype())
+
+    if not len(recs) or recs["timestamp"][-1] + 2 * period <= now_ms:
+        since = now_ms - (bars + 1) * period         # fetch_ohlcv pages forward from `since`
+        if len(recs) and recs["timestamp"][-1] + period > since:
+            since = int(recs["timestamp"][-1]) + period
+        else:
+            recs = recs[:0]                           # too stale to bridge: newest bars only
+        rows = get_exchange().fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=bars + 1)
+        fresh = np.array([tuple(r[:6]) for r in rows], dtype=candle_store.record_dtype())
+        if len(fresh):
+            fresh = fresh[fresh["timestamp"] + period <= now_ms]
+            fresh = fresh[fresh["timestamp"] > (recs["timestamp"][-1] if len(recs) else -1)]
+            recs = np.concatenate([recs, fresh])
+    return recs[-bars:]
+
+
+class CandleBuffer:
+    """Closed-candle ring, forming candle and momentum state of one symbol."""
+
+    def __init__(self, timeframe: str = TIMEFRAME, window: int = WINDOW):
+        self.period  = period_ms(timeframe)
+        self.bars: deque = deque(maxlen=window)          # closed (ts, o, h, l, c, v)
+        self.forming: list | None = None
+        self.state   = MomentumState()
+        self.raw     = (np.nan,) * 4                      # indicators of the last closed bar
+
+    def seed(self, recs: np.ndarray) -> "CandleBuffer":
+        """Load closed candles (candle_store records, oldest first)."""
+        if len(recs):
+            self.raw = tuple(self.state.update_many(recs["close"])[-1])
+            self.bars.extend(tuple(r) for r in recs[-self.bars.maxlen:].tolist())
+        return self
+
+    def update(self, ts_ms: int, open_: float, high: float, low: float, close: float,
+               volume: float = 0.0) -> None:
+        """Fold a tick (o = h = l = c) or a finer candle into the forming bar."""
+        bucket = ts_ms - ts_ms % self.period
+        bar = self.forming
+        if bar is None or bucket > bar[0]:
+            if bar is not None:
+                self._close(bar)
+            elif self.bars and bucket <= self.bars[-1][0]:
+                return                                    # already closed
+            self.forming = [bucket, open_, high, low, close, volume]
+        elif bucket == bar[0]:
+            bar[2], bar[3], bar[4] = max(bar[2], high), min(bar[3], low), close
+            bar[5] += volume
+
+    def tick(self, price: float, ts_ms: int) -> None:
+        self.update(ts_ms, price, price, price, price)
+
+    def closes(self) -> np.ndarray:
+        """Closes in the ring, the forming bar's last."""
+        closes = [b[4] for b in self.bars]
+        if self.forming is not None:
+            closes.append(self.forming[4])
+        return np.array(closes[-self.bars.maxlen:], dtype=np.float64)
+
+    def score(self, min_rows: int = indicators.MIN_ROWS) -> float:
+        """Momentum score in [-1, 1] with the forming bar last; 0.0 below `min_rows` bars."""
+        closes = self.closes()
+        if closes.size < min_rows:
+            return 0.0
+        raw = self.raw if self.forming is None else self.state.copy().update(self.forming[4])
+        return float(indicators.momentum_score(np.array([raw]), closes[-1:],
+                                               np.std(closes, ddof=1))[0])
+
+    def _close(self, bar: list) -> None:
+        self.bars.append(tuple(bar))
+        self.raw = self.state.update(bar[4])
+
+
+class CandleBuffers:
+    """Per-symbol CandleBuffer pool, seeded on first use."""
+
+    def __init__(self, timeframe: str = TIMEFRAME, window: int = WINDOW,
+                 base: str | None = candle_store.BASE_OUTPUT_DIR):
+        self.timeframe = timeframe
+        self.window    = window
+        self.base      = base
+        self._lock     = threading.Lock()
+        self._buffers: dict[str, CandleBuffer] = {}
+
+    def get(self, symbol: str) -> CandleBuffer:
+        with self._lock:
+            buf = self._buffers.get(symbol)
+        if buf is None:
+            recs = load_history(symbol, self.timeframe, max(SEED_BARS, self.window), self.base)
+            buf = CandleBuffer(self.timeframe, self.window).seed(recs)
+            with self._lock:
+                buf = self._buffers.setdefault(symbol, buf)
+        return buf
+
+    def score(self, symbol: str, price: float | None = None) -> float:
+        """Momentum of `symbol`, after folding in `price` at the current time."""
+        buf = self.get(symbol)
+        with self._lock:
+            if price is not None:
+                buf.tick(price, int(utc_now().timestamp() * 1000))
+            return buf.score()
+
+    def on_price(self, symbol: str, price: float, received_at: float) -> None:
+        """MarketBus listener: ticks for symbols that have a buffer."""
+        with self._lock:
+            buf = self._buffers.get(symbol)
+            if buf is not None:
+                buf.tick(price, int(received_at * 1000))
+
+    def on_candle(self, symbol: str, bar) -> None:
+        """A closed finer candle (candle_store record) for a symbol with a buffer."""
+        with self._lock:
+            buf = self._buffers.get(symbol)
+            if buf is not None:
+                buf.update(int(bar["timestamp"]), float(bar["open"]), float(bar["high"]),
+                           float(bar["low"]), float(bar["close"]), float(bar["volume"]))
+
+    def retain(self, symbols) -> None:
+        """Drop the buffers of symbols no longer held."""
+        keep = set(symbols)
+        with self._lock:
+            for symbol in [s for s in self._buffers if s not in keep]:
+                del self._buffers[symbol]
+
+
+_buffers = CandleBuffers()
+
+
+def get_buffers() -> CandleBuffers:
+    return _buffers
+
+
+def set_buffers(buffers: CandleBuffers | None) -> None:
+    """Install a pool (backtests); None restores a fresh default one."""
+    global _buffers
+    _buffers = buffers if buffers is not None else CandleBuffers()
@@ -0,0 +1,281 @@
+"""
+candle_store.py  -  Binary, append-only OHLCV store opened through mmap
+-----------------------------------------------------------------------
+• One file per symbol/timeframe:  data/historical/<sym>/<tf>.ohlcv
+• 32-byte header followed by fixed-width little-endian records
+  (int64 ms timestamp + open/high/low/close/volume as float32 or float64).
+• Appends write only the new rows; readers get zero-copy NumPy views
+  (`read(path)["close"]` is a strided view into the mapped file).
+• `python -m scripts.candle_store migrate` converts the old <tf>.csv tree.
+"""
+
+from __future__ import annotations
+
+import os
+import struct
+import logging
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+# ───────────────────────────── Format ────────────────────────────────────────
+MAGIC        = b"NPTOHLCV"
+VERSION      = 1
+HEADER       = struct.Struct("<8sHH20x")          # magic, version, float width
+HEADER_SIZE  = HEADER.size                         # 32 bytes
+EXTENSION    = ".ohlcv"
+COLUMNS      = ["open", "high", "low", "close", "volume"]
+
+BASE_OUTPUT_DIR = "data/historical"
+
+
+def record_dtype(float_size: int = 8) -> np.dtype:
+    """Structured dtype of one candle record (float_size 4 → float32, 8 → float64)."""
+    if float_size not in (4, 8):
+        raise ValueError(f"unsupported float width {float_size}")
+    fmt = f"<f{float_size}"
+    return np.dtype([("timestamp", "<i8")] + [(c, fmt) for c in COLUMNS])
+
+
+def store_path(symbol: str, tf: str, base: str | os.PathLike = BASE_OUTPUT_DIR) -> str:
+    """data/historical/btc_usd/15m.ohlcv for ("BTC/USD", "15m")."""
+    sym_id = symbol.replace("/", "_").lower()
+    return os.path.join(base, sym_id, f"{tf}{EXTENSION}")
+
+
+# ───────────────────────────── Header helpers ────────────────────────────────
+def _read_header(path: str) -> np.dtype:
+    with open(path, "rb") as f:
+        raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE:
+        raise ValueError(f"{path}: truncated header")
+    magic, version, float_size = HEADER.unpack(raw)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: not a candle store (magic={magic!r}, v={version})")
+    return record_dtype(float_size)
+
+
+def _n_rows(path: str, dtype: np.dtype) -> int:
+    """Complete records on disk; a torn trailing record is ignored."""
+    return (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+
+
+def exists(path: str) -> bool:
+    return os.path.exists(path) and os.path.getsize(path) >= HEADER_SIZE
+
+
+def create(path: str, float_size: int = 8) -> None:
+    """Create an empty store (no-op if one already exists)."""
+    if exists(path):
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, float_size))
+
+
+# ───────────────────────────── Readers ───────────────────────────────────────
+def read(path: str, tail: int | None = None) -> np.ndarray:
+    """
+    Return the records as a read-only structured array backed by mmap.
+    Column access (`arr["close"]`, `arr["timestamp"]`) never copies.
+    Missing or empty stores give an empty array.
+    """
+    if not exists(path):
+        return np.empty(0, dtype=record_dtype())
+    dtype = _read_header(path)
+    n = _n_rows(path, dtype)
+    if n == 0:
+        return np.empty(0, dtype=dtype)
+    start = 0 if tail is None else max(0, n - tail)
+    return np.memmap(path, dtype=dtype, mode="r",
+                     offset=HEADER_SIZE + start * dtype.itemsize,
+                     shape=(n - start,))
+
+
+def last_timestamp(path: str) -> int | None:
+    """Timestamp (ms) of the newest record, or None for an empty store."""
+    arr = read(path, tail=1)
+    return int(arr["timestamp"][0]) if len(arr) else None
+
+
+def row_count(path: str) -> int:
+    if not exists(path):
+        return 0
+    return _n_rows(path, _read_header(path))
+
+
+def to_frame(arr: np.ndarray, columns: list[str] | None = None) -> pd.DataFrame:
+    """DataFrame with a UTC DatetimeIndex named 'timestamp' (copies the data)."""
+    columns = columns or COLUMNS
+    index = pd.DatetimeIndex(pd.to_datetime(np.asarray(arr["timestamp"]), unit="ms", utc=True),
+                             name="timestamp")
+    return pd.DataFrame({c: np.asarray(arr[c]) for c in columns}, index=index)
+
+
+def read_frame(path: str, tail: int | None = None,
+               columns: list[str] | None = None) -> pd.DataFrame:
+    return to_frame(read(path, tail=tail), columns)
+
+
+# ───────────────────────────── Writers ───────────────────────────────────────
+def to_records(df: pd.DataFrame, dtype: np.dtype | None = None) -> np.ndarray:
+    """Convert an OHLCV DataFrame (DatetimeIndex) to sorted, de-duplicated records."""
+    dtype = dtype or record_dtype()
+    out = np.empty(len(df), dtype=dtype)
+    if len(df) == 0:
+        return out
+    idx = pd.DatetimeIndex(df.index)
+    if idx.tz is None:
+        idx = idx.tz_localize("UTC")
+    out["timestamp"] = idx.as_unit("ms").asi8
+    for c in COLUMNS:
+        out[c] = df[c].to_numpy(dtype=np.float64) if c in df else np.nan
+    return _dedupe(out)
+
+
+def _dedupe(recs: np.ndarray) -> np.ndarray:
+    """Sort by timestamp and keep the last record per timestamp."""
+    order = np.argsort(recs["timestamp"], kind="stable")
+    recs = recs[order]
+    ts = recs["timestamp"]
+    keep = np.ones(len(recs), dtype=bool)
+    keep[:-1] = ts[1:] != ts[:-1]
+    return recs[keep]
+
+
+def _as_records(rows, dtype: np.dtype) -> np.ndarray:
+    if isinstance(rows, pd.DataFrame):
+        return to_records(rows, dtype)
+    return _dedupe(np.asarray(rows).astype(dtype, copy=False))
+
+
+def append(path: str, rows, float_size: int = 8) -> int:
+    """
+    Append rows newer than the last stored record, writing only those bytes.
+    A row with the same timestamp as the last record overwrites it in place
+    (Kraken re-sends the still-forming candle).  Older rows are ignored; use
+    `merge` to insert history.  Returns the number of rows written.
+    """
+    create(path, float_size)
+    dtype = _read_header(path)
+    recs = _as_records(rows, dtype)
+    if len(recs) == 0:
+        return 0
+
+    n = _n_rows(path, dtype)
+    last = last_timestamp(path)
+    with open(path, "r+b") as f:
+        f.truncate(HEADER_SIZE + n * dtype.itemsize)    # drop any torn record
+        if last is not None:
+            same = recs[recs["timestamp"] == last]
+            if len(same):
+                f.seek(HEADER_SIZE + (n - 1) * dtype.itemsize)
+                f.write(same[-1:].tobytes())
+            recs = recs[recs["timestamp"] > last]
+        f.seek(0, os.SEEK_END)
+        f.write(recs.tobytes())
+    return len(recs)
+
+
+def write(path: str, rows, float_size: int = 8) -> int:
+    """Atomically replace the whole store with `rows`."""
+    dtype = _read_header(path) if exists(path) else record_dtype(float_size)
+    recs = _as_records(rows, dtype)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, dtype["open"].itemsize))
+        f.write(recs.tobytes())
+    os.replace(tmp, path)
+    return len(recs)
+
+
+def merge(path: str, rows, float_size: int = 8) -> int:
+    """
+    Insert rows anywhere in the series (back-fill, hole repair).
+    Falls back to a plain `append` when every row is newer than the store;
+    otherwise rewrites the file once.  Returns the number of new timestamps.
+    """
+    dtype = _read_header(path) if exists(path) else record_dtype(float_size)
+    recs = _as_records(rows, dtype)
+    if len(recs) == 0:
+        return 0
+    last = last_timestamp(path)
+    if last is None or recs["timestamp"][0] >= last:
+        return append(path, recs, float_size)
+
+    current = np.array(read(path))                      # detach from mmap
+    fresh = ~np.isin(recs["timestamp"], current["timestamp"])
+    combined = _dedupe(np.concatenate([current, recs]))
+    write(path, combined)
+    return int(fresh.sum())
+
+
+def truncate_before(path: str, keep_rows: int) -> int:
+    """Drop all but the newest `keep_rows` records (atomic rewrite)."""
+    n = row_count(path)
+    if n <= keep_rows:
+        return 0
+    write(path, np.array(read(path, tail=keep_rows)))
+    return n - keep_rows
+
+
+# ───────────────────────────── Migration ─────────────────────────────────────
+def migrate_csv(csv_path: str, float_size: int = 8, remove: bool = False) -> int:
+    """Convert one <tf>.csv into <tf>.ohlcv next to it.  Returns rows written."""
+    df = pd.read_csv(csv_path, parse_dates=["timestamp"]).set_index("timestamp")
+    df = df.dropna(subset=["open", "high", "low", "close"])
+    out = os.path.splitext(csv_path)[0] + EXTENSION
+    if exists(out):
+        os.remove(out)
+    create(out, float_size)
+    n = merge(out, df, float_size)
+    if remove:
+        os.remove(csv_path)
+    return n
+
+
+def migrate_csv_tree(base: str = BASE_OUTPUT_DIR, float_size: int = 8,
+                     remove: bool = False) -> int:
+    """Migrate every <sym>/<tf>.csv under `base`.  Returns files converted."""
+    converted = 0
+    for csv_path in sorted(Path(base).glob("*/*.csv")):
+        try:
+            n = migrate_csv(str(csv_path), float_size, remove)
+        except (ValueError, KeyError, pd.errors.EmptyDataError) as e:
+            logger.warning("Skip %s: %s", csv_path, e)
+            continue
+        logger.info("Migrated %s (%d rows)", csv_path, n)
+        print(f"{csv_path} → {csv_path.with_suffix(EXTENSION)} ({n} rows)")
+        converted += 1
+    return converted
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Neptune candle store tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    mig = sub.add_parser("migrate", help="convert <sym>/<tf>.csv files to .ohlcv")
+    mig.add_argument("--base", default=BASE_OUTPUT_DIR)
+    mig.add_argument("--float32", action="store_true", help="store prices as float32")
+    mig.add_argument("--remove-csv", action="store_true", help="delete CSVs after conversion")
+
+    show = sub.add_parser("show", help="print the tail of one store")
+    show.add_argument("path")
+    show.add_argument("-n", type=int, default=10)
+
+    args = parser.parse_args(argv)
+    if args.cmd == "migrate":
+        n = migrate_csv_tree(args.base, 4 if args.float32 else 8, args.remove_csv)
+        print(f"{n} files migrated")
+    elif args.cmd == "show":
+        print(read_frame(args.path, tail=args.n))
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,15 @@ import time
 from datetime import datetime, timedelta, timezone
 
 import json
+import sys
+
+from numba import njit
+
+from scripts import candle_store
+from scripts.exchange import get_exchange
+from scripts.first_passage import band_tree, first_outside
+from scripts.resample import period_ms
+from scripts.quantizer import decayed_histograms, lookup_centroids
 
 
 
@@ -94,33 +103,13 @@ def lloyd_max_quantizer(x, pdf, n_centroids, max_iter=5000, tol=1e-5):
 
 
 def get_centroids(df):
+    """Per-row Lloyd-Max centroids, looked up from the shared (b_left, b_right) table."""
     if df.empty or not all(col in df.columns for col in ["open", "high", "low", "close"]):
         print("⚠️ DataFrame is empty or missing required columns.")
         return []
 
-    hist_combined = np.zeros(n_bins)
-    centroid_array = []
-
-    for frame in range(len(df)):
-        row = df.iloc[frame]
-        base_price = row["open"]
-        prices = np.array([row["open"], row["high"], row["low"], row["close"]])
-        deltas = prices - base_price
-
-        hist_combined *= decay_rate
-        hist_combined += np.histogram(deltas, bins=bins)[0]
-
-        hist = hist_combined.copy()
-        b_left, b_right = fit_asymmetric_laplace_from_histogram(bin_centers, hist, loc=0)
-
-        x = np.linspace(bin_centers[0], bin_centers[-1], 300)
-        y = np.where(x < 0,
-                     0.5 * np.exp(x / b_left) / b_left,
-                     0.5 * np.exp(-x / b_right) / b_right)
-        y *= np.sum(hist) * bin_width
-
-        centroids = lloyd_max_quantizer(x, y, n_centroids)
-        centroid_array.append(centroids)
+    ohlc = df[["open", "high", "low", "close"]].to_numpy(dtype=np.float64)
+    centroid_array = list(lookup_centroids(decayed_histograms(ohlc, decay_rate)))
 
     if len(centroid_array) == 0:
         print("⚠️ No centroids computed.")
@@ -150,40 +139,38 @@ def cluster_centroids(centroid_series, n_clusters=8, random_state=42):
 
 
 
+@njit(cache=True)
+def _first_touch_success(mid_px, boundary):
+    """Per row: does a later mid price reach +boundary before -boundary?"""
+    n = mid_px.size
+    band = band_tree(mid_px)
+    success = np.zeros(n, dtype=np.bool_)
+    for i in range(n):
+        upper = (1 + boundary) * mid_px[i]
+        lower = (1 - boundary) * mid_px[i]
+        j = first_outside(mid_px, band, i + 1, n, lower, upper)
+        success[i] = j >= 0 and mid_px[j] >= upper and not mid_px[j] <= lower
+    return success
+
+
 def find_good_clusters(df):
     # Precompute midprice for each row
     df["mid_price"] = df[["open", "high", "low", "close"]].median(axis=1)
 
-    # Store results
-    cluster_success_counts = {}
-    cluster_total_counts = {}
-
-    # Loop over each row (time step)
-    for i in range(len(df)):
-        cluster = df.iloc[i]["laplace_cluster"]
-        midpoint = df.iloc[i]["mid_price"]
-
-        upper = (1 + BOUNDARY) * midpoint
-        lower = (1 - BOUNDARY) * midpoint
-
-        # Look ahead in time
-        future_prices = df.iloc[i+1:]["mid_price"].values
-
-        hit_upper = np.argmax(future_prices >= upper) if np.any(future_prices >= upper) else None
-        hit_lower = np.argmax(future_prices <= lower) if np.any(future_prices <= lower) else None
-
-        success = False
-        if hit_upper is not None and hit_lower is not None:
-            success = hit_upper < hit_lower  # rises before it falls
-        elif hit_upper is not None:
-            success = True  # only rises
-        else:
-            success = False  # never rises
-
-        # Tally
-        cluster_total_counts[cluster] = cluster_total_counts.get(cluster, 0) + 1
-        if success:
-            cluster_success_counts[cluster] = cluster_success_counts.get(cluster, 0) + 1
+    # First touch of +/-BOUNDARY after every row (rises before it falls)
+    success = _first_touch_success(df["mid_price"].to_numpy(np.float64), BOUNDARY)
+
+    # Tally per cluster, in order of first appearance
+    clusters = df["laplace_cluster"].to_numpy()
+    keys, first, inverse = np.unique(clusters, return_index=True, return_inverse=True)
+    totals    = np.bincount(inverse, minlength=len(keys))
+    successes = np.bincount(inverse, weights=success, minlength=len(keys)).astype(int)
+    cluster_total_counts, cluster_success_counts = {}, {}
+    for k in np.argsort(first, kind="stable"):
+        cluster = clusters[first[k]]
+        cluster_total_counts[cluster] = int(totals[k])
+        if successes[k]:
+            cluster_success_counts[cluster] = int(successes[k])
 
     # Compute success ratios
     success_ratios = {}
@@ -222,11 +209,7 @@ def fetch_kraken_ohlcv(symbol="BTC/USD", timeframe="1h", lookback_days=30, limit
     Returns:
         pd.DataFrame: OHLCV dataframe with timestamp index
     """
-    kraken = ccxt.kraken({
-        'apiKey': os.getenv("KRAKEN_API_KEY"),
-        'secret': os.getenv("KRAKEN_API_SECRET"),
-        'enableRateLimit': True,
-    })
+    kraken = get_exchange()
 
     end_time = datetime.now(timezone.utc)
     start_time = end_time - timedelta(days=lookback_days)
@@ -251,16 +234,51 @@ def fetch_kraken_ohlcv(symbol="BTC/USD", timeframe="1h", lookback_days=30, limit
     return df
 
 
-def ranked(assets):
-    
+def load_local_ohlcv(symbol, timeframe="1h", lookback_days=30, base=candle_store.BASE_OUTPUT_DIR):
+    """The last `lookback_days` of stored candles for symbol (empty if none are stored)."""
+    path = candle_store.store_path(symbol, timeframe, base)
+    if not candle_store.exists(path):
+        return candle_store.to_frame(np.empty(0, dtype=candle_store.record_dtype()))
+    rows = lookback_days * 86_400_000 // period_ms(timeframe)
+    return candle_store.read_frame(path, tail=rows)
+
+
+def local_universe(timeframe="1h", base=candle_store.BASE_OUTPUT_DIR):
+    """{symbol: centroid file} for every symbol with a stored `timeframe` series."""
+    if not os.path.isdir(base):
+        return {}
+    return {
+        name.replace("_", "/").upper(): f"data/centroids/{name}_cluster_centers.json"
+        for name in sorted(os.listdir(base))
+        if candle_store.exists(os.path.join(base, name, f"{timeframe}{candle_store.EXTENSION}"))
+    }
+
+
+def ranked(assets=None, local=True, timeframe="1h", lookback_days=30,
+           base=candle_store.BASE_OUTPUT_DIR, output="data/ranked_coins.json"):
+    """
+    Score `assets` (default: every locally stored symbol) into ranked_coins.json.
+
+    local=True reads the candle history kept under data/historical, so no
+    network calls are made; local=False fetches one page per symbol from
+    Kraken as before.
+    """
     load_dotenv()
+    if assets is None:
+        assets = local_universe(timeframe, base)
     cluster_models = {}
     coin_details = {}  # ⬅️ store full record per coin
 
     for symbol, json_file in assets.items():
 
-        df = fetch_kraken_ohlcv(symbol)
+        if local:
+            df = load_local_ohlcv(symbol, timeframe, lookback_days, base)
+        else:
+            df = fetch_kraken_ohlcv(symbol, timeframe, lookback_days)
         df = df[['open', 'high', 'low', 'close']].dropna()
+        if df.empty:
+            print(f"⚠️ Skipping {symbol}: no candles.")
+            continue
 
         centroids = get_centroids(df)
         if not centroids:
@@ -295,8 +313,9 @@ def ranked(assets):
     sorted_dict = {symbol: details for symbol, details in sorted_items}
 
     # 💾 Save to JSON
-    with open("data/ranked_coins.json", "w") as f:
+    with open(output, "w") as f:
         json.dump(sorted_dict, f, indent=2)
+    return sorted_dict
         
 
 
@@ -326,45 +345,4 @@ if __name__ == "__main__":
         "LTC/USD": "data/centroids/ltc_usd_cluster_centers.json",
     }
 
-    load_dotenv()
-    cluster_models = {}
-    coin_details = {}  # ⬅️ store full record per coin
-
-    for symbol, json_file in assets.items():
-
-        df = fetch_kraken_ohlcv(symbol)
-        df = df[['open', 'high', 'low', 'close']].dropna()
-
-        centroids = get_centroids(df)
-        df["laplace_centroids"] = centroids
-
-        labels, kmeans_model, quantize_centroids = cluster_centroids(df["laplace_centroids"], n_clusters=8)
-        df["laplace_cluster"] = labels
-
-        cluster_models[symbol] = {
-            "model": kmeans_model,
-            "quantizer": quantize_centroids
-        }
-
-        df_clusters, df_summary = find_good_clusters(df)
-
-        current_bin = int(df_clusters["laplace_cluster"].iloc[-1])
-        current_price = float(df_clusters["mid_price"].iloc[-1])
-        coin_score = float(df_summary.loc[df_summary["cluster"] == current_bin, "success_ratio"].values[0])
-
-        coin_details[symbol] = {
-            "score": round(coin_score, 4),
-            "price": round(current_price, 8),
-            "sell_price": round(current_price * (1 - BOUNDARY), 8),
-            "drop_order_price": round(current_price * (1 + BOUNDARY), 8)
-        }
-
-    # 🔃 Sort by score descending
-    sorted_items = sorted(coin_details.items(), key=lambda x: -x[1]["score"])
-    sorted_dict = {symbol: details for symbol, details in sorted_items}
-
-    # 💾 Save to JSON
-    with open("data/ranked_coins.json", "w") as f:
-        json.dump(sorted_dict, f, indent=2)
-
-
+    ranked(assets, local="--live" not in sys.argv)
@@ -0,0 +1,242 @@
+"""
+coverage.py  -  Per-series coverage index and gap-aware fetch planner
+---------------------------------------------------------------------
+• Each <tf>.ohlcv store gets a sidecar <tf>.coverage.json holding the time
+  ranges present in the store and the ranges Kraken has confirmed empty
+  (pre-listing history, exchange outages), all as half-open [start, end) ms.
+• The index is refreshed incrementally after appends and rebuilt only when
+  the store was rewritten.
+• `plan()` returns the minimal (since, limit) requests that cover exactly
+  the missing ranges - tail, head and holes in the middle - within the
+  depth Kraken's OHLC endpoint can serve.
+• `python -m scripts.coverage gaps` prints a gaps report.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from scripts import candle_store
+from scripts.resample import period_ms
+
+logger = logging.getLogger(__name__)
+
+KRAKEN_OHLC_LIMIT = 720        # candles per OHLC response
+KRAKEN_OHLC_DEPTH = 720        # Kraken only serves the newest 720 candles per interval
+INDEX_SUFFIX      = ".coverage.json"
+
+
+# ───────────────────────────── Range helpers ─────────────────────────────────
+def present_ranges(ts: np.ndarray, period: int) -> list[list[int]]:
+    """Runs of consecutive candles in a sorted timestamp array."""
+    if len(ts) == 0:
+        return []
+    ts = np.asarray(ts, dtype=np.int64)
+    breaks = np.flatnonzero(np.diff(ts) != period)
+    starts = ts[np.r_[0, breaks + 1]]
+    ends   = ts[np.r_[breaks, len(ts) - 1]] + period
+    return [[int(a), int(b)] for a, b in zip(starts, ends)]
+
+
+def union(ranges: list[list[int]]) -> list[list[int]]:
+    out: list[list[int]] = []
+    for a, b in sorted(ranges):
+        if out and a <= out[-1][1]:
+            out[-1][1] = max(out[-1][1], b)
+        else:
+            out.append([a, b])
+    return out
+
+
+def subtract(target: list[int], ranges: list[list[int]]) -> list[list[int]]:
+    """Parts of [start, end) not covered by `ranges`."""
+    start, end = target
+    out, cur = [], start
+    for a, b in union(ranges):
+        if b <= cur or a >= end:
+            continue
+        if a > cur:
+            out.append([cur, a])
+        cur = max(cur, b)
+    if cur < end:
+        out.append([cur, end])
+    return out
+
+
+# ───────────────────────────── Index ─────────────────────────────────────────
+def index_path(store: str) -> str:
+    return store[: -len(candle_store.EXTENSION)] + INDEX_SUFFIX
+
+
+def load_index(store: str) -> dict:
+    try:
+        with open(index_path(store), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_index(store: str, idx: dict) -> None:
+    path = index_path(store)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(idx, f)
+    os.replace(tmp, path)
+
+
+def refresh_index(store: str, period: int) -> dict:
+    """Bring the index in line with the store, scanning only appended rows when possible."""
+    idx  = load_index(store)
+    ts   = candle_store.read(store)["timestamp"]
+    n    = len(ts)
+    last = int(ts[-1]) if n else None
+
+    if idx.get("period_ms") == period and idx.get("rows") == n and idx.get("last_ts") == last:
+        return idx
+
+    known = idx.get("rows", 0)
+    if (idx.get("period_ms") == period and 0 < known <= n
+            and int(ts[known - 1]) == idx.get("last_ts")):
+        present = union(idx["present"] + present_ranges(ts[known - 1:], period))
+    else:
+        present = present_ranges(ts, period)
+
+    idx = {
+        "period_ms": period,
+        "rows":      n,
+        "last_ts":   last,
+        "present":   present,
+        "empty":     idx.get("empty", []) if idx.get("period_ms") == period else [],
+    }
+    save_index(store, idx)
+    return idx
+
+
+def mark_empty(store: str, period: int, ranges: list[list[int]]) -> None:
+    """Record ranges Kraken skipped inside a response, so they are not requested again."""
+    if not ranges:
+        return
+    idx = refresh_index(store, period)
+    gaps = [g for r in ranges for g in subtract(r, idx["present"])]
+    idx["empty"] = union(idx["empty"] + gaps)
+    save_index(store, idx)
+
+
+# ───────────────────────────── Planner ───────────────────────────────────────
+def missing_ranges(store: str, tf: str, start_ms: int, end_ms: int) -> list[list[int]]:
+    """Closed-candle ranges of [start_ms, end_ms) neither stored nor known empty."""
+    period = period_ms(tf)
+    idx    = refresh_index(store, period)
+    start  = start_ms - start_ms % period
+    end    = end_ms - end_ms % period                 # the forming candle is not a gap
+    return subtract([start, end], idx["present"] + idx["empty"])
+
+
+def plan(store: str, tf: str, start_ms: int, end_ms: int,
+         limit: int = KRAKEN_OHLC_LIMIT, now_ms: int | None = None) -> list[tuple[int, int]]:
+    """
+    Minimal (since, limit) requests that fill the missing part of
+    [start_ms, end_ms).  A tail request also re-reads the last stored candle,
+    which may have been saved while still forming.
+    """
+    period = period_ms(tf)
+    now_ms = now_ms or int(time.time() * 1000)
+    depth  = now_ms - now_ms % period - (KRAKEN_OHLC_DEPTH - 1) * period
+    last   = candle_store.last_timestamp(store)
+
+    requests = []
+    for a, b in missing_ranges(store, tf, start_ms, end_ms):
+        a = max(a, depth)
+        if a >= b:
+            continue
+        if last is not None and a == last + period:
+            a = last
+        if b >= end_ms - end_ms % period:
+            b += period                                 # take the forming candle too
+        n = (b - a) // period
+        for k in range(0, n, limit):
+            requests.append((a + k * period, min(limit, n - k)))
+    return requests
+
+
+def fill(symbol: str, tf: str, start_ms: int, end_ms: int, kraken,
+         base: str = candle_store.BASE_OUTPUT_DIR) -> int:
+    """Execute the plan for one series.  Returns the number of new candles stored."""
+    period = period_ms(tf)
+    store  = candle_store.store_path(symbol, tf, base)
+    candle_store.create(store)
+    added  = 0
+
+    for since, limit in plan(store, tf, start_ms, end_ms):
+        try:
+            ohlcv = kraken.fetch_ohlcv(symbol, timeframe=tf, since=since, limit=limit)
+        except Exception as e:
+            logger.info("Error fetching %s [%s] since %d: %s", symbol, tf, since, e)
+            break
+
+        window = [since, since + limit * period]
+        rows = np.array([tuple(r[:6]) for r in ohlcv or [] if window[0] <= r[0] < window[1]],
+                        dtype=candle_store.record_dtype())
+        if not len(rows):
+            continue                      # no proof of emptiness (maybe just lagging)
+        added += candle_store.merge(store, rows)
+
+        # holes before the newest returned candle are real: remember them
+        seen = [window[0], int(rows["timestamp"][-1])]
+        mark_empty(store, period, subtract(seen, present_ranges(rows["timestamp"], period)))
+
+    if added:
+        logger.info("%s [%s] filled %d candles", symbol, tf, added)
+    return added
+
+
+# ───────────────────────────── Report ────────────────────────────────────────
+def gaps_report(base: str = candle_store.BASE_OUTPUT_DIR, symbol: str | None = None,
+                tf: str | None = None, max_rows: int = 5) -> str:
+    lines = []
+    pattern = f"{symbol.replace('/', '_').lower() if symbol else '*'}/{tf or '*'}{candle_store.EXTENSION}"
+    for store in sorted(Path(base).glob(pattern)):
+        series_tf = store.stem
+        period = period_ms(series_tf)
+        idx = refresh_index(str(store), period)
+        if not idx["present"]:
+            lines.append(f"{store.parent.name:<10} {series_tf:>4}  empty")
+            continue
+        first, last_end = idx["present"][0][0], idx["present"][-1][1]
+        holes = subtract([first, last_end], idx["present"])
+        open_holes = subtract([first, last_end], idx["present"] + idx["empty"])
+        missing = sum((b - a) // period for a, b in open_holes)
+        lines.append(f"{store.parent.name:<10} {series_tf:>4}  rows={idx['rows']:<6} "
+                     f"holes={len(holes):<3} unfilled={len(open_holes):<3} "
+                     f"missing_candles={missing}")
+        for a, b in open_holes[:max_rows]:
+            lines.append(f"    {_fmt(a)} → {_fmt(b)}  ({(b - a) // period} candles)")
+    return "\n".join(lines)
+
+
+def _fmt(ms: int) -> str:
+    return time.strftime("%Y-%m-%d %H:%M", time.gmtime(ms / 1000))
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Neptune candle coverage tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    gaps = sub.add_parser("gaps", help="report missing ranges per symbol/timeframe")
+    gaps.add_argument("--base", default=candle_store.BASE_OUTPUT_DIR)
+    gaps.add_argument("--symbol")
+    gaps.add_argument("--tf")
+    args = parser.parse_args(argv)
+    if args.cmd == "gaps":
+        print(gaps_report(args.base, args.symbol, args.tf) or "no candle stores found")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+exchange.py  -  Process-wide Kraken gateway
+-------------------------------------------
+• `get_exchange()` returns one shared, pre-warmed ccxt client for the whole
+  bot (main loop, monitor thread, scripts).  Tests and simulations can swap
+  it with `set_exchange()`.
+• `load_markets()` is served from an on-disk cache (MARKETS_TTL), so a
+  restart costs no AssetPairs/Assets requests.
+• Private calls get strictly increasing nonces and are serialized under one
+  lock, so two threads can never race a nonce to Kraken.  Set
+  KRAKEN_NONCE_WINDOW (seconds, as configured on the API key) to let
+  private calls overlap; the nonces stay ordered.
+• All REST calls are paced by token buckets (public + private) that use
+  ccxt's per-endpoint cost table, replacing ccxt's per-instance throttle.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any
+
+import ccxt                           # type: ignore
+from dotenv import load_dotenv        # type: ignore
+
+from scripts.fetch_engine import TokenBucket, public_bucket
+
+# ───────────────────────────── Config ────────────────────────────────────────
+load_dotenv()
+
+MARKETS_CACHE        = "data/cache/kraken_markets.json"
+MARKETS_TTL          = 6 * 3600        # seconds before markets are refetched
+KRAKEN_PRIVATE_RATE  = 1.0             # ccxt cost units (≈ seconds) per second
+KRAKEN_PRIVATE_BURST = 45              # 15-point Kraken counter × 3 cost units
+NONCE_WINDOW         = float(os.getenv("KRAKEN_NONCE_WINDOW", "0") or 0)
+
+logger = logging.getLogger(__name__)
+
+
+# ───────────────────────────── Client ────────────────────────────────────────
+class KrakenGateway(ccxt.kraken):
+    """ccxt.kraken with ordered nonces, serialized private calls and shared pacing."""
+
+    def __init__(self, config: dict | None = None):
+        super().__init__(config or {})
+        self._nonce_lock     = threading.Lock()
+        self._private_lock   = threading.RLock()
+        self._last_nonce     = 0
+        self._private_bucket = TokenBucket(KRAKEN_PRIVATE_RATE, KRAKEN_PRIVATE_BURST)
+
+    def nonce(self):
+        with self._nonce_lock:
+            self._last_nonce = max(super().nonce(), self._last_nonce + 1)
+            return self._last_nonce
+
+    def request(self, path, api: Any = "public", method="GET", params={},
+                headers: Any = None, body: Any = None, config={}):
+        cost = self.calculate_rate_limiter_cost(api, method, path, params, config) or 0
+        if api != "private":
+            if cost:
+                public_bucket().acquire(cost)
+            return super().request(path, api, method, params, headers, body, config)
+
+        if cost:
+            self._private_bucket.acquire(cost)
+        if NONCE_WINDOW > 0:
+            return super().request(path, api, method, params, headers, body, config)
+        with self._private_lock:
+            return super().request(path, api, method, params, headers, body, config)
+
+
+def _markets_from_cache(kraken: ccxt.kraken, path: str, ttl: float) -> bool:
+    try:
+        if time.time() - os.path.getmtime(path) > ttl:
+            return False
+        with open(path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        kraken.set_markets(cached["markets"], cached.get("currencies"))
+        return True
+    except (OSError, ValueError, KeyError) as e:
+        logger.info("Markets cache unusable (%s) - refetching", e)
+        return False
+
+
+def warm_markets(kraken: ccxt.kraken, path: str = MARKETS_CACHE,
+                 ttl: float = MARKETS_TTL) -> None:
+    """Load markets from the disk cache, or fetch and refresh the cache."""
+    if _markets_from_cache(kraken, path, ttl):
+        return
+    kraken.load_markets(reload=True)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"markets": kraken.markets, "currencies": kraken.currencies}, f)
+    os.replace(tmp, path)
+    logger.info("Markets cache refreshed (%d markets)", len(kraken.markets))
+
+
+def make_exchange() -> KrakenGateway:
+    return KrakenGateway({
+        "apiKey"         : os.getenv("KRAKEN_API_KEY"),
+        "secret"         : os.getenv("KRAKEN_API_SECRET"),
+        "enableRateLimit": False,          # pacing is done by the token buckets
+        # Use the stable /0/private/Balance endpoint rather than BalanceEx
+        "options"        : {"fetchBalanceMethod": "privatePostBalance"},
+        # Increase time-out for slow responses (ms)
+        "timeout"        : 20_000,
+    })
+
+
+_exchange: ccxt.Exchange | None = None
+_exchange_lock = threading.Lock()
+
+
+def get_exchange() -> ccxt.Exchange:
+    """The process-wide client (created and market-warmed on first use)."""
+    global _exchange
+    if _exchange is None:
+        with _exchange_lock:
+            if _exchange is None:
+                kraken = make_exchange()
+                try:
+                    warm_markets(kraken)
+                except Exception as e:           # markets load lazily on first call
+                    logger.warning("Could not pre-load markets: %s", e)
+                _exchange = kraken
+    return _exchange
+
+
+def set_exchange(exchange: ccxt.Exchange | None) -> None:
+    """Inject a client (simulator, test double); None resets to the default."""
+    global _exchange
+    with _exchange_lock:
+        _exchange = exchange
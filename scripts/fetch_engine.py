@@ -0,0 +1,112 @@
+"""
+fetch_engine.py  -  Concurrent, rate-limit-aware OHLCV fetching
+---------------------------------------------------------------
+• A bounded thread pool keeps many symbol/timeframe jobs in flight.
+• Every REST call first takes a token from one shared TokenBucket sized to
+  Kraken's public limits, so concurrency never exceeds the allowance and no
+  job needs fixed sleeps.
+• Progress is reported per symbol (once all of its timeframes are done).
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+# ───────────────────────────── Config ────────────────────────────────────────
+KRAKEN_PUBLIC_RATE  = 1.0     # sustained public REST calls per second
+KRAKEN_PUBLIC_BURST = 5       # calls allowed back-to-back after an idle spell
+FETCH_WORKERS       = 8       # symbol/timeframe jobs in flight
+
+
+# ───────────────────────────── Token bucket ──────────────────────────────────
+class TokenBucket:
+    """Thread-safe token bucket: `acquire()` blocks until a token is available."""
+
+    def __init__(self, rate: float = KRAKEN_PUBLIC_RATE,
+                 capacity: float = KRAKEN_PUBLIC_BURST,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate     = float(rate)
+        self.capacity = float(capacity)
+        self._tokens  = float(capacity)
+        self._clock   = clock
+        self._sleep   = sleep
+        self._last    = clock()
+        self._lock    = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Take `tokens`, sleeping as needed.  Returns the time spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait = (tokens - self._tokens) / self.rate
+            self._sleep(wait)
+            waited += wait
+
+
+_public_bucket: TokenBucket | None = None
+_bucket_lock = threading.Lock()
+
+
+def public_bucket() -> TokenBucket:
+    """Process-wide bucket shared by every public OHLCV request."""
+    global _public_bucket
+    with _bucket_lock:
+        if _public_bucket is None:
+            _public_bucket = TokenBucket()
+        return _public_bucket
+
+
+# ───────────────────────────── Engine ────────────────────────────────────────
+def run_series_jobs(
+        symbols: Iterable[str],
+        timeframes: Iterable[str],
+        job: Callable[[str, str], object],
+        max_workers: int = FETCH_WORKERS,
+        on_progress: Callable[[str, int, int], None] | None = None,
+) -> dict[tuple[str, str], object]:
+    """
+    Run `job(symbol, tf)` for every pair on a bounded pool.
+
+    `on_progress(symbol, done, total)` is called from the calling thread each
+    time all timeframes of a symbol have finished.  A failing job is logged
+    and recorded as its exception; the others keep running.
+    """
+    symbols    = list(symbols)
+    timeframes = list(timeframes)
+    remaining  = {s: len(timeframes) for s in symbols}
+    results: dict[tuple[str, str], object] = {}
+    done_symbols = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch") as pool:
+        futures = {pool.submit(job, s, tf): (s, tf) for s in symbols for tf in timeframes}
+        for fut in as_completed(futures):
+            symbol, tf = futures[fut]
+            try:
+                results[(symbol, tf)] = fut.result()
+            except Exception as e:
+                logger.error("%s [%s] fetch job failed: %s", symbol, tf, e)
+                results[(symbol, tf)] = e
+
+            remaining[symbol] -= 1
+            if remaining[symbol] == 0:
+                done_symbols += 1
+                if on_progress:
+                    on_progress(symbol, done_symbols, len(symbols))
+
+    return results
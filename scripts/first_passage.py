@@ -0,0 +1,88 @@
+"""
+first_passage.py  -  "First index j >= lo where x leaves (low, high)"
+--------------------------------------------------------------------
+• `band_tree(x)` summarises x in BLOCK-row blocks and lays the blocks'
+  (min, -max) out as the leaves of a perfect binary tree.  For 500k rows
+  that is a few hundred kB, so queries stay in cache (a sparse table over
+  the rows would need O(n log n) memory).
+• `first_outside(x, tree, lo, hi, low, high)` searches [lo, hi): it scans
+  the rest of lo's block, climbs the tree to the first block on its right
+  with min <= low or max >= high, and scans that block, so a query costs
+  O(BLOCK + log n).  NaN rows and padding never match; high = NaN disables
+  the upper side.
+• `next_true(mask)` gives, for every index, the first set index at or after
+  it (one backward pass).
+• All kernels are numba-compiled and return -1 when there is no hit.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+from numba import njit
+
+BLOCK = 64
+
+
+@njit(cache=True)
+def band_tree(x):
+    n_blocks = (x.size + BLOCK - 1) // BLOCK
+    size = 1
+    while size < max(n_blocks, 1):
+        size *= 2
+    tree = np.full((2 * size, 2), np.inf)
+    for i in range(x.size):
+        if x[i] == x[i]:                      # NaN never crosses anything
+            leaf = size + i // BLOCK
+            tree[leaf, 0] = min(tree[leaf, 0], x[i])
+            tree[leaf, 1] = min(tree[leaf, 1], -x[i])
+    for node in range(size - 1, 0, -1):
+        tree[node, 0] = min(tree[2 * node, 0], tree[2 * node + 1, 0])
+        tree[node, 1] = min(tree[2 * node, 1], tree[2 * node + 1, 1])
+    return tree
+
+
+@njit(cache=True)
+def _scan(x, lo, hi, low, high):
+    for j in range(lo, min(hi, x.size)):
+        if x[j] <= low or x[j] >= high:
+            return j
+    return -1
+
+
+@njit(cache=True)
+def first_outside(x, tree, lo, hi, low, high):
+    hi = min(hi, x.size)
+    if lo < 0 or lo >= hi:
+        return -1
+    block = lo // BLOCK
+    j = _scan(x, lo, min(hi, (block + 1) * BLOCK), low, high)
+    if j >= 0 or (block + 1) * BLOCK >= hi:
+        return j
+
+    size = tree.shape[0] // 2
+    neg_high = -high
+    node = size + block + 1
+    if node >= 2 * size:
+        return -1
+    while not (tree[node, 0] <= low or tree[node, 1] <= neg_high):
+        while node & 1:                       # right child: climb
+            node >>= 1
+        if node == 0:
+            return -1
+        node += 1                             # step to the right sibling
+    while node < size:                        # leftmost matching block
+        node *= 2
+        if not (tree[node, 0] <= low or tree[node, 1] <= neg_high):
+            node += 1
+    block = node - size
+    return _scan(x, block * BLOCK, min(hi, (block + 1) * BLOCK), low, high)
+
+
+@njit(cache=True)
+def next_true(mask):
+    n = mask.size
+    out = np.empty(n + 1, dtype=np.int64)
+    out[n] = -1
+    for i in range(n - 1, -1, -1):
+        out[i] = i if mask[i] else out[i + 1]
+    return out
@@ -2,9 +2,7 @@ import os
 import time
 import json
 import pandas as pd
-from pandas.errors import EmptyDataError
 from datetime import datetime, timedelta, timezone
-import ccxt # type: ignore
 
 import warnings
 warnings.filterwarnings("ignore")
@@ -14,6 +12,11 @@ load_dotenv()
 import logging
 
 from scripts.utilities import update_log_status
+from scripts import candle_store, coverage, stream
+from scripts.fetch_engine import FETCH_WORKERS, run_series_jobs
+from scripts.exchange import get_exchange
+from scripts.resample import FINE_TF, DERIVED_TFS, derive_all
+from scripts.ledger import get_ledger
 
 
 LOG_FILE = "log.txt"
@@ -94,18 +97,22 @@ ASSETS = {
 BASE_OUTPUT_DIR = "data/historical"
 os.makedirs(BASE_OUTPUT_DIR, exist_ok=True)
 
+EVENTS_FILE        = "events.jsonl"      # append-only, one fill per line
+LEGACY_EVENTS_FILE = "events.json"
+
 
 
 # ─────────────────────────────────────────────────────────────
 # Fetch function
 # ─────────────────────────────────────────────────────────────
 
-def fetch_kraken_ohlcv(symbol, timeframe, lookback_amount, lookback_unit="hours", limit_per_fetch=720, pause=2.5):
-    kraken = ccxt.kraken({
-        'apiKey': os.getenv("KRAKEN_API_KEY"),
-        'secret': os.getenv("KRAKEN_API_SECRET"),
-        'enableRateLimit': True,
-    })
+def fetch_kraken_ohlcv(symbol, timeframe, lookback_amount, lookback_unit="hours", limit_per_fetch=720, pause=0.0,
+                       kraken=None):
+    """
+    Page through Kraken OHLCV on the shared gateway client, which paces every
+    page through the public token bucket; `pause` adds an extra fixed delay.
+    """
+    kraken = kraken or get_exchange()
 
     end_time = datetime.now(timezone.utc)
     start_time = end_time - timedelta(hours=lookback_amount)
@@ -129,7 +136,8 @@ def fetch_kraken_ohlcv(symbol, timeframe, lookback_amount, lookback_unit="hours"
         if len(ohlcv) < limit_per_fetch:
             break
 
-        time.sleep(pause)
+        if pause:
+            time.sleep(pause)
 
     if not all_ohlcv:
         logging.info(f"No data returned for {symbol} [{timeframe}]")
@@ -146,101 +154,69 @@ def fetch_kraken_ohlcv(symbol, timeframe, lookback_amount, lookback_unit="hours"
 # ─────────────────────────────────────────────────────────────
 
 
-TARGET_ROWS = 700                         # keep exactly 720 rows
+TARGET_ROWS = 700                         # minimum rows kept per series (readers take the tail)
 
 # helper
-def safe_fetch_ohlcv(symbol: str, tf: str, hours: float) -> pd.DataFrame:
+def safe_fetch_ohlcv(symbol: str, tf: str, hours: float, kraken=None) -> pd.DataFrame:
     """Fetch OHLCV and handle errors gracefully."""
-    df = fetch_kraken_ohlcv(symbol, tf, lookback_amount=hours)
+    df = fetch_kraken_ohlcv(symbol, tf, lookback_amount=hours, kraken=kraken)
     if df is not None and not df.empty:
         if df.index.tzinfo is None:
             df.index = df.index.tz_localize("UTC")
     return df
 
 
-def historical(assets, status):
-    """Maintain a rolling TARGET_ROWS-row UTC-aware OHLCV window for every symbol/timeframe."""
-    total = len(assets)
-    for i, symbol in enumerate(assets, 1):
-        update_log_status(status=status, message=f"[{i}/{total}] Updating historical data for {symbol}...")
-
-        sym_id = symbol.replace("/", "_").lower()
-        coin_dir = os.path.join(BASE_OUTPUT_DIR, sym_id)
-        os.makedirs(coin_dir, exist_ok=True)
-
-        for tf, delta in TIMEFRAME_DELTAS.items():
-            path = os.path.join(coin_dir, f"{tf}.csv")
-            now = datetime.now(timezone.utc)
-
-            # ── load existing or start fresh ─────────────────────────────────
-            try:
-                if os.path.exists(path) and os.path.getsize(path) > 0:
-                    df = (
-                        pd.read_csv(path, parse_dates=["timestamp"])
-                          .set_index("timestamp")
-                    )
-                    if df.index.tzinfo is None:
-                        df.index = df.index.tz_localize("UTC")
-                else:
-                    raise EmptyDataError("file missing or empty")
-            except (ValueError, EmptyDataError):
-                df = pd.DataFrame(
-                    columns=["open", "high", "low", "close", "volume"],
-                    index=pd.DatetimeIndex([], name="timestamp", tz="UTC")
-                )
-
-            # ── track if we actually change the DataFrame ───────────────────
-            changed = False
-
-            # ── 1 · append forward ───────────────────────────────────────────
-            last_ts = df.index[-1] if not df.empty else now - TARGET_ROWS * delta
-            while last_ts + delta <= now:
-                look_hours = 100 * delta.total_seconds() / 3600
-                new = safe_fetch_ohlcv(symbol, tf, look_hours)
-                if new is None or new.empty:
-                    break
-
-                new = new[new.index > last_ts]
-                if new.empty:
-                    break
-
-                df = pd.concat([df, new])
-                last_ts = df.index[-1]
-                changed = True
-                logging.info(f"{symbol} [{tf}] appended {len(new)} rows")
-                time.sleep(1.0)
-
-            # ── 2 · back-fill ────────────────────────────────────────────────
-            while len(df) < TARGET_ROWS:
-                if df.empty:
-                    earliest_needed = now - TARGET_ROWS * delta
-                else:
-                    earliest_needed = df.index[0] - (TARGET_ROWS - len(df)) * delta
-
-                hours_back = (now - earliest_needed).total_seconds() / 3600 * 1.2
-                old = safe_fetch_ohlcv(symbol, tf, hours_back)
-                if old is None or old.empty:
-                    logging.info(f"{symbol} [{tf}] cannot fetch further history")
-                    break
-
-                if not df.empty:
-                    old = old[old.index < df.index[0]]
-                if old.empty:
-                    break
-
-                df = pd.concat([old, df])
-                changed = True
-                logging.info(f"{symbol} [{tf}] prepended {len(old)} rows")
-                time.sleep(1.0)
-
-            # ── 3 · finalize and conditionally save ──────────────────────────
-            df = df.sort_index().drop_duplicates().tail(TARGET_ROWS)
-
-            if changed:
-                df.to_csv(path)
-                logging.info(f"{symbol} [{tf}] saved {len(df)} rows → {path}")
-            else:
-                logging.debug(f"{symbol} [{tf}] no new data, skipped write")
+def _window_ms(tf: str) -> tuple[int, int]:
+    """[start, end) in ms covering the last TARGET_ROWS periods of `tf`."""
+    now = datetime.now(timezone.utc)
+    start = now - TARGET_ROWS * TIMEFRAME_DELTAS[tf]
+    return int(start.timestamp() * 1000), int(now.timestamp() * 1000)
+
+
+def update_series(symbol: str, tf: str, kraken=None) -> int:
+    """
+    Fill exactly the candles missing from the last TARGET_ROWS periods of one
+    symbol/timeframe store - the tail, the head and any holes left by past
+    outages - using the coverage planner.  Returns the number of rows added.
+    """
+    start_ms, end_ms = _window_ms(tf)
+    return coverage.fill(symbol, tf, start_ms, end_ms,
+                         kraken=kraken or get_exchange(), base=BASE_OUTPUT_DIR)
+
+
+def update_symbol(symbol: str, kraken=None) -> int:
+    """
+    Fetch only the finest timeframe remotely, derive the coarser ones locally
+    and fall back to Kraken just for coarse history older than the fine series.
+    Thread-safe across symbols; pacing comes from the gateway's token bucket.
+    """
+    fine_store = candle_store.store_path(symbol, FINE_TF, BASE_OUTPUT_DIR)
+    candle_store.create(fine_store)
+    gaps = coverage.missing_ranges(fine_store, FINE_TF, *_window_ms(FINE_TF))
+    repaired_from = gaps[0][0] if gaps else None      # re-derive buckets over repaired holes
+
+    added  = stream.flush_to_store(symbol, BASE_OUTPUT_DIR)     # live candles first, REST for the rest
+    added += update_series(symbol, FINE_TF, kraken)
+    for tf, n in derive_all(symbol, BASE_OUTPUT_DIR, DERIVED_TFS, since_ms=repaired_from).items():
+        added += n + update_series(symbol, tf, kraken)      # only history older than 15m
+    return added
+
+
+def historical(assets, status, max_workers: int = FETCH_WORKERS):
+    """
+    Maintain at least TARGET_ROWS UTC-aware OHLCV candles for every symbol/timeframe.
+    Symbols are updated concurrently under one token bucket; only FINE_TF is
+    fetched each cycle, the rest is resampled locally.
+    """
+    kraken = get_exchange()
+
+    def job(symbol, tf):
+        return update_symbol(symbol, kraken=kraken)
+
+    def progress(symbol, done, total):
+        update_log_status(status=status, message=f"[{done}/{total}] Historical data updated for {symbol}")
+
+    run_series_jobs(assets, [FINE_TF], job, max_workers=max_workers, on_progress=progress)
 
 
 
@@ -253,18 +229,15 @@ def fetch_kraken_my_trades(
         lookback_amount: int,
         lookback_unit: str = "hours",      # "hours", "days" …
         limit_per_fetch: int = 1000,       # Kraken returns max 1000 fills
-        pause: float = 2.5                 # throttle between pages
+        pause: float = 0.0,                # extra delay between pages
+        kraken=None,
     ) -> pd.DataFrame:
     """
     Fetch your personal trade history for <symbol> over the last <lookback_amount>
     units (eg. 24 hours, 30 days).  Returns a DataFrame with UTC-aware index and
     columns: side, price, qty.
     """
-    kraken = ccxt.kraken({
-        "apiKey": os.getenv("KRAKEN_API_KEY"),
-        "secret": os.getenv("KRAKEN_API_SECRET"),
-        "enableRateLimit": True,
-    })
+    kraken = kraken or get_exchange()
 
     # ---- time window ---------------------------------------------------
     end_time   = datetime.now(timezone.utc)
@@ -298,7 +271,8 @@ def fetch_kraken_my_trades(
         since_ms = int(trades[-1]["timestamp"]) + 1
         if len(trades) < limit_per_fetch:
             break    # finished window
-        time.sleep(pause)
+        if pause:
+            time.sleep(pause)
 
     if not all_rows:
         return pd.DataFrame(columns=["side","price","qty"],
@@ -314,70 +288,95 @@ def fetch_kraken_my_trades(
 def symbol_dir(sym: str) -> str:
     return sym.replace("/", "_").lower()
 
+def events_path(sym: str, base: str = BASE_OUTPUT_DIR) -> str:
+    return os.path.join(base, symbol_dir(sym), EVENTS_FILE)
+
+def _event_row(t: dict) -> dict:
+    return {
+        "time":  datetime.fromtimestamp(t["timestamp"] / 1000, tz=timezone.utc)
+                         .strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "side":  t["side"],
+        "price": float(t["price"]),
+        "qty":   float(t["amount"]),
+        "id":    t["id"],
+    }
+
+def _migrate_legacy_events(path: str) -> str | None:
+    """Turn an old <sym>/events.json into events.jsonl; returns its last fill time."""
+    legacy = os.path.join(os.path.dirname(path), LEGACY_EVENTS_FILE)
+    if os.path.exists(path) or not os.path.exists(legacy):
+        return None
+    with open(legacy, "r") as f:
+        rows = json.load(f)
+    with open(path, "w") as f:
+        f.writelines(json.dumps(r) + "\n" for r in rows)
+    os.remove(legacy)
+    return max((r["time"] for r in rows), default=None)
+
+def append_events(fills: list[dict], base: str = BASE_OUTPUT_DIR) -> dict[str, int]:
+    """Append new fills to each symbol's events.jsonl; untouched symbols cost no I/O."""
+    by_symbol: dict[str, list[dict]] = {}
+    for t in fills:
+        by_symbol.setdefault(t["symbol"], []).append(_event_row(t))
+
+    written = {}
+    for sym, rows in by_symbol.items():
+        path = events_path(sym, base)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        legacy_last = _migrate_legacy_events(path)
+        if legacy_last:
+            rows = [r for r in rows if r["time"] > legacy_last]
+        if not rows:
+            continue
+        with open(path, "a") as f:
+            f.writelines(json.dumps(r) + "\n" for r in rows)
+        written[sym] = len(rows)
+        logging.info(f"{sym}: appended {len(rows)} fills → {EVENTS_FILE}")
+    return written
+
 def load_events(path: str) -> pd.DataFrame:
-    if not os.path.exists(path):
+    """Read an events.jsonl (or a legacy events.json) into a time-indexed frame."""
+    legacy = os.path.join(os.path.dirname(path), LEGACY_EVENTS_FILE)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            arr = [json.loads(line) for line in f if line.strip()]
+    elif os.path.exists(legacy):
+        with open(legacy, "r") as f:
+            arr = json.load(f)
+    else:
+        arr = []
+    if not arr:
         return pd.DataFrame(columns=["side","price","qty"],
                             index=pd.DatetimeIndex([], name="time", tz="UTC"))
-    with open(path, "r") as f:
-        arr = json.load(f)
-    df = pd.DataFrame(arr).set_index("time")
+    df = pd.DataFrame(arr)
+    if "id" in df:
+        df = df.drop_duplicates("id", keep="last")       # replayed after a crash
+    df = df.set_index("time")
     df.index = pd.to_datetime(df.index, utc=True)
     return df.sort_index()
 
-def save_events(df: pd.DataFrame, path: str):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    out = df.reset_index()
-    out["time"] = out["time"].dt.strftime("%Y-%m-%dT%H:%M:%SZ")
-    with open(path, "w") as f:
-        json.dump(out.to_dict(orient="records"), f, indent=2)
-
-def update_events(assets, status, full_days_init: int = 90):
+def sync_fills(kraken=None) -> list[dict]:
     """
-    Refresh each <symbol>/events.json so it contains ALL personal fills.
-    Reads existing rows, fetches only what's missing, appends, dedupes, saves.
+    One account-wide TradesHistory pass from the ledger's cursor.  New fills
+    feed the FIFO ledger and are appended to their symbol's events log.
     """
-    total = len(assets)
-    for i, sym in enumerate(assets, 1):
-        message = f"[{i}/{total}] Updating historical events for {sym}..."
-        update_log_status(status=status, message=message)
-        folder = os.path.join("data", "historical", symbol_dir(sym))
-        path   = os.path.join(folder, "events.json")
-
-        df = load_events(path)          # existing (may be empty)
-
-        # ── decide look-back window ───────────────────────────────────
-        if df.empty:
-            look_amount, look_unit = full_days_init, "days"
-        else:
-            last_ts    = df.index[-1]
-            hours_diff = max(1, int((datetime.now(timezone.utc) - last_ts)
-                                     .total_seconds() // 3600) + 1)
-            look_amount, look_unit = hours_diff, "hours"
-
-        # ── fetch new private trades ─────────────────────────────────
-        new = fetch_kraken_my_trades(sym,
-                                     lookback_amount = look_amount,
-                                     lookback_unit   = look_unit)
-
-        if new.empty:
-            logging.info(f"{sym}: no new fills")
-            continue
-
-        # keep only rows strictly newer than our last stored candle
-        if not df.empty:
-            new = new[new.index > df.index[-1]]
-        if new.empty:
-            logging.info(f"{sym}: nothing beyond last stored fill")
-            continue
+    kraken = kraken or get_exchange()
+    return get_ledger().sync(kraken, on_fills=append_events)
 
-        # ── combine, dedupe, save ───────────────────────────────────
-        df = pd.concat([df, new]).sort_index()
-        df = df[~df.index.duplicated(keep="last")]
-
-        save_events(df, path)
-        logging.info(f"{sym}: wrote {len(df)} rows → events.json (+{len(new)})")
+def update_events(assets, status, kraken=None):
+    """
+    Keep every <symbol>/events.jsonl complete with a single account-wide fill
+    sync (no per-symbol requests, no rewrites of unchanged logs).
+    """
+    update_log_status(status=status, message=f"Syncing account fills for {len(assets)} symbols...")
+    try:
+        new = sync_fills(kraken)
+    except Exception as e:
+        logging.info(f"Error syncing account fills: {e}")
+        return
+    if not new:
+        logging.info("No new fills")
 
-        time.sleep(2.5)             # respect Kraken private rate-limit
 
 
 
@@ -0,0 +1,310 @@
+"""
+indicators.py  -  Momentum indicators, streaming and batch
+----------------------------------------------------------
+• The indicators behind the momentum score: RSI(14), MACD(12, 26, 9) diff,
+  ROC(5) and SMA(20), plus the combined score in [-1, 1].  This is the one
+  implementation the ranking (rank.py, rank_state.py, sweep.py) and the
+  position monitor use.
+• Each recursion mirrors the code the `ta` package runs (pandas ewm with
+  adjust=False and min_periods, Kahan-compensated rolling mean, ROC as
+  (c - c[-5]) / c[-5]).  The outputs are therefore the ones `ta` gives,
+  without building a pandas Series per call.
+• Streaming: `update()` costs O(1) per bar.  Batch: `update_many()` runs
+  the same recursion over a whole array in numba, continuing from the
+  current state.  Feeding a series bar by bar, in chunks or in one call
+  gives the same values.
+• `momentum_raw(close)` gives the (N, 4) indicator rows of a whole array,
+  and `score_series` / `latest_score` give the combined score.
+• State round-trips through `to_dict()` / `from_dict()` for persistence.
+"""
+
+from __future__ import annotations
+
+import math
+from collections import deque
+
+import numpy as np
+from numba import njit
+
+RSI_WINDOW = 14
+MACD_FAST, MACD_SLOW, MACD_SIGN = 12, 26, 9
+ROC_WINDOW = 5
+SMA_WINDOW = 20
+MIN_ROWS   = 30            # monitor: fewer closes give a neutral score
+
+
+# ───────────────────────────── Kernels ───────────────────────────────────────
+@njit(cache=True)
+def _ewm(x, alpha, minp, weighted, nobs, old_wt):
+    """pandas' ewm(adjust=False) recursion from the given state."""
+    out = np.empty(x.size)
+    for i in range(x.size):
+        cur = x[i]
+        is_obs = cur == cur
+        nobs += is_obs
+        if weighted == weighted:
+            old_wt *= 1.0 - alpha
+            if is_obs:
+                if weighted != cur:
+                    weighted = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+                old_wt = 1.0
+        elif is_obs:
+            weighted = cur
+        out[i] = weighted if nobs >= minp else np.nan
+    return out, weighted, nobs, old_wt
+
+
+@njit(cache=True)
+def _rolling_mean(x, start, window, nobs, neg_ct, sum_x, comp_add, comp_remove, same, prev):
+    """pandas' roll_mean over x[start:]; x[:start] are the values already in the window."""
+    out = np.empty(x.size - start)
+    for i in range(start, x.size):
+        if i >= window:
+            old = x[i - window]
+            if old == old:
+                nobs -= 1
+                y = -old - comp_remove
+                t = sum_x + y
+                comp_remove = t - sum_x - y
+                sum_x = t
+                if math.copysign(1.0, old) < 0:
+                    neg_ct -= 1
+        val = x[i]
+        if val == val:
+            nobs += 1
+            y = val - comp_add
+            t = sum_x + y
+            comp_add = t - sum_x - y
+            sum_x = t
+            if math.copysign(1.0, val) < 0:
+                neg_ct += 1
+            same = same + 1 if val == prev else 1
+            prev = val
+
+        if nobs < window:
+            out[i - start] = np.nan
+        elif same >= nobs:
+            out[i - start] = prev
+        else:
+            result = sum_x / nobs
+            if (neg_ct == 0 and result < 0) or (neg_ct == nobs and result > 0):
+                result = 0.0
+            out[i - start] = result
+    return out, nobs, neg_ct, sum_x, comp_add, comp_remove, same, prev
+
+
+@njit(cache=True)
+def _roc(x, start, window):
+    """ta's ROC over x[start:]; x[:start] are earlier closes."""
+    out = np.empty(x.size - start)
+    for i in range(start, x.size):
+        if i >= window:
+            out[i - start] = (x[i] - x[i - window]) / x[i - window] * 100
+        else:
+            out[i - start] = np.nan
+    return out
+
+
+# ───────────────────────────── Streaming state ───────────────────────────────
+class EWMMean:
+    """pandas `Series.ewm(alpha=..., adjust=False, min_periods=...).mean()`, one value at a time."""
+
+    def __init__(self, alpha: float, min_periods: int = 0):
+        self.alpha  = alpha
+        self.minp   = max(min_periods, 1)
+        self.weighted = math.nan
+        self.nobs   = 0
+        self.old_wt = 1.0
+
+    def update(self, cur: float) -> float:
+        is_obs = cur == cur
+        self.nobs += is_obs
+        if self.weighted == self.weighted:
+            self.old_wt *= 1.0 - self.alpha
+            if is_obs:
+                if self.weighted != cur:
+                    self.weighted = ((self.old_wt * self.weighted + self.alpha * cur)
+                                     / (self.old_wt + self.alpha))
+                self.old_wt = 1.0
+        elif is_obs:
+            self.weighted = cur
+        return self.weighted if self.nobs >= self.minp else math.nan
+
+    def update_many(self, x: np.ndarray) -> np.ndarray:
+        out, self.weighted, self.nobs, self.old_wt = _ewm(
+            np.asarray(x, dtype=np.float64), self.alpha, self.minp,
+            self.weighted, self.nobs, self.old_wt)
+        return out
+
+
+class RollingMean:
+    """pandas `Series.rolling(window).mean()` (Kahan-compensated running sum)."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.values: deque = deque(maxlen=window)
+        self.nobs = self.neg_ct = 0
+        self.sum_x = self.comp_add = self.comp_remove = 0.0
+        self.same = 0
+        self.prev = math.nan
+
+    def update(self, val: float) -> float:
+        if len(self.values) == self.window:
+            old = self.values[0]
+            if old == old:
+                self.nobs -= 1
+                y = -old - self.comp_remove
+                t = self.sum_x + y
+                self.comp_remove = t - self.sum_x - y
+                self.sum_x = t
+                if math.copysign(1.0, old) < 0:
+                    self.neg_ct -= 1
+        self.values.append(val)
+        if val == val:
+            self.nobs += 1
+            y = val - self.comp_add
+            t = self.sum_x + y
+            self.comp_add = t - self.sum_x - y
+            self.sum_x = t
+            if math.copysign(1.0, val) < 0:
+                self.neg_ct += 1
+            self.same = self.same + 1 if val == self.prev else 1
+            self.prev = val
+
+        if self.nobs < self.window:
+            return math.nan
+        result = self.sum_x / self.nobs
+        if self.same >= self.nobs:
+            return self.prev
+        if self.neg_ct == 0 and result < 0:
+            return 0.0
+        if self.neg_ct == self.nobs and result > 0:
+            return 0.0
+        return result
+
+    def update_many(self, x: np.ndarray) -> np.ndarray:
+        x = np.concatenate([np.array(self.values, dtype=np.float64),
+                            np.asarray(x, dtype=np.float64)])
+        (out, self.nobs, self.neg_ct, self.sum_x, self.comp_add, self.comp_remove,
+         self.same, self.prev) = _rolling_mean(
+            x, len(self.values), self.window, self.nobs, self.neg_ct, self.sum_x,
+            self.comp_add, self.comp_remove, self.same, self.prev)
+        self.values = deque(x[-self.window:].tolist(), maxlen=self.window)
+        return out
+
+
+class MomentumState:
+    """Streaming RSI(14) / MACD diff / ROC(5) / SMA(20) over closes."""
+
+    def __init__(self):
+        self.prev_close = math.nan
+        self.closes: deque = deque(maxlen=ROC_WINDOW + 1)
+        self.up   = EWMMean(1 / RSI_WINDOW, RSI_WINDOW)
+        self.down = EWMMean(1 / RSI_WINDOW, RSI_WINDOW)
+        self.fast = EWMMean(2 / (MACD_FAST + 1), MACD_FAST)
+        self.slow = EWMMean(2 / (MACD_SLOW + 1), MACD_SLOW)
+        self.sign = EWMMean(2 / (MACD_SIGN + 1), MACD_SIGN)
+        self.sma  = RollingMean(SMA_WINDOW)
+
+    def update(self, close: float) -> tuple[float, float, float, float]:
+        """Feed one close; returns (rsi, macd_diff, roc, sma20)."""
+        close = float(close)
+        diff = close - self.prev_close
+        self.prev_close = close
+
+        up = diff if diff > 0 else 0.0
+        dn = -(diff if diff < 0 else 0.0)
+        emaup, emadn = self.up.update(up), self.down.update(dn)
+        if emadn == 0:
+            rsi = 100.0
+        else:
+            rsi = 100 - (100 / (1 + emaup / emadn)) if emadn == emadn and emaup == emaup else math.nan
+
+        macd = self.fast.update(close) - self.slow.update(close)
+        macd_diff = macd - self.sign.update(macd)
+
+        self.closes.append(close)
+        old = self.closes[0]
+        roc = (close - old) / old * 100 if len(self.closes) == ROC_WINDOW + 1 else math.nan
+        return rsi, macd_diff, roc, self.sma.update(close)
+
+    def update_many(self, closes: np.ndarray) -> np.ndarray:
+        """(N, 4) raw indicator rows for a chunk of closes (same values as update())."""
+        close = np.asarray(closes, dtype=np.float64)
+        if not close.size:
+            return np.empty((0, 4))
+        diff = close - np.r_[self.prev_close, close[:-1]]
+        self.prev_close = float(close[-1])
+
+        emaup = self.up.update_many(np.where(diff > 0, diff, 0.0))
+        emadn = self.down.update_many(-np.where(diff < 0, diff, 0.0))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rsi = np.where(emadn == 0, 100.0, 100 - (100 / (1 + emaup / emadn)))
+
+        macd = self.fast.update_many(close) - self.slow.update_many(close)
+        macd_diff = macd - self.sign.update_many(macd)
+
+        roc = _roc(np.concatenate([np.array(self.closes, dtype=np.float64), close]),
+                   len(self.closes), ROC_WINDOW)
+        self.closes.extend(close[-(ROC_WINDOW + 1):].tolist())
+        return np.column_stack([rsi, macd_diff, roc, self.sma.update_many(close)])
+
+    def to_dict(self) -> dict:
+        def ewm(e):
+            return [e.weighted, e.nobs, e.old_wt]
+        return {
+            "prev_close": self.prev_close,
+            "closes": list(self.closes),
+            "up": ewm(self.up), "down": ewm(self.down),
+            "fast": ewm(self.fast), "slow": ewm(self.slow), "sign": ewm(self.sign),
+            "sma": [list(self.sma.values), self.sma.nobs, self.sma.neg_ct, self.sma.sum_x,
+                    self.sma.comp_add, self.sma.comp_remove, self.sma.same, self.sma.prev],
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "MomentumState":
+        st = cls()
+        st.prev_close = d["prev_close"]
+        st.closes.extend(d["closes"])
+        for name in ("up", "down", "fast", "slow", "sign"):
+            e = getattr(st, name)
+            e.weighted, e.nobs, e.old_wt = d[name]
+        sma = st.sma
+        values, sma.nobs, sma.neg_ct, sma.sum_x, sma.comp_add, sma.comp_remove, sma.same, sma.prev = d["sma"]
+        sma.values.extend(values)
+        return st
+
+    def copy(self) -> "MomentumState":
+        return MomentumState.from_dict(self.to_dict())
+
+
+# ───────────────────────────── Batch API ─────────────────────────────────────
+def momentum_raw(close: np.ndarray) -> np.ndarray:
+    """(N, 4) rows of (rsi, macd_diff, roc, sma20) for a whole close array."""
+    return MomentumState().update_many(close)
+
+
+def momentum_score(raw: np.ndarray, close: np.ndarray, std: float) -> np.ndarray:
+    """Combined score in [-1, 1] from (N, 4) raw rows (rsi, macd_diff, roc, sma20)."""
+    rsi, macd_diff, roc, sma = raw.T
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mom = ((rsi - 50) / 50 + np.tanh(macd_diff / std) + np.tanh(roc / 10)
+               + np.tanh(((close / sma) - 1) * 10)) / 4
+    return np.clip(mom, -1, 1)
+
+
+def score_series(close: np.ndarray, std: float | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """(raw rows, score of every row); MACD is scaled by the sample std of `close` by default."""
+    close = np.asarray(close, dtype=np.float64)
+    raw = momentum_raw(close)
+    if std is None:
+        std = float(np.std(close, ddof=1)) if close.size > 1 else math.nan
+    return raw, momentum_score(raw, close, std)
+
+
+def latest_score(close: np.ndarray, min_rows: int = MIN_ROWS) -> float:
+    """Score of the last close (the monitor's exit signal); 0.0 below `min_rows` closes."""
+    close = np.asarray(close, dtype=np.float64)
+    if close.size < min_rows:
+        return 0.0
+    return float(score_series(close)[1][-1])
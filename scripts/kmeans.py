@@ -0,0 +1,161 @@
+"""
+kmeans.py  -  Small-dimensional k-means for the ranking clusters
+----------------------------------------------------------------
+• Numba Lloyd iterations over the (N, 8) centroid vectors the ranking
+  clusters, seeded either by greedy k-means++ from a fixed seed (the same
+  input always gives the same fit) or warm-started from the previous fit.
+• Stops as soon as no label changes or the centre shift falls under tol
+  (relative to the data variance, as sklearn does, floored at MIN_TOL so a
+  window of near-identical vectors does not churn for MAX_ITER); an emptied
+  cluster is re-seeded with the point farthest from its centre.
+• A warm start keeps cluster i next to the previous centre i, so labels and
+  per-cluster tallies keep their meaning across cycles; `align()` gives a
+  cold fit the same property.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+from numba import njit
+from scipy.optimize import linear_sum_assignment
+
+SEED     = 42
+MAX_ITER = 300
+TOL      = 1e-4
+MIN_TOL  = 1e-20              # absolute shift floor: (near-)identical points converge
+
+
+# ───────────────────────────── Kernels ───────────────────────────────────────
+@njit(cache=True)
+def _sqdist(x, centers):
+    n, d = x.shape
+    k = centers.shape[0]
+    out = np.empty((n, k))
+    for i in range(n):
+        for j in range(k):
+            s = 0.0
+            for f in range(d):
+                t = x[i, f] - centers[j, f]
+                s += t * t
+            out[i, j] = s
+    return out
+
+
+@njit(cache=True)
+def _closest(dist):
+    n, k = dist.shape
+    labels = np.empty(n, dtype=np.int32)
+    best = np.empty(n)
+    for i in range(n):
+        b, bd = 0, dist[i, 0]
+        for j in range(1, k):
+            if dist[i, j] < bd:
+                b, bd = j, dist[i, j]
+        labels[i], best[i] = b, bd
+    return labels, best
+
+
+@njit(cache=True)
+def _kmeanspp(x, k, seed):
+    """Greedy k-means++ (2 + log k candidates per centre, as in sklearn)."""
+    np.random.seed(seed)
+    n, d = x.shape
+    trials = 2 + int(np.log(k))
+    centers = np.empty((k, d))
+    centers[0] = x[np.random.randint(n)]
+    pot = _sqdist(x, centers[:1])[:, 0]
+    for c in range(1, k):
+        total = pot.sum()
+        cum = np.cumsum(pot)
+        best_i, best_pot, best_d = -1, np.inf, pot
+        for _ in range(trials):
+            r = np.random.random() * total
+            i = min(np.searchsorted(cum, r), n - 1)
+            cand = np.minimum(pot, _sqdist(x, x[i:i + 1])[:, 0])
+            s = cand.sum()
+            if s < best_pot:
+                best_i, best_pot, best_d = i, s, cand
+        centers[c] = x[best_i]
+        pot = best_d
+    return centers
+
+
+@njit(cache=True)
+def _lloyd(x, centers, max_iter, tol):
+    """Lloyd iterations in place; returns (labels, inertia, iterations)."""
+    n, d = x.shape
+    k = centers.shape[0]
+    labels = np.full(n, -1, dtype=np.int32)
+    it = 0
+    for it in range(1, max_iter + 1):
+        new, best = _closest(_sqdist(x, centers))
+        sums = np.zeros((k, d))
+        counts = np.zeros(k, dtype=np.int64)
+        for i in range(n):
+            counts[new[i]] += 1
+            sums[new[i]] += x[i]
+        shift = 0.0
+        for j in range(k):
+            if counts[j] == 0:                      # re-seed with the worst-served point
+                far = np.argmax(best)
+                best[far] = 0.0
+                c = x[far].copy()
+            else:
+                c = sums[j] / counts[j]
+            shift += ((c - centers[j]) ** 2).sum()
+            centers[j] = c
+        same = (new == labels).all()
+        labels = new
+        if same or shift <= tol:
+            break
+    labels, best = _closest(_sqdist(x, centers))
+    return labels, best.sum(), it
+
+
+# ───────────────────────────── API ───────────────────────────────────────────
+class KMeansFit:
+    """The slice of sklearn's fitted KMeans the ranking uses."""
+
+    def __init__(self, centers: np.ndarray, labels: np.ndarray, inertia: float, n_iter: int):
+        self.cluster_centers_ = centers
+        self.labels_  = labels
+        self.inertia_ = inertia
+        self.n_iter_  = n_iter
+
+    @property
+    def n_clusters(self) -> int:
+        return len(self.cluster_centers_)
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        x = np.ascontiguousarray(np.atleast_2d(x), dtype=np.float64)
+        return _closest(_sqdist(x, self.cluster_centers_))[0]
+
+
+def kmeans(x: np.ndarray, k: int, init: np.ndarray | None = None,
+           max_iter: int = MAX_ITER, tol: float = TOL, seed: int = SEED) -> KMeansFit:
+    """
+    Fit k clusters to x.  `init` (k centres, e.g. the previous fit's) warm-
+    starts the iterations and keeps their order; otherwise k-means++ seeding.
+    """
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    if init is not None and len(init) == k:
+        centers = np.array(init, dtype=np.float64)
+    else:
+        centers = _kmeanspp(x, k, seed)
+    tol_abs = max(tol * float(np.var(x, axis=0).mean()), MIN_TOL)
+    labels, inertia, n_iter = _lloyd(x, centers, max_iter, tol_abs)
+    return KMeansFit(centers, labels, float(inertia), int(n_iter))
+
+
+def align(prev: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """
+    Reorder `centers` so each matched one (minimum-cost assignment) takes the
+    index of its previous centre; with a different k the matched centres keep
+    the previous order and the rest go last.
+    """
+    if not len(prev) or not len(centers):
+        return centers
+    rows, cols = linear_sum_assignment(_sqdist(np.asarray(prev, np.float64),
+                                               np.asarray(centers, np.float64)))
+    matched = cols[np.argsort(rows)]
+    return centers[np.r_[matched, np.setdiff1d(np.arange(len(centers)), matched)]]
@@ -0,0 +1,167 @@
+"""
+ledger.py  -  Persistent trade ledger with FIFO cost basis
+----------------------------------------------------------
+• data/ledger.json keeps, per symbol, the open FIFO lots, realized PnL,
+  fees and the last buy, plus a `since` cursor into the account's fills.
+• `sync()` pulls only fills newer than the cursor (paging TradesHistory
+  50 at a time) and applies them in time order, so a cycle costs
+  O(new fills) instead of rescanning the whole trade history per coin.
+• `position()` gives qty / FIFO entry price / realized / unrealized PnL;
+  positions.json entry prices are taken from here.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import logging
+import threading
+from typing import Any, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+LEDGER_FILE = "data/ledger.json"
+TRADES_PAGE = 50                  # Kraken TradesHistory page size
+QTY_EPS     = 1e-12               # dust left by float arithmetic
+
+
+def _new_book() -> dict[str, Any]:
+    return {"lots": [], "realized": 0.0, "fees": 0.0, "bought": 0.0, "sold": 0.0,
+            "last_buy": None, "unrealized": None, "mark": None}
+
+
+class Ledger:
+    """FIFO books per symbol, advanced incrementally from a fill cursor."""
+
+    def __init__(self, path: str = LEDGER_FILE):
+        self.path   = path
+        self.cursor: int | None = None        # ms timestamp of the newest applied fill
+        self.cursor_ids: list[str] = []       # fills already applied at exactly `cursor`
+        self.books: dict[str, dict[str, Any]] = {}
+        self._lock  = threading.Lock()
+
+    # -- persistence ------------------------------------------------------------
+    @classmethod
+    def load(cls, path: str = LEDGER_FILE) -> "Ledger":
+        ledger = cls(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return ledger
+        ledger.cursor     = state.get("cursor")
+        ledger.cursor_ids = state.get("cursor_ids", [])
+        ledger.books      = state.get("books", {})
+        return ledger
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"cursor": self.cursor, "cursor_ids": self.cursor_ids,
+                       "books": self.books}, f, indent=2)
+        os.replace(tmp, self.path)
+
+    # -- fills ------------------------------------------------------------------
+    def apply(self, trade: dict) -> bool:
+        """Apply one ccxt trade; returns False if it was already applied."""
+        ts, tid = int(trade["timestamp"]), str(trade["id"])
+        if self.cursor is not None and (ts < self.cursor or
+                                        (ts == self.cursor and tid in self.cursor_ids)):
+            return False
+
+        book  = self.books.setdefault(trade["symbol"], _new_book())
+        qty   = float(trade["amount"])
+        price = float(trade["price"])
+        fee   = trade.get("fee") or {}
+        book["fees"] += float(fee.get("cost") or 0.0)
+
+        if trade["side"] == "buy":
+            book["lots"].append([ts, qty, price])
+            book["bought"] += qty
+            book["last_buy"] = ts
+        else:
+            book["sold"] += qty
+            remaining = qty
+            while remaining > QTY_EPS and book["lots"]:
+                lot  = book["lots"][0]
+                take = min(lot[1], remaining)
+                book["realized"] += take * (price - lot[2])
+                lot[1]    -= take
+                remaining -= take
+                if lot[1] <= QTY_EPS:
+                    book["lots"].pop(0)
+            if remaining > QTY_EPS:
+                logger.info("%s: sold %.8f more than the ledger holds (deposit?)",
+                            trade["symbol"], remaining)
+
+        if ts != self.cursor:
+            self.cursor, self.cursor_ids = ts, []
+        self.cursor_ids.append(tid)
+        return True
+
+    def apply_all(self, trades: Iterable[dict]) -> int:
+        ordered = sorted(trades, key=lambda t: (int(t["timestamp"]), str(t["id"])))
+        return sum(self.apply(t) for t in ordered)
+
+    def sync(self, kraken, on_fills: Callable[[list[dict]], Any] | None = None) -> list[dict]:
+        """
+        Fetch and apply every fill since the cursor.  `on_fills` sees the new
+        fills before the cursor is persisted.  Returns the new fills.
+        """
+        with self._lock:
+            fresh, offset = [], 0
+            while True:
+                page = kraken.fetch_my_trades(since=self.cursor, params={"ofs": offset})
+                fresh.extend(page)
+                if len(page) < TRADES_PAGE:
+                    break
+                offset += len(page)
+            seen, new = set(), []
+            for t in sorted(fresh, key=lambda t: (int(t["timestamp"]), str(t["id"]))):
+                if t["id"] not in seen and self.apply(t):
+                    new.append(t)
+                seen.add(t["id"])
+            if new:
+                if on_fills:
+                    on_fills(new)
+                self.save()
+                logger.info("Ledger applied %d new fills (cursor %s)", len(new), self.cursor)
+            return new
+
+    # -- views ------------------------------------------------------------------
+    def position(self, symbol: str, price: float | None = None) -> dict[str, Any]:
+        book = self.books.get(symbol) or _new_book()
+        qty  = sum(lot[1] for lot in book["lots"])
+        cost = sum(lot[1] * lot[2] for lot in book["lots"])
+        entry = cost / qty if qty > QTY_EPS else None
+        return {
+            "qty":         qty,
+            "entry_price": entry,
+            "realized":    book["realized"],
+            "unrealized":  (price - entry) * qty if entry is not None and price is not None else None,
+            "fees":        book["fees"],
+            "last_buy":    book["last_buy"],
+        }
+
+    def mark(self, prices: dict[str, float]) -> None:
+        """Store unrealized PnL at `prices` for every open book."""
+        for symbol, book in self.books.items():
+            price = prices.get(symbol)
+            if price is None:
+                continue
+            book["mark"] = price
+            book["unrealized"] = self.position(symbol, price)["unrealized"]
+
+
+_ledger: Ledger | None = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> Ledger:
+    """The process-wide ledger (loaded from disk on first use)."""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = Ledger.load()
+        return _ledger
@@ -1,13 +1,15 @@
 from pathlib import Path
-from ta.momentum import RSIIndicator, ROCIndicator # type: ignore
-from ta.trend    import MACD # type: ignore
 import numpy as np
 import pandas as pd
-import ccxt, os, time, logging # type: ignore
+import os, time, logging
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv        # type: ignore
 
-from scripts.utilities import save_json, load_json, get_price, get_quantity
+from scripts import indicators
+from scripts.utilities import save_json, load_json, get_price, get_quantity, utc_now, state
+from scripts.candle_buffer import get_buffers
+from scripts.protective_orders import get_protection
+from scripts.stop_engine import HARD_SL_PCT, TRIGGER_PROFIT, TRAIL_SL_PCT, LATENCY_FILE, get_engine
 
 # ------------------------------------------------------------
 # CONFIG
@@ -24,14 +26,7 @@ MONITOR_FILE = "data/monitor.json"
 LOG_FILE       = "log.txt"
 SLEEP_SECONDS  = 30          # loop delay
 BOUNDARY       = 0.08        # 8 % trailing stop
-HARD_SL_PCT    = 0.08     # 8 %
-TRIGGER_PROFIT = 0.02     # +2 %
 TIMEFRAME      = "1h"     # momentum timeframe
-KRAKEN         = ccxt.kraken({
-    'apiKey': os.getenv("KRAKEN_API_KEY"),
-    'secret': os.getenv("KRAKEN_API_SECRET"),
-    'enableRateLimit': True,
-})
 # assume helpers load_json / save_json / get_price already exist
 logger = logging.getLogger(__name__)
 
@@ -40,117 +35,89 @@ logger = logging.getLogger(__name__)
 # ------------------------------------------------------------
 def momentum_score(df: pd.DataFrame) -> float:
     """Return scalar in [-1,1] for the last row of df (expects open/high/low/close)."""
-    if len(df) < 30:
-        return 0.0
-    close = df["close"]
-    rsi  = RSIIndicator(close, 14).rsi().iloc[-1]
-    macd = MACD(close)
-    macd_diff = (macd.macd() - macd.macd_signal()).iloc[-1]
-    roc  = ROCIndicator(close, 5).roc().iloc[-1]
-    sma  = close.rolling(20).mean().iloc[-1]
-
-    rsi_s  = (rsi - 50) / 50
-    macd_s = np.tanh(macd_diff / close.std())
-    roc_s  = np.tanh(roc / 10)
-    sma_s  = np.tanh(((close.iloc[-1] / sma) - 1) * 10)
-
-    return float(np.clip((rsi_s + macd_s + roc_s + sma_s) / 4, -1, 1))
+    return indicators.latest_score(df["close"].to_numpy(np.float64))
 
 # ------------------------------------------------------------
 #  monitor
 # ------------------------------------------------------------
-HARD_SL_PCT     = 0.08   # 8% max loss
-TRIGGER_PROFIT  = 0.04   # 4% to activate trailing
-TRAIL_SL_PCT    = 0.03   # 3% trail below peak
 MOM_THRESHOLD   = -0.2   # optional exit on momentum
 TIMEFRAME       = "30m"   # example timeframe
 MOM_WINDOW      = 60     # number of candles to use
 
 def monitor_portfolio() -> None:
-    positions = load_json(POSITION_FILE)
+    engine    = get_engine()
+    positions = {(s if "/" in s else f"{s}/USD"): d for s, d in load_json(POSITION_FILE).items()}
     portfolio = load_json(PORTFOLIO_FILE)
     monitor   = load_json(MONITOR_FILE)
     new_pos   = {}
 
+    apply_exits(positions, portfolio, engine.drain_closed())
+    get_protection().reconcile(positions, portfolio,     # resting stops: one open-orders call
+                               exiting=engine.exiting)
+    engine.sync(positions)
+
     for symbol, data in positions.items():
-        if "/" not in symbol:
-            symbol = f"{symbol}/USD"
+        new_pos[symbol] = data
         current_price = get_price(symbol)
         if current_price is None:
-            new_pos[symbol] = data
             continue
 
-        entry_px   = data["entry_price"]
-        stop_price = data.get("stop_price", entry_px * (1 - HARD_SL_PCT))
-        peak_price = data.get("peak_price", entry_px)
-
-        if current_price > peak_price:
-            peak_price = current_price
-
-        if current_price >= entry_px * (1 + TRIGGER_PROFIT):
-            trailing_sl = peak_price * (1 - TRAIL_SL_PCT)
-            stop_price = max(stop_price, trailing_sl)
+        # ─── Stops: the polled price is a backstop for the streamed ticks ───
+        engine.on_tick(symbol, current_price)
 
-        if current_price <= stop_price:
-            sell_and_log(symbol, current_price, data, portfolio,
-                         reason=f"SL hit: price={current_price:.4f}, stop={stop_price:.4f}, peak={peak_price:.4f}")
-            continue
-
-        # ─── Momentum logic ───
+        # ─── Momentum logic (rolling candles, seeded once per position) ───
         score = None
-        try:
-            ohlcv = KRAKEN.fetch_ohlcv(symbol, timeframe=TIMEFRAME, limit=MOM_WINDOW)
-            mom_df = pd.DataFrame(ohlcv, columns=["ts", "open", "high", "low", "close", "vol"])
-            mom_df["close"] = mom_df["close"].astype(float)
-            score = momentum_score(mom_df[["open", "high", "low", "close"]])
-            logger.info("Momentum score for %s: %.2f", symbol, score)
-        except Exception as e:
-            logger.warning("Momentum fetch error for %s: %s", symbol, e)
-
-        if score is not None and score < MOM_THRESHOLD:
-            sell_and_log(symbol, current_price, data, portfolio,
-                         reason=f"Bearish momentum (score {score:.2f})")
-            continue
-
-        # Track updates
+        if not engine.exiting(symbol):
+            try:
+                score = get_buffers().score(symbol, current_price)
+                logger.info("Momentum score for %s: %.2f", symbol, score)
+            except Exception as e:
+                logger.warning("Momentum fetch error for %s: %s", symbol, e)
+
+            if score is not None and score < MOM_THRESHOLD:
+                engine.exit(symbol, current_price, reason=f"Bearish momentum (score {score:.2f})")
+
+        # Track updates (sold positions leave via apply_exits)
+        stop_price, peak_price = engine.levels(symbol) or (data.get("stop_price"), data.get("peak_price"))
         data["stop_price"] = stop_price
         data["peak_price"] = peak_price
-        new_pos[symbol] = data
+        if not engine.exiting(symbol):
+            get_protection().amend(symbol, data)         # ratchet the resting stop
 
         # Save to single monitor.json
         monitor[symbol] = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timestamp": utc_now().isoformat(),
             "price": current_price,
             "momentum_score": score,
             "stop_loss": stop_price,
             "peak_price": peak_price
         }
 
-    # Final saves
-    save_json(new_pos, POSITION_FILE)
-    save_json(portfolio, PORTFOLIO_FILE)
-    save_json(monitor, MONITOR_FILE)
+    apply_exits(new_pos, portfolio, engine.drain_closed())
+    get_buffers().retain(new_pos)
+
+    # Final saves (one commit; rows the main thread changed meanwhile are kept)
+    with state().transaction():
+        save_json(new_pos, POSITION_FILE)
+        save_json(portfolio, PORTFOLIO_FILE)
+        save_json(monitor, MONITOR_FILE)
+    save_json(engine.latency(), LATENCY_FILE)
 
 
 
 # ------------------------------------------------------------
-#  Helper to execute sells & bookkeeping
+#  Bookkeeping for exits the stop engine completed
 # ------------------------------------------------------------
-def sell_and_log(symbol: str, price: float, data: dict,
-                 portfolio: dict, reason: str):
-    """Attempt to liquidate and update portfolio; silent retry left to caller."""
-    logger.warning("Exit %s @ %.4f ‒ %s", symbol, price, reason)
-    try:
-        KRAKEN.create_market_sell_order(symbol, data["qty"])
-        usd = price * data["qty"]
+def apply_exits(positions: dict, portfolio: dict, closed: dict[str, dict]) -> None:
+    """Drop sold positions and credit their proceeds (≈, at the fill price) to USD."""
+    for symbol, exit_ in closed.items():
+        data = positions.get(symbol)
+        if data is None or data.get("filled_at") != exit_["filled_at"]:
+            continue                                   # already gone, or a newer fill
+        del positions[symbol]
+        usd = exit_["price"] * exit_["qty"]
         portfolio["USD"] = portfolio.get("USD", 0) + usd
-        logger.info("Sold %.4f %s for ≈ %.2f USD", data["qty"], symbol, usd)
-    except Exception as e:
-        logger.error("Sell error for %s: %s", symbol, e)
-        # if sell fails we keep position unchanged for next loop
-        positions = load_json(POSITION_FILE)
-        positions[symbol] = data
-        save_json(positions, POSITION_FILE)
+        logger.info("Closed %s (%s): %.4f for ≈ %.2f USD", symbol, exit_["reason"], exit_["qty"], usd)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,109 @@
+"""
+order_submit.py  -  Concurrent limit-buy submission
+---------------------------------------------------
+• `OrderSubmitter.submit()` sends a batch of limit buys together and waits
+  for all of them, so placing N orders takes about as long as one round
+  trip instead of N.  Every candidate in the batch is priced from the same
+  ranking snapshot.
+• Kraken's AddOrderBatch only accepts orders for a single pair, and buyer
+  places at most one order per pair.  A batch therefore goes out as
+  bounded concurrent AddOrder calls on a small thread pool
+  (SUBMIT_WORKERS) instead.
+• Private calls only overlap when the gateway allows it
+  (KRAKEN_NONCE_WINDOW, see exchange.py).  Otherwise they run one after
+  another on the pool and the batch takes as long as before.
+• Results come back in request order, each with the order id or the
+  exception.  A failure does not affect the other orders.  Callers reserve
+  the batch's USD before submitting and refund the failed orders after
+  collecting the results (buyer), all on their own thread.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from scripts import exchange
+from scripts.exchange import get_exchange
+
+logger = logging.getLogger(__name__)
+
+# ───────────────────────────── Config ────────────────────────────────────────
+# Orders only overlap when private calls may: set KRAKEN_NONCE_WINDOW (seconds)
+# to the nonce window configured on the API key.  At the default 0 the
+# gateway serialises private calls and a batch of N still takes N round trips.
+SUBMIT_WORKERS = 4
+
+
+@dataclass(frozen=True)
+class OrderRequest:
+    symbol: str
+    amount: float
+    price:  float
+
+
+@dataclass
+class OrderResult:
+    request:  OrderRequest
+    order_id: str | None = None
+    error:    Exception | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def order_id_of(order) -> str:
+    """The id in a create_*_order response (ccxt dict, or a bare [txid, …])."""
+    if isinstance(order, dict):
+        return order.get("id") or order.get("orderId")
+    if isinstance(order, list) and len(order) > 0:
+        return order[0]                    # Maybe Kraken returned [ order_id, … ]?
+    raise ValueError(f"Unexpected order format: {order}")
+
+
+class OrderSubmitter:
+    """Places limit buys concurrently on a bounded pool (inline when workers is None)."""
+
+    def __init__(self, workers: int | None = SUBMIT_WORKERS):
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="submit") if workers else None
+        self._warned = False
+
+    def submit(self, requests: list[OrderRequest]) -> list[OrderResult]:
+        """Place every request; one OrderResult per request, in order."""
+        if not requests:
+            return []
+        t0 = time.perf_counter()
+        if self._pool is None or len(requests) == 1:
+            results = [self._place(r) for r in requests]
+        else:
+            if exchange.NONCE_WINDOW <= 0 and not self._warned:
+                logger.warning("KRAKEN_NONCE_WINDOW is not set: private calls are serialised, "
+                               "so %d orders are placed one after another", len(requests))
+                self._warned = True
+            results = list(self._pool.map(self._place, requests))
+        logger.info("Submitted %d limit buys in %.0f ms (%d failed)", len(results),
+                    (time.perf_counter() - t0) * 1000, sum(not r.ok for r in results))
+        return results
+
+    def _place(self, req: OrderRequest) -> OrderResult:
+        try:
+            order = get_exchange().create_limit_buy_order(req.symbol, req.amount, req.price)
+            return OrderResult(req, order_id=order_id_of(order))
+        except Exception as exc:
+            return OrderResult(req, error=exc)
+
+
+_submitter = OrderSubmitter()
+
+
+def get_submitter() -> OrderSubmitter:
+    return _submitter
+
+
+def set_submitter(submitter: OrderSubmitter | None) -> None:
+    """Install a submitter (tests, backtests); None restores a fresh default one."""
+    global _submitter
+    _submitter = submitter if submitter is not None else OrderSubmitter()
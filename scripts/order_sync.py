@@ -0,0 +1,165 @@
+"""
+order_sync.py  -  Bulk reconciliation of pending buy orders
+-----------------------------------------------------------
+• One `reconcile_orders()` pass replaces the per-order fetch_order loops in
+  check_pending_orders, clean_pending_orders and sync_open_orders.  It
+  makes two exchange calls, however many orders are pending:
+    – fetch_open_orders: the live set;
+    – fetch_closed_orders(since=cursor): the cursor is the placement time
+      of the oldest pending order, so every pending order that resolved
+      since the last pass is in the result.  It takes more than one page
+      (CLOSED_PAGE orders) only after a burst.
+• Diff against pending_orders.json:
+    – closed, or cancelled with a partial fill → moved into positions.json
+      (resting stop via protective_orders, stop engine registration);
+    – cancelled / expired with nothing filled → dropped;
+    – open for longer than MAX_PENDING_AGE → cancelled (one call each)
+      and resolved by the next pass;
+    – an open buy that is not in the file → adopted;
+    – neither open nor in the closed window (rare) → one fetch_order.
+• Passes are serialised: the main thread (buyer, update_all) and the
+  monitor thread both call it.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+import ccxt                           # type: ignore
+
+from scripts.exchange import get_exchange
+from scripts.protective_orders import get_protection
+from scripts.stop_engine import get_engine
+from scripts.utilities import load_json, save_json, state, utc_now
+
+logger = logging.getLogger(__name__)
+
+# ───────────────────────────── Config ────────────────────────────────────────
+PENDING_FILE    = "data/pending_orders.json"
+POSITION_FILE   = "data/positions.json"
+MAX_PENDING_AGE = timedelta(hours=3)
+BOUNDARY        = 0.08                 # initial stop below the fill
+CURSOR_SLACK_MS = 60_000               # clock skew allowance on the closed-orders cursor
+CLOSED_PAGE     = 50                   # Kraken ClosedOrders page size
+
+_lock = threading.Lock()
+
+
+def placed_time(order_data: dict, now: datetime) -> datetime:
+    placed_iso = order_data.get("placed_at")
+    if not placed_iso:
+        return now
+    placed = datetime.fromisoformat(placed_iso)
+    return placed if placed.tzinfo else placed.replace(tzinfo=timezone.utc)
+
+
+def fetch_closed_since(kraken, since_ms: int) -> dict[str, dict]:
+    """Closed/cancelled orders since `since_ms`, by id (paged with Kraken's ofs)."""
+    closed: dict[str, dict] = {}
+    ofs = 0
+    while True:
+        page = kraken.fetch_closed_orders(since=since_ms, params={"ofs": ofs} if ofs else {})
+        closed.update((o["id"], o) for o in page)
+        if len(page) < CLOSED_PAGE:
+            return closed
+        ofs += len(page)
+
+
+def open_position(symbol: str, order: dict, order_data: dict, positions: dict, now: datetime) -> None:
+    """Book a (partially) filled buy as a position with its initial stop."""
+    filled_price = float(order.get("average") or order_data["price"])
+    qty          = order["filled"]
+    stop_price   = filled_price * (1 - BOUNDARY)
+    logger.info("%s filled at %.4f; trailing-stop initialised at %.4f",
+                symbol, filled_price, stop_price)
+    positions[symbol] = {
+        "entry_price":   filled_price,
+        "trailing_high": filled_price,
+        "stop_price":    stop_price,
+        "qty":           qty,
+        "filled_at":     now.replace(tzinfo=None).isoformat(),
+        "triggered":     False           # for new SL logic
+    }
+    get_protection().place(symbol, positions[symbol])  # resting stop on the exchange
+    get_engine().add(symbol, positions[symbol])       # local backstop from the next tick
+
+
+def reconcile_orders() -> dict[str, int]:
+    """One bulk pass over pending_orders.json; returns counts per outcome."""
+    with _lock:
+        return _reconcile()
+
+
+def _reconcile() -> dict[str, int]:
+    kraken    = get_exchange()
+    pending   = load_json(PENDING_FILE)
+    pending   = pending if isinstance(pending, list) else []
+    positions = load_json(POSITION_FILE)
+    now       = utc_now()
+    counts    = dict.fromkeys(("filled", "dropped", "cancelled", "adopted", "open", "looked_up"), 0)
+
+    try:
+        live = {o["id"]: o for o in kraken.fetch_open_orders() if o.get("side") == "buy"}
+        closed = {}
+        if pending:
+            oldest = min(placed_time(o, now) for o in pending)
+            closed = fetch_closed_since(kraken, int(oldest.timestamp() * 1000) - CURSOR_SLACK_MS)
+    except Exception as e:
+        logger.warning("Order sync skipped, exchange unavailable: %s", e)
+        return counts
+
+    updated = []
+    for order_data in pending:
+        symbol, order_id = order_data.get("symbol"), order_data.get("order_id")
+        if not order_id:
+            logger.warning("Pending order missing 'order_id': %s", order_data)
+            continue
+        order = live.pop(order_id, None) or closed.get(order_id)
+        if order is None:
+            counts["looked_up"] += 1
+            try:
+                order = kraken.fetch_order(order_id, symbol)
+            except ccxt.OrderNotFound:
+                logger.warning("Pending order %s (%s) unknown to the exchange - dropped", order_id, symbol)
+                counts["dropped"] += 1
+                continue
+            except Exception as e:
+                logger.warning("Could not fetch order %s: %s", order_id, e)
+                updated.append(order_data)
+                continue
+
+        status = order["status"]
+        if status == "closed" or (status in ("canceled", "expired") and order.get("filled")):
+            open_position(symbol, order, order_data, positions, now)
+            counts["filled"] += 1
+        elif status in ("canceled", "expired", "rejected"):
+            logger.info("Order %s is %s - removing from pending list", order_id, status)
+            counts["dropped"] += 1
+        elif now - placed_time(order_data, now) > MAX_PENDING_AGE:
+            try:
+                kraken.cancel_order(order_id, symbol)
+                logger.warning("⏱️  Pending order %s (%s) cancelled after %.1f h", order_id, symbol,
+                               (now - placed_time(order_data, now)).total_seconds() / 3600)
+                counts["cancelled"] += 1
+            except Exception as e:
+                logger.error("Cancel error %s → %s", order_id, e)
+            updated.append(order_data)         # next pass books a partial fill or drops it
+        else:
+            updated.append(order_data)
+            counts["open"] += 1
+
+    for oid, order in live.items():            # open buys placed outside this file
+        ts = order.get("timestamp")
+        placed = datetime.fromtimestamp(ts / 1000, timezone.utc) if ts else now
+        logger.info("Re-synced open order %s (%s)", oid, order.get("symbol"))
+        updated.append({"order_id": oid, "symbol": order.get("symbol", ""),
+                        "price": order.get("price"), "qty": order.get("amount"),
+                        "placed_at": placed.isoformat()})
+        counts["adopted"] += 1
+
+    with state().transaction():
+        save_json(positions, POSITION_FILE)          # only the new positions are written
+        save_json(updated, PENDING_FILE)
+    return counts
@@ -5,9 +5,10 @@ import pandas as pd
 import ccxt       # only needed for typing / errors
 import json
 
+from scripts.prices import get_snapshot
+
 CSV_PATH = "data/account_pnl.csv"
 JSON_PATH = "data/assets_usd.json"
-SLEEP    = 1.2                   # rate-limit spacing for price calls
 
 
 
@@ -19,7 +20,7 @@ def _usd_price(kr, asset: str) -> float | None:
     pair = f"{asset}/USD"
     if pair not in kr.markets:  # e.g. some small coins
         return None
-    return kr.fetch_ticker(pair)["last"]
+    return get_snapshot().get(pair)
 
 def _portfolio_value_usd(kr) -> float:
     bal = kr.fetch_balance(params={"asset_class": "currency"})["total"]
@@ -36,7 +37,6 @@ def _portfolio_value_usd(kr) -> float:
             print(f"⚠ skip {asset}: no USD pair", file=sys.stderr)
             continue
         total += qty * price
-        time.sleep(SLEEP)
     return round(total, 2)
 
 def _last_row(path):
@@ -0,0 +1,106 @@
+"""
+prices.py  -  Shared ticker snapshot
+------------------------------------
+• One bulk `fetch_tickers()` call returns the last price of every Kraken
+  pair; the result is kept in memory for PRICE_TTL seconds.
+• Single-flight refresh: when the snapshot is stale, exactly one caller hits
+  the exchange while concurrent callers (main loop, monitor thread) wait
+  for and reuse its result.
+• A failed refresh keeps serving the previous snapshot until it is
+  MAX_AGE old.  After that get() returns None, and callers treat the price
+  as unknown instead of acting on a dead one.
+• Portfolio sync, position monitor and PnL tracker all read from here, so a
+  loop over N coins costs one request instead of N requests plus N sleeps.
+"""
+
+from __future__ import annotations
+
+import time
+import logging
+import threading
+from typing import Callable
+
+from scripts.exchange import get_exchange
+
+logger = logging.getLogger(__name__)
+
+PRICE_TTL = 20.0          # seconds a snapshot is served before refreshing
+MAX_AGE   = 5 * PRICE_TTL # seconds a snapshot outlives failed refreshes
+
+
+class PriceSnapshot:
+    """Last-price cache over one bulk ticker call, refreshed at most once per TTL."""
+
+    def __init__(self, ttl: float = PRICE_TTL,
+                 exchange: Callable[[], object] = get_exchange,
+                 clock: Callable[[], float] = time.monotonic,
+                 max_age: float = MAX_AGE):
+        self.ttl       = ttl
+        self.max_age   = max_age
+        self._exchange = exchange
+        self._clock    = clock
+        self._prices: dict[str, float] = {}
+        self._fetched  = float("-inf")
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def age(self) -> float:
+        return self._clock() - self._fetched
+
+    def refresh(self, force: bool = False) -> dict[str, float]:
+        """Refresh if stale (or forced); concurrent callers share one request."""
+        started = self._clock()
+        with self._refresh_lock:
+            # someone refreshed while we waited for the lock
+            if self._fetched >= started or (not force and self.age < self.ttl):
+                return self._prices
+            try:
+                tickers = self._exchange().fetch_tickers()
+            except Exception as e:
+                if self.age < self.max_age:
+                    logger.warning("Bulk ticker fetch failed (keeping %.0fs old snapshot): %s",
+                                   self.age, e)
+                    return self._prices
+                logger.error("Bulk ticker fetch failed, snapshot expired (%.0fs old): %s",
+                             self.age, e)
+                return {}
+            self._prices = {sym: float(t["last"]) for sym, t in tickers.items()
+                            if t and t.get("last") is not None}
+            self._fetched = self._clock()
+            return self._prices
+
+    def prices(self) -> dict[str, float]:
+        if self.age >= self.ttl:
+            return self.refresh()
+        return self._prices
+
+    def get(self, symbol: str) -> float | None:
+        return self.prices().get(symbol)
+
+    def update(self, symbol: str, price: float) -> None:
+        """Overwrite one price from a fresher source (e.g. a fill or stream tick)."""
+        self._prices = {**self._prices, symbol: float(price)}
+
+
+_snapshot: PriceSnapshot | None = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot() -> PriceSnapshot:
+    """The process-wide snapshot."""
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = PriceSnapshot()
+        return _snapshot
+
+
+def set_snapshot(snapshot: PriceSnapshot | None) -> None:
+    """Install a snapshot (simulator, test double); None recreates the default lazily."""
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = snapshot
+
+
+def get_price(symbol: str) -> float | None:
+    return get_snapshot().get(symbol)
@@ -0,0 +1,168 @@
+"""
+protective_orders.py  -  Exchange-resident stop-loss orders for positions
+-------------------------------------------------------------------------
+• Once check_pending_orders confirms a fill, `place()` rests a Kraken
+  stop-loss sell for the whole position at its stop_price.  The order id
+  and level are stored in the position (stop_order_id / stop_order_price),
+  so the protection survives the bot being down.
+• `amend()` moves the order up with edit_order as the trailing stop
+  ratchets.  It only does so once the level has risen by AMEND_STEP, which
+  bounds the calls per position.  If the edit fails, the order is
+  cancelled and placed again.
+• `reconcile()` costs one fetch_open_orders per monitor loop:
+    – a position whose order has left the open set is looked up once.  If
+      it executed, the exchange sold the position, so the position is
+      dropped and the proceeds credited.  Otherwise it is placed again;
+    – a position without an order (bot was down, placement failed) gets
+      one;
+    – a stop order that no position refers to is cancelled;
+    – positions the stop engine is exiting are left alone: its sell has
+      released the stop on purpose, and a new one would reserve the coins
+      the market sell needs.
+• The stop engine still watches every tick as a backstop: for protected
+  positions it fires BACKSTOP_SLACK below the resting stop.  It first
+  `release()`s the order so the coins are free to sell.
+• Set KRAKEN_PROTECTIVE_STOPS=0 to keep stops client-side only.
+"""
+
+from __future__ import annotations
+
+import os
+import logging
+from typing import Callable
+
+import ccxt                           # type: ignore
+
+from scripts.exchange import get_exchange
+
+logger = logging.getLogger(__name__)
+
+# ───────────────────────────── Config ────────────────────────────────────────
+ENABLED        = os.getenv("KRAKEN_PROTECTIVE_STOPS", "1") != "0"
+AMEND_STEP     = 0.002       # amend once the stop has risen 0.2 %
+BACKSTOP_SLACK = 0.005       # local backstop fires 0.5 % below a resting stop
+
+
+def is_stop_order(order: dict) -> bool:
+    return order.get("side") == "sell" and (order.get("stopPrice") or order.get("triggerPrice")) is not None
+
+
+class ProtectionManager:
+    """Places, amends and reconciles one resting stop-loss per position."""
+
+    def __init__(self, enabled: bool = ENABLED):
+        self.enabled = enabled
+
+    # -- per position -----------------------------------------------------------
+    def place(self, symbol: str, data: dict) -> bool:
+        """Rest a stop-loss sell for `data` at its stop_price; records the id in `data`."""
+        if not self.enabled:
+            return False
+        stop = float(data["stop_price"])
+        try:
+            order = get_exchange().create_order(symbol, "market", "sell", data["qty"], None,
+                                                {"stopLossPrice": stop})
+        except Exception as e:
+            logger.error("Stop-loss placement failed for %s: %s", symbol, e)
+            data.pop("stop_order_id", None)
+            return False
+        data["stop_order_id"] = order["id"]
+        data["stop_order_price"] = stop
+        logger.info("Resting stop-loss %s for %s at %.4f", order["id"], symbol, stop)
+        return True
+
+    def amend(self, symbol: str, data: dict) -> None:
+        """Raise the resting order to data["stop_price"] once it is AMEND_STEP above it."""
+        oid, resting = data.get("stop_order_id"), data.get("stop_order_price")
+        if not self.enabled or oid is None or data["stop_price"] < resting * (1 + AMEND_STEP):
+            return
+        stop = float(data["stop_price"])
+        try:
+            order = get_exchange().edit_order(oid, symbol, "market", "sell", data["qty"], None,
+                                              {"stopLossPrice": stop})
+        except ccxt.OrderNotFound:
+            return                                         # gone: reconcile() decides
+        except Exception as e:
+            logger.warning("Stop amend failed for %s (%s); replacing", symbol, e)
+            try:
+                if self.release(symbol, oid) is None:
+                    self.place(symbol, data)
+            except Exception as e:
+                logger.error("Stop replace failed for %s: %s", symbol, e)
+            return
+        data["stop_order_id"] = order.get("id") or oid     # EditOrder issues a new txid
+        data["stop_order_price"] = stop
+
+    def release(self, symbol: str, order_id: str | None) -> dict | None:
+        """
+        Cancel a resting stop before selling by hand.  Returns the order if it
+        had already executed (the position is sold), else None.
+        """
+        if not order_id:
+            return None
+        kraken = get_exchange()
+        try:
+            kraken.cancel_order(order_id, symbol)
+            return None
+        except ccxt.OrderNotFound:
+            order = kraken.fetch_order(order_id, symbol)
+            return order if order.get("status") == "closed" else None
+
+    # -- per loop ---------------------------------------------------------------
+    def reconcile(self, positions: dict, portfolio: dict,
+                  exiting: Callable[[str], bool] | None = None) -> None:
+        """
+        Match resting stops to `positions` (edited in place) with one open-orders
+        call.  Symbols for which `exiting` (StopEngine.exiting) is true are skipped.
+        """
+        if not self.enabled:
+            return
+        kraken = get_exchange()
+        try:
+            resting = {o["id"]: o for o in kraken.fetch_open_orders() if is_stop_order(o)}
+        except Exception as e:
+            logger.warning("Open-order fetch failed; stops not reconciled: %s", e)
+            return
+
+        for symbol, data in list(positions.items()):
+            oid = data.get("stop_order_id")
+            if oid in resting or (exiting is not None and exiting(symbol)):
+                continue
+            if oid is not None:
+                try:
+                    order = kraken.fetch_order(oid, symbol)
+                except ccxt.OrderNotFound:
+                    order = {}
+                except Exception as e:
+                    logger.warning("Stop %s of %s not checked: %s", oid, symbol, e)
+                    continue
+                if order.get("status") == "closed":
+                    del positions[symbol]
+                    usd = float(order.get("average") or data["stop_order_price"]) * float(order["filled"])
+                    portfolio["USD"] = portfolio.get("USD", 0) + usd
+                    logger.warning("Exit %s by resting stop %s: %.4f for ≈ %.2f USD",
+                                   symbol, oid, order["filled"], usd)
+                    continue
+            self.place(symbol, data)
+
+        referenced = {d.get("stop_order_id") for d in positions.values()}
+        for oid, order in resting.items():
+            if oid not in referenced:
+                try:
+                    kraken.cancel_order(oid, order["symbol"])
+                    logger.info("Cancelled orphan stop %s (%s)", oid, order["symbol"])
+                except Exception as e:
+                    logger.warning("Orphan stop %s not cancelled: %s", oid, e)
+
+
+_manager = ProtectionManager()
+
+
+def get_protection() -> ProtectionManager:
+    return _manager
+
+
+def set_protection(manager: ProtectionManager | None) -> None:
+    """Install a manager (tests, backtests); None restores a fresh default one."""
+    global _manager
+    _manager = manager if manager is not None else ProtectionManager()
@@ -0,0 +1,243 @@
+"""
+quantizer.py  -  Laplace fit + Lloyd-Max centroids, solved or looked up
+-----------------------------------------------------------------------
+• Shared histogram layout (16 bins of 0.1 over ±0.8, decay 0.9) and the
+  batched pieces of the centroid pipeline: decayed histograms, per-row
+  asymmetric-Laplace scales, and a numba prange Lloyd-Max solver.
+• With the grid and n_centroids fixed, a row's centroids depend only on its
+  two Laplace scales (b_left, b_right).  LloydMaxLUT tabulates converged
+  centroids over a log-spaced (b_left, b_right) grid, stores the table in
+  data/cache, and answers lookups in O(1) by bilinear interpolation in
+  log-b.  Scales outside the table are solved exactly.
+• Error bound: centroids from the table stay within LUT_ERROR_BOUND (0.02,
+  four steps of the 300-point x grid) of the exact solve.  On a discrete
+  grid the Lloyd-Max fixed point jumps by whole grid steps as the
+  partitions flip, so the exact solution itself moves by up to ~0.01 when a
+  scale changes by 0.1 %; a finer table does not reduce the error.  Each
+  build measures the deviation at every cell midpoint and stores it as
+  `max_error`.
+• The fitted scales are weighted means of |bin centres|, so they always
+  lie in [0.05, 0.75] and never need the fallback.
+"""
+
+from __future__ import annotations
+
+import os
+import logging
+import threading
+
+import numpy as np
+from numba import njit, prange
+from scipy.signal import lfilter
+
+logger = logging.getLogger(__name__)
+
+# ───────────────────────────── Layout ────────────────────────────────────────
+BIN_WIDTH   = 0.1
+BIN_RANGE   = 8
+BINS        = np.arange(-BIN_RANGE * BIN_WIDTH, (BIN_RANGE + 1) * BIN_WIDTH, BIN_WIDTH)
+BIN_CENTERS = (BINS[:-1] + BINS[1:]) / 2
+N_BINS      = len(BIN_CENTERS)
+DECAY_RATE  = 0.9
+N_CENTROIDS = 8
+GRID_PTS    = 300
+DEFAULT_B   = 0.05                       # scale used for an empty half-histogram
+
+LUT_FILE    = "data/cache/lloyd_max_lut.npz"
+LUT_SIZE    = 64                         # points per axis
+LUT_ERROR_BOUND = 0.02
+B_MIN       = float(np.abs(BIN_CENTERS).min())
+B_MAX       = float(np.abs(BIN_CENTERS).max())
+
+
+def x_grid(grid_pts: int = GRID_PTS) -> np.ndarray:
+    return np.linspace(BIN_CENTERS[0], BIN_CENTERS[-1], grid_pts, dtype=np.float64)
+
+
+# ───────────────────────────── Batched pipeline ──────────────────────────────
+def decayed_histograms(ohlc: np.ndarray, decay: float = DECAY_RATE,
+                       carry: np.ndarray | None = None) -> np.ndarray:
+    """
+    (N, N_BINS) decayed histograms of each row's price deltas from its open,
+    H[i] = decay * H[i-1] + hist(row i), solved for all rows with one lfilter.
+    `carry` is H[-1] from a previous chunk.  Binning matches np.histogram
+    (last bin closed, out-of-range dropped).
+    """
+    deltas = (ohlc - ohlc[:, :1]).astype(np.float64)
+    idx = np.searchsorted(BINS, deltas, side="right") - 1
+    idx[deltas == BINS[-1]] = N_BINS - 1
+    ok = (idx >= 0) & (idx < N_BINS)
+
+    counts = np.zeros((len(ohlc), N_BINS), dtype=np.float64)
+    rows = np.broadcast_to(np.arange(len(ohlc))[:, None], idx.shape)
+    np.add.at(counts, (rows[ok], idx[ok]), 1.0)
+    if carry is None:
+        return lfilter([1.0], [1.0, -decay], counts, axis=0)
+    zi = (decay * np.asarray(carry, dtype=np.float64))[None, :]
+    return lfilter([1.0], [1.0, -decay], counts, axis=0, zi=zi)[0]
+
+
+def laplace_scales(hists: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Vector form of fit_asymmetric_laplace_from_histogram (loc=0) per row."""
+    left = BIN_CENTERS < 0
+    w_l, w_r = hists[:, left], hists[:, ~left]
+    s_l, s_r = w_l.sum(axis=1), w_r.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # row-wise sums (not a matmul) so a row's result never depends on the batch size
+        b_l = np.where(s_l > 0, (w_l * np.abs(BIN_CENTERS[left])).sum(axis=1) / s_l, DEFAULT_B)
+        b_r = np.where(s_r > 0, (w_r * np.abs(BIN_CENTERS[~left])).sum(axis=1) / s_r, DEFAULT_B)
+    return b_l, b_r
+
+
+def laplace_pmf(b_l: np.ndarray, b_r: np.ndarray, x: np.ndarray,
+                mass: np.ndarray | None = None) -> np.ndarray:
+    """(N, len(x)) normalised asymmetric-Laplace pmfs; `mass` reproduces the
+    histogram-sum scaling of the per-row code (it cancels up to rounding)."""
+    b_l, b_r = np.asarray(b_l)[:, None], np.asarray(b_r)[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        y = np.where(x < 0, 0.5 * np.exp(x / b_l) / b_l, 0.5 * np.exp(-x / b_r) / b_r)
+        if mass is not None:
+            y *= np.asarray(mass)[:, None] * BIN_WIDTH
+        return y / y.sum(axis=1, keepdims=True)         # NaN rows: empty histogram
+
+
+@njit(cache=True, parallel=True)
+def lloyd_max_rows(x, pmf, n_c, max_iter, tol):
+    """lloyd_max_quantizer() for every row of `pmf` on the shared sorted grid `x`."""
+    n_rows, n_x = pmf.shape
+    out = np.empty((n_rows, n_c))
+    for r in prange(n_rows):
+        c = np.empty(n_c)
+        for k in range(n_c):                            # np.linspace(x.min(), x.max(), n_c)
+            c[k] = x[0] + k * ((x[n_x - 1] - x[0]) / (n_c - 1))
+        c[n_c - 1] = x[n_x - 1]
+        sums = np.empty(n_c)
+        wts  = np.empty(n_c)
+        for _ in range(max_iter):
+            sums[:] = 0.0
+            wts[:]  = 0.0
+            k = 0
+            for j in range(n_x):                        # searchsorted over the mid-bounds
+                while k < n_c - 1 and (c[k] + c[k + 1]) * 0.5 < x[j]:
+                    k += 1
+                sums[k] += x[j] * pmf[r, j]
+                wts[k]  += pmf[r, j]
+            done = True
+            for k in range(n_c):
+                new = sums[k] / wts[k] if wts[k] > 0 else c[k]
+                if not abs(new - c[k]) <= tol + 1e-5 * abs(c[k]):     # np.allclose
+                    done = False
+                sums[k] = new
+            if done:
+                break
+            c[:] = sums
+        out[r] = c
+    return out
+
+
+def solve(b_l: np.ndarray, b_r: np.ndarray, grid_pts: int = GRID_PTS,
+          n_c: int = N_CENTROIDS, max_iter: int = 200, tol: float = 1e-5,
+          mass: np.ndarray | None = None) -> np.ndarray:
+    """Exact Lloyd-Max centroids for each (b_l, b_r) pair."""
+    x = x_grid(grid_pts)
+    pmf = laplace_pmf(b_l, b_r, x, mass)
+    return lloyd_max_rows(x, np.ascontiguousarray(pmf), n_c, max_iter, tol)
+
+
+# ───────────────────────────── Lookup table ──────────────────────────────────
+class LloydMaxLUT:
+    """Converged centroids on a log-spaced (b_left, b_right) grid."""
+
+    SOLVE_KW = {"max_iter": 20_000, "tol": 0.0}         # run to the fixed point
+
+    def __init__(self, table: np.ndarray, b_min: float, b_max: float,
+                 grid_pts: int, max_error: float):
+        self.table     = table                          # (size, size, n_c)
+        self.size      = table.shape[0]
+        self.b_min     = b_min
+        self.b_max     = b_max
+        self.grid_pts  = grid_pts
+        self.max_error = max_error
+        self._log_min  = np.log(b_min)
+        self._step     = (np.log(b_max) - self._log_min) / (self.size - 1)
+
+    @classmethod
+    def build(cls, size: int = LUT_SIZE, b_min: float = B_MIN, b_max: float = B_MAX,
+              grid_pts: int = GRID_PTS, n_c: int = N_CENTROIDS) -> "LloydMaxLUT":
+        axis = np.geomspace(b_min, b_max, size)
+        bl, br = np.meshgrid(axis, axis, indexing="ij")
+        table = solve(bl.ravel(), br.ravel(), grid_pts, n_c, **cls.SOLVE_KW).reshape(size, size, n_c)
+        lut = cls(table, b_min, b_max, grid_pts, max_error=0.0)
+
+        mid = np.sqrt(axis[:-1] * axis[1:])             # cell centres in log space
+        ml, mr = (m.ravel() for m in np.meshgrid(mid, mid, indexing="ij"))
+        exact = solve(ml, mr, grid_pts, n_c, **cls.SOLVE_KW)
+        lut.max_error = float(np.abs(lut.lookup(ml, mr) - exact).max())
+        if lut.max_error > LUT_ERROR_BOUND:
+            logger.warning("Lloyd-Max table error %.3g exceeds %.3g", lut.max_error, LUT_ERROR_BOUND)
+        return lut
+
+    def save(self, path: str = LUT_FILE) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, table=self.table, b_min=self.b_min, b_max=self.b_max,
+                 grid_pts=self.grid_pts, max_error=self.max_error)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = LUT_FILE) -> "LloydMaxLUT":
+        with np.load(path) as z:
+            return cls(z["table"], float(z["b_min"]), float(z["b_max"]),
+                       int(z["grid_pts"]), float(z["max_error"]))
+
+    def in_range(self, b_l: np.ndarray, b_r: np.ndarray) -> np.ndarray:
+        return ((b_l >= self.b_min) & (b_l <= self.b_max) &
+                (b_r >= self.b_min) & (b_r <= self.b_max))
+
+    def lookup(self, b_l, b_r) -> np.ndarray:
+        """(N, n_c) centroids; rows with out-of-range scales are solved exactly."""
+        b_l = np.atleast_1d(np.asarray(b_l, dtype=np.float64))
+        b_r = np.atleast_1d(np.asarray(b_r, dtype=np.float64))
+        inside = self.in_range(b_l, b_r)
+
+        fl = (np.log(np.clip(b_l, self.b_min, self.b_max)) - self._log_min) / self._step
+        fr = (np.log(np.clip(b_r, self.b_min, self.b_max)) - self._log_min) / self._step
+        il = np.minimum(fl.astype(np.intp), self.size - 2)
+        ir = np.minimum(fr.astype(np.intp), self.size - 2)
+        tl = (fl - il)[:, None]
+        tr = (fr - ir)[:, None]
+        t = self.table
+        out = ((1 - tl) * (1 - tr) * t[il, ir] + tl * (1 - tr) * t[il + 1, ir] +
+               (1 - tl) * tr * t[il, ir + 1] + tl * tr * t[il + 1, ir + 1])
+
+        if not inside.all():
+            out[~inside] = solve(b_l[~inside], b_r[~inside], self.grid_pts,
+                                 self.table.shape[2], **self.SOLVE_KW)
+        return out
+
+
+_lut: LloydMaxLUT | None = None
+_lut_lock = threading.Lock()
+
+
+def get_lut(path: str = LUT_FILE) -> LloydMaxLUT:
+    """The shared table: loaded from disk, or built once and cached there."""
+    global _lut
+    with _lut_lock:
+        if _lut is None:
+            try:
+                _lut = LloydMaxLUT.load(path)
+                if _lut.grid_pts != GRID_PTS or _lut.table.shape != (LUT_SIZE, LUT_SIZE, N_CENTROIDS):
+                    raise ValueError("table layout changed")
+            except (OSError, KeyError, ValueError):
+                logger.info("Building Lloyd-Max lookup table (%dx%d)…", LUT_SIZE, LUT_SIZE)
+                _lut = LloydMaxLUT.build()
+                _lut.save(path)
+                logger.info("Lloyd-Max table saved to %s (max interpolation error %.2e)",
+                            path, _lut.max_error)
+        return _lut
+
+
+def lookup_centroids(hists: np.ndarray) -> np.ndarray:
+    """(N, N_CENTROIDS) centroids for a stack of decayed histograms, via the table."""
+    return get_lut().lookup(*laplace_scales(hists))
@@ -5,14 +5,11 @@ import matplotlib.pyplot as plt # type: ignore
 import matplotlib.animation as animation # type: ignore
 import os
 from sklearn.decomposition import PCA # type: ignore
-from sklearn.cluster import KMeans # type: ignore
 from sklearn.metrics import mean_squared_error # type: ignore
 import matplotlib.pyplot as plt # type: ignore
 from scipy.stats import laplace
 from numba import njit
 
-from sklearn.exceptions import ConvergenceWarning
-import warnings
 
 from dotenv import load_dotenv # type: ignore
 import os
@@ -25,12 +22,17 @@ import json
 
 from pathlib import Path
 
-from ta.momentum import RSIIndicator, ROCIndicator                # pip install ta
-from ta.trend import MACD
-from ta.utils import dropna
 import numpy as np
 import pandas as pd
 import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from scripts import candle_store, indicators, quantizer, rank_state
+from scripts.first_passage import band_tree, first_outside, next_true
+from scripts.kmeans import align, kmeans
+from scripts.quantizer import decayed_histograms, laplace_scales, lookup_centroids
 
 
 # ───────────────────────────── Logging ─────────────────────────────
@@ -44,6 +46,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ───────────────────────────── Config ──────────────────────────────
+load_dotenv()
+RANK_WORKERS = int(os.getenv("RANK_WORKERS", "0") or 0) or (os.cpu_count() or 1)
+
 
 # Histogram setup
 bin_width = 0.1
@@ -91,29 +97,22 @@ histogram_vectors = []
 
 BOUNDARY = 0.08 #   +/- 8%
 
+TARGET_ROWS = 700   # rows of history analysed per timeframe (tail of the store)
+
 
-# efficient momentum computing
+# efficient momentum computing (scripts/indicators.py)
 def add_ta_columns(df: pd.DataFrame) -> pd.DataFrame:
     """Returns df with cached rsi, macd_diff, roc, sma20 columns."""
     if {"rsi","macd_diff","roc","sma20"}.issubset(df.columns):
         return df                                                   # already done
 
-    close = df["close"]
-
-    df["rsi"]       = RSIIndicator(close, 14).rsi()
-    macd            = MACD(close)
-    df["macd_diff"] = macd.macd() - macd.macd_signal()
-    df["roc"]       = close.pct_change(5) * 100          # ≈ ROC
-    df["sma20"]     = close.rolling(20).mean()
-
+    raw = indicators.momentum_raw(df["close"].to_numpy(np.float64))
+    df["rsi"], df["macd_diff"], df["roc"], df["sma20"] = raw.T
     return df
 
 def momentum_from_row(row, close_std) -> float:
-    rsi_s  = (row.rsi - 50) / 50
-    macd_s = np.tanh(row.macd_diff / close_std)
-    roc_s  = np.tanh(row.roc / 10)
-    sma_s  = np.tanh(((row.close / row.sma20) - 1) * 10)
-    return float(np.clip((rsi_s + macd_s + roc_s + sma_s) / 4, -1, 1))
+    raw = np.array([[row.rsi, row.macd_diff, row.roc, row.sma20]])
+    return float(indicators.momentum_score(raw, np.array([row.close]), close_std)[0])
 
 def compute_momentum_score(df: pd.DataFrame) -> float:
     df = add_ta_columns(df)
@@ -165,90 +164,74 @@ def lloyd_max_quantizer(x, pdf, n_centroids, max_iter=200, tol=1e-5):
 
 def get_centroids(
         df: pd.DataFrame,
-        step: int = 5,
+        step: int = 1,
         grid_pts: int = 300,
         max_iter: int = 200,
-) -> list[np.ndarray]:
+        tol: float = 1e-5,
+        exact: bool = False,
+) -> np.ndarray:
     """
-    Return list-of-centroid arrays (len == len(df)).
-    Much faster than the naïve per-row Lloyd-Max loop.
+    Return a contiguous (len(df), n_centroids) array of Lloyd-Max centroids,
+    one row per candle.  Histograms and Laplace fits are computed for all
+    rows at once; centroids come from the precomputed (b_left, b_right)
+    table unless `exact` (batched solve).  `step` > 1 reuses every step-th
+    row's centroids.
     """
     if df.empty or not {"open", "high", "low", "close"}.issubset(df.columns):
         logger.warning("get_centroids: missing columns or empty DF")
-        return []
-
-    close_arr  = df[["open", "high", "low", "close"]].to_numpy(dtype=np.float32)
-    N          = len(df)
-    hist_comb  = np.zeros(n_bins, dtype=np.float64)
-    centroids_prev = np.full(n_centroids, np.nan, dtype=np.float32)
-
-    # pre-allocate result
-    result = [None] * N
-
-    # fixed grid for Lloyd-Max
-    x_grid = np.linspace(bin_centers[0], bin_centers[-1], grid_pts, dtype=np.float64)
-
-    for i in range(N):
-        # vectorised delta calculation for 4 prices at row i
-        base = close_arr[i, 0]                          # open price
-        hist_comb *= decay_rate
-        deltas = close_arr[i] - base
-        hist_comb += np.histogram(deltas, bins=bins)[0]
-
-        # recompute only every `step` rows (plus first row)
-        if i == 0 or i % step == 0:
-            b_l, b_r = fit_asymmetric_laplace_from_histogram(
-                bin_centers, hist_comb, loc=0.0
-            )
-            y = np.where(
-                    x_grid < 0,
-                    0.5 * np.exp(x_grid / b_l) / b_l,
-                    0.5 * np.exp(-x_grid / b_r) / b_r
-                )
-            y *= hist_comb.sum() * bin_width
-
-            centroids_prev = lloyd_max_quantizer(
-                x_grid, y, n_centroids, max_iter=max_iter
-            )
+        return np.empty((0, n_centroids))
 
-        # reuse last-computed centroids
-        result[i] = centroids_prev
+    ohlc  = df[["open", "high", "low", "close"]].to_numpy(dtype=np.float32)
+    hists = decayed_histograms(ohlc)[::step]            # i == 0 or i % step == 0
 
-    return result
+    if exact or grid_pts != quantizer.GRID_PTS:
+        b_l, b_r = laplace_scales(hists)
+        cents = quantizer.solve(b_l, b_r, grid_pts, n_centroids, max_iter, tol,
+                                mass=hists.sum(axis=1))
+    else:
+        cents = lookup_centroids(hists)
 
+    if step == 1:
+        return cents
+    return np.ascontiguousarray(cents[np.arange(len(df)) // step])
 
 
 
 
-def safe_cluster(series, k=8):
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore", ConvergenceWarning)
 
-        # Convert series to array and filter out all-zero vectors
-        vectors = np.stack(series.to_numpy())
-        non_zero_mask = ~np.all(vectors == 0, axis=1)
-        filtered_vectors = vectors[non_zero_mask]
+def safe_cluster(series, k=8, init=None):
+    """
+    Cluster centroid vectors, ignoring all-zero rows and capping k by the
+    samples.  `init` (the previous cycle's centres) warm-starts the fit and
+    keeps cluster numbers stable from one cycle to the next.
+    """
+    # Convert series to array and filter out all-zero vectors
+    vectors = series if isinstance(series, np.ndarray) else np.stack(series.to_numpy())
+    non_zero_mask = ~np.all(vectors == 0, axis=1)
+    filtered_vectors = vectors[non_zero_mask]
 
-        n_samples = len(filtered_vectors)
-        if n_samples == 0:
-            #print("⚠️ Skipping clustering: all centroid vectors are zero.")
-            dummy_labels = np.full(len(series), -1)
-            return dummy_labels, None, lambda x: np.full(len(x), -1)
+    n_samples = len(filtered_vectors)
+    if n_samples == 0:
+        #print("⚠️ Skipping clustering: all centroid vectors are zero.")
+        dummy_labels = np.full(len(series), -1)
+        return dummy_labels, None, lambda x: np.full(len(x), -1)
 
-        if n_samples < k:
-            #print(f"⚠️ Reducing k: only {n_samples} valid samples (k={k} → {n_samples})")
-            k = n_samples
+    if n_samples < k:
+        #print(f"⚠️ Reducing k: only {n_samples} valid samples (k={k} → {n_samples})")
+        k = n_samples
 
-        # Fit on filtered vectors
-        kmeans = KMeans(n_clusters=k, random_state=42)
-        labels = np.full(len(series), -1)
-        labels[non_zero_mask] = kmeans.fit_predict(filtered_vectors)
+    # Fit on filtered vectors
+    fit = kmeans(filtered_vectors, k, init=init)
+    if init is not None and len(init) != k:
+        fit.cluster_centers_ = align(init, fit.cluster_centers_)
+        fit.labels_ = fit.predict(filtered_vectors)
+    labels = np.full(len(series), -1)
+    labels[non_zero_mask] = fit.labels_
 
-        def quantize_centroids(new_centroids):
-            new_centroids = np.atleast_2d(new_centroids)
-            return kmeans.predict(new_centroids)
+    def quantize_centroids(new_centroids):
+        return fit.predict(new_centroids)
 
-        return labels, kmeans, quantize_centroids
+    return labels, fit, quantize_centroids
 
 
 
@@ -264,25 +247,99 @@ def add_momentum_columns(df: pd.DataFrame) -> pd.DataFrame:
     if "mom_score" in df.columns:      # already computed
         return df
 
-    close = df["close"]
-    df["rsi"]       = RSIIndicator(close, 14).rsi()
-    macd            = MACD(close)
-    df["macd_diff"] = macd.macd() - macd.macd_signal()
-    df["roc"]       = close.pct_change(5) * 100
-    df["sma20"]     = close.rolling(20).mean()
-
-    std = close.std()
-    mom = (
-        (df["rsi"]  - 50) / 50 +
-        np.tanh(df["macd_diff"] / std) +
-        np.tanh(df["roc"] / 10) +
-        np.tanh(((close / df["sma20"]) - 1) * 10)
-    ) / 4
-    df["mom_score"] = np.clip(mom, -1, 1)
+    raw, mom = indicators.score_series(df["close"].to_numpy(np.float64))
+    df["rsi"], df["macd_diff"], df["roc"], df["sma20"] = raw.T
+    df["mom_score"] = mom
     return df
 
 
 # 2. Numba-accelerated core loop (pure NumPy arrays)
+#    Most trades exit within a few dozen bars, so each entry is scanned
+#    forward for SCAN_AHEAD bars as before; trades still open after that are
+#    resolved with first-passage queries (scripts/first_passage.py), which
+#    keeps a series O(n log n) instead of O(n²).  Below FIRST_PASSAGE_ROWS
+#    (the 700-row ranking windows) building the tree costs more than it
+#    saves, so short series are scanned to the end.
+SCAN_AHEAD = 64
+FIRST_PASSAGE_ROWS = 2048
+
+
+@njit(cache=True)
+def _momentum_exits(mom, mom_win):
+    """next_true() of the momentum-exit bars (mom < 0 once mom_win bars in)."""
+    n        = mom.size
+    mom_exit = np.zeros(n, dtype=np.bool_)
+    for j in range(max(mom_win, 0), n):
+        mom_exit[j] = mom[j] < 0
+    return next_true(mom_exit)
+
+
+@njit(cache=True, fastmath=True)
+def _exit_price(mid_px, band, next_mom, i, entry_px, sl_pct, trig_pct):
+    """Exit price of the trade entered at row i (the last mid if it never exits)."""
+    n          = mid_px.size
+    sl_price   = entry_px * (1.0 - sl_pct)
+    trig_px    = entry_px * (1.0 + trig_pct)
+    sl_raised  = False
+
+    j    = i + 1
+    stop = min(n, i + 1 + SCAN_AHEAD)
+    while j < stop:
+        cur_px = mid_px[j]
+
+        # raise SL once +2 %
+        if (not sl_raised) and cur_px >= trig_px:
+            sl_price  = trig_px
+            sl_raised = True
+
+        # momentum exit
+        if sl_raised and next_mom[j] == j:
+            return cur_px
+
+        # hard SL
+        if cur_px <= sl_price:
+            return cur_px
+
+        j += 1
+
+    if j >= n:
+        return mid_px[-1]
+    if not sl_raised:
+        # hard SL or +2 % trigger, whichever comes first
+        j = first_outside(mid_px, band, j, n, sl_price, trig_px)
+        if j < 0:
+            return mid_px[-1]
+        if not mid_px[j] >= trig_px:
+            return mid_px[j]
+    # SL at the trigger: a touch before the next momentum exit?
+    j_mom = next_mom[j]
+    j_sl  = first_outside(mid_px, band, j, j_mom if j_mom >= 0 else n, trig_px, np.nan)
+    if j_sl >= 0:
+        return mid_px[j_sl]
+    if j_mom >= 0:
+        return mid_px[j_mom]
+    return mid_px[-1]
+
+
+@njit(cache=True, fastmath=True)
+def _scan_exit_price(mid_px, mom, mom_win, i, entry_px, sl_pct, trig_pct):
+    """_exit_price by a plain forward scan to the end (short series)."""
+    n         = mid_px.size
+    sl_price  = entry_px * (1.0 - sl_pct)
+    trig_px   = entry_px * (1.0 + trig_pct)
+    sl_raised = False
+    for j in range(i + 1, n):
+        cur_px = mid_px[j]
+        if (not sl_raised) and cur_px >= trig_px:
+            sl_price  = trig_px
+            sl_raised = True
+        if sl_raised and j >= mom_win and mom[j] < 0:
+            return cur_px
+        if cur_px <= sl_price:
+            return cur_px
+    return mid_px[-1]
+
+
 @njit(cache=True, fastmath=True)
 def _simulate(mid_px, clusters, mom, buy_fee,
               sl_pct, trig_pct, mom_win):
@@ -291,34 +348,17 @@ def _simulate(mid_px, clusters, mom, buy_fee,
     successes    = np.zeros(n, dtype=np.int32)
     totals       = np.zeros(n, dtype=np.int32)
 
+    short    = n < FIRST_PASSAGE_ROWS
+    band     = band_tree(mid_px[:0] if short else mid_px)
+    next_mom = _momentum_exits(mom[:0] if short else mom, mom_win)
+
     for i in range(n - 1):
         c          = clusters[i]
         entry_px   = mid_px[i] * (1.0 + buy_fee)
-        sl_price   = entry_px * (1.0 - sl_pct)
-        sl_raised  = False
-        exit_px    = mid_px[-1]      # fallback
-
-        j = i + 1
-        while j < n:
-            cur_px = mid_px[j]
-
-            # raise SL once +2 %
-            if (not sl_raised) and cur_px >= entry_px * (1.0 + trig_pct):
-                sl_price  = entry_px * (1.0 + trig_pct)
-                sl_raised = True
-
-            # momentum exit
-            if sl_raised and j - mom_win >= 0:
-                if mom[j] < 0:        # mom score already pre-computed
-                    exit_px = cur_px
-                    break
-
-            # hard SL
-            if cur_px <= sl_price:
-                exit_px = cur_px
-                break
-
-            j += 1
+        if short:
+            exit_px = _scan_exit_price(mid_px, mom, mom_win, i, entry_px, sl_pct, trig_pct)
+        else:
+            exit_px = _exit_price(mid_px, band, next_mom, i, entry_px, sl_pct, trig_pct)
 
         # bookkeeping
         totals[c] += 1
@@ -361,62 +401,24 @@ def find_good_clusters_momentum(df: pd.DataFrame,
 
 
 
-def analyze_coins(
-        coin_folder: Path,
-        n_clusters: int = 8,
-        step_centroids: int = 5,           # reuse Lloyd-Max every 5 rows
-) -> dict[str, float] | None:
-    """
-    Return {'score': final_ratio, 'price': latest_close}
-    """
-    symbol = coin_folder.name.replace("_", "/").upper()
-    logger.info("Processing %s …", symbol)
-
-    latest_price: float | None = None
+def latest_price(coin_folder: Path) -> float | None:
+    """Close of the freshest candle: the 1-minute series first, then any timeframe."""
+    for tf in ["1m", *MAX_LOOKBACK_FOR_720_HOURS]:
+        last = candle_store.read(str(coin_folder / f"{tf}{candle_store.EXTENSION}"), tail=1)
+        if len(last):
+            return float(last["close"][-1])
+    return None
 
-    # 1-minute file for freshest price
-    one_min_fp = coin_folder / "1m.csv"
-    if one_min_fp.exists():
-        latest_price = pd.read_csv(
-            one_min_fp, usecols=["close"], dtype={"close": "float32"}
-        ).iloc[-1, 0]
 
+def combine(symbol: str, price: float | None, currents) -> dict[str, float] | None:
+    """Reduce per-timeframe (label, succ, trades) results to {'score', 'price'}."""
     total_succ = total_trades = 0
-
-    for tf in MAX_LOOKBACK_FOR_720_HOURS:         # deterministic order
-        fp = coin_folder / f"{tf}.csv"
-        if not fp.exists():
-            continue
-
-        df = pd.read_csv(fp,
-                         usecols=["timestamp", "open", "high", "low", "close"],
-                         parse_dates=["timestamp"],
-                         dtype={"open": "float32", "high": "float32",
-                                "low": "float32", "close": "float32"})
-
-        if df.empty:
+    for current in currents:
+        if current is None:
             continue
-
-        if latest_price is None:
-            latest_price = float(df["close"].iloc[-1])
-
-        # ---------- fast pipeline -----------------------------------
-        df = df[["open", "high", "low", "close"]].dropna()
-
-        df["laplace_centroids"] = get_centroids(df, step=step_centroids)
-
-        df["laplace_cluster"], _, _ = safe_cluster(df["laplace_centroids"], k=8)
-
-
-        _, summary = find_good_clusters_momentum(df, buy_fee=0.0025)
-        cur_bin = int(df["laplace_cluster"].iloc[-1])
-
-        row = summary.loc[summary["cluster"] == cur_bin]
-        if row.empty:
-            continue
-
-        total_succ   += int(row["successes"].iloc[0])
-        total_trades += int(row["total"].iloc[0])
+        _, succ, trades = current
+        total_succ   += succ
+        total_trades += trades
 
     if total_trades == 0:
         logger.warning("%s skipped - no valid trades", symbol)
@@ -428,30 +430,135 @@ def analyze_coins(
 
     return {
         "score": round(final_ratio, 4),
-        "price": float(latest_price) if latest_price is not None else np.nan,
+        "price": float(price) if price is not None else np.nan,
     }
 
 
+def analyze_coins(
+        coin_folder: Path,
+        state_dir: str = rank_state.STATE_DIR,
+        now_ms: int | None = None,
+) -> dict[str, float] | None:
+    """
+    Return {'score': final_ratio, 'price': latest_close}
+
+    Each timeframe's saved ranking state is advanced over the candles that
+    closed since the last cycle only (see scripts/rank_state.py).
+    """
+    symbol = coin_folder.name.replace("_", "/").upper()
+    logger.info("Processing %s …", symbol)
+
+    currents = [rank_state.update_series(str(coin_folder), tf, state_dir, now_ms)
+                for tf in MAX_LOOKBACK_FOR_720_HOURS]          # deterministic order
+    return combine(symbol, latest_price(coin_folder), currents)
+
 
+# ─────────────────────────── worker pool ───────────────────────────
+_pool: ProcessPoolExecutor | None = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+_thread_limits = None
+
+
+def _warm_worker(lut: quantizer.LloydMaxLUT) -> None:
+    """
+    Pool initializer: adopt the parent's centroid table, pin numba/BLAS/OpenMP
+    to one thread (the pool is the parallelism) and compile or load every
+    kernel update_series runs: a short rank_state.replay() goes through the
+    histograms, the momentum recursions, the k-means fits (first fit and a
+    block refit) and the _walk/_current kernels.
+    """
+    global _thread_limits
+    from threadpoolctl import threadpool_limits          # ships with scikit-learn
+    import numba
+
+    numba.set_num_threads(1)
+    _thread_limits = threadpool_limits(1)
+    quantizer._lut = lut
+
+    n = rank_state.MIN_FIT_ROWS + rank_state.REFIT_EVERY
+    rng = np.random.default_rng(0)
+    close = np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    recs = np.zeros(n, dtype=candle_store.record_dtype())
+    recs["timestamp"] = np.arange(n) * 900_000
+    recs["open"], recs["close"] = np.r_[close[0], close[:-1]], close
+    recs["high"] = np.maximum(recs["open"], close) * 1.01
+    recs["low"] = np.minimum(recs["open"], close) * 0.99
+    rank_state.replay(recs, 900_000)
+    quantizer.solve(np.array([0.01]), np.array([0.01]))      # out-of-range path
+
+
+def get_pool(workers: int = RANK_WORKERS) -> ProcessPoolExecutor:
+    """The persistent ranking pool, (re)started when the worker count changes."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("forkserver"),   # no inherited threads
+                initializer=_warm_worker,
+                initargs=(quantizer.get_lut(),),
+            )
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool, _pool_workers = None, 0
 
 
 # ─────────────────────────── rank all symbols ──────────────────────
-def rank_coins() -> None:
+def rank_coins(
+        workers: int = RANK_WORKERS,
+        hist_dir: Path | None = None,
+        output: Path | None = None,
+        state_dir: str = rank_state.STATE_DIR,
+) -> None:
+    """
+    Score every symbol in data/historical into ranked_coins.json.
+
+    With workers > 1 each symbol × timeframe series is advanced in the warm
+    process pool (series states are independent files) and the results are
+    reduced per symbol; workers <= 1 runs analyze_coins serially.
+    """
     THIS_DIR = Path(__file__).resolve().parent          #  …/neptune/scripts
     ROOT = THIS_DIR.parent                          #  …/neptune
-    HIST   = ROOT / "data" / "historical"
-    OUTPUT = ROOT / "data" / "ranked_coins.json"
+    HIST   = hist_dir or ROOT / "data" / "historical"
+    OUTPUT = output or ROOT / "data" / "ranked_coins.json"
 
+    coin_dirs = [d for d in sorted(HIST.iterdir()) if d.is_dir()]
     ranking: dict[str, dict[str, float]] = {}
-
-    for coin_dir in sorted(HIST.iterdir()):
-        if not coin_dir.is_dir():
-            continue
-        result = analyze_coins(coin_dir)
+    now_ms = int(time.time() * 1000)                # one "closed" cutoff for every series
+
+    if workers <= 1:
+        results = {d: analyze_coins(d, state_dir, now_ms) for d in coin_dirs}
+    else:
+        pool = get_pool(workers)
+        jobs = {d: [pool.submit(rank_state.update_series, str(d), tf, state_dir, now_ms)
+                    for tf in MAX_LOOKBACK_FOR_720_HOURS]
+                for d in coin_dirs}
+        results = {}
+        for d, futures in jobs.items():
+            symbol = d.name.replace("_", "/").upper()
+            currents = []
+            for tf, fut in zip(MAX_LOOKBACK_FOR_720_HOURS, futures):
+                try:
+                    currents.append(fut.result())
+                except Exception as e:
+                    logger.error("%s %s ranking failed: %s", symbol, tf, e)
+                    currents.append(None)
+            results[d] = combine(symbol, latest_price(d), currents)
+
+    for coin_dir, result in results.items():
         if result:
             symbol = coin_dir.name.replace("_", "/").upper()
             ranking[symbol] = result
-        time.sleep(0.1)          # polite delay
 
     ranking_sorted = dict(
         sorted(ranking.items(), key=lambda x: x[1]["score"], reverse=True)
@@ -463,4 +570,4 @@ def rank_coins() -> None:
 
 # manual run
 if __name__ == "__main__":
-    rank_coins()
\ No newline at end of file
+    rank_coins()
@@ -0,0 +1,359 @@
+"""
+rank_state.py  -  Incremental ranking state per symbol/timeframe
+----------------------------------------------------------------
+• One SeriesState per <symbol>/<tf> persisted in data/rank_state: the
+  histogram and momentum carries, the cluster centres and momentum scale of
+  the last fit, per-cluster success/total tallies of closed trades, and the
+  last WINDOW rows (centroid, label, open-trade levels) behind a watermark
+  timestamp.
+• `advance()` consumes only candles newer than the watermark: centroids via
+  the Lloyd-Max table, momentum via O(1) updates, and the trade rules of
+  rank._simulate applied to the trades that are still open.  The clusters
+  are refit on the current window at the first row of every REFIT_EVERY-row
+  block, after which the closed-trade tallies are recounted under the new
+  labels.
+• current() depends on the last SPAN rows only, so it equals a fresh state
+  fed those rows, however the series was chunked or wherever it started:
+  blocks are counted on the timestamp grid (ts // period), every fit is a
+  cold k-means++ fit from a fixed seed, and the histogram/momentum carries
+  restart every EPOCH rows, a row's features coming from the carry started
+  at the beginning of the epoch before its own.  (SPAN assumes gap-free
+  candles.)
+• Rows between two refits share the centres and the momentum scale, so
+  their labels and scores are computed in one batch.  The numba `_walk`
+  then goes through them in order, sliding the window and resolving the
+  open trades.  `replay()` records current() after every row, which is
+  what the backtester reads.
+• `update_series()` feeds closed candles only, so the forming candle is
+  consumed once, with its final close, on the cycle after it closes; a
+  missing or stale state is rebuilt from the last SPAN rows.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import logging
+
+import numpy as np
+from numba import njit
+
+from scripts import candle_store
+from scripts.kmeans import align, kmeans
+from scripts.indicators import MomentumState, momentum_score
+from scripts.quantizer import N_BINS, N_CENTROIDS, decayed_histograms, lookup_centroids
+from scripts.resample import period_ms
+
+logger = logging.getLogger(__name__)
+
+# ───────────────────────────── Config ────────────────────────────────────────
+STATE_DIR    = "data/rank_state"
+WINDOW       = 700            # rows whose trades are tallied (= rank.TARGET_ROWS)
+REFIT_EVERY  = 50             # rows per refit block
+MIN_FIT_ROWS = 50             # rows needed before the first fit
+EPOCH        = 150            # rows between carry restarts (0.9**150 ~ 1e-7 of the histogram left)
+N_CLUSTERS   = 8
+SPAN         = 2 * WINDOW + REFIT_EVERY      # rows current() depends on (momentum scale of old fits)
+
+BUY_FEE      = 0.0025
+STOP_LOSS    = 0.08
+TRIGGER      = 0.02
+MOM_WINDOW   = 60
+
+OPEN = -1                     # outcome of a trade still running
+_NO_EXITS = np.empty(0)       # _walk's exits when the exit prices are not kept
+
+_ROW_FIELDS = {               # per-row window arrays
+    "ts": np.int64, "close": np.float64, "mid": np.float64, "gidx": np.int64,
+    "label": np.int32, "entry": np.float64, "sl": np.float64,
+    "raised": np.bool_, "outcome": np.int8,
+}
+
+
+def nearest(centers: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """Index of the closest centre for each row of x (KMeansFit.predict)."""
+    d = ((x[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+    return d.argmin(axis=1).astype(np.int32)
+
+
+def fit_centers(x: np.ndarray, k: int = N_CLUSTERS, init: np.ndarray | None = None) -> np.ndarray:
+    """safe_cluster's fit: all-zero vectors ignored, k capped by samples, warm-started from `init`."""
+    x = x[~np.all(x == 0, axis=1)]
+    if len(x) == 0:
+        return np.empty((0, x.shape[1]))
+    k = min(k, len(x))
+    centers = kmeans(x, k, init=init).cluster_centers_
+    if init is not None and len(init) != k:
+        centers = align(init, centers)
+    return centers
+
+
+class SeriesState:
+    """Ranking state of one candle series with `period`-ms candles, advanced row by row."""
+
+    def __init__(self, period: int):
+        self.period    = int(period)
+        self.n         = 0                     # rows consumed since the origin
+        self.watermark: int | None = None      # timestamp of the last consumed row
+        self.fit_block = -1                    # refit block of the last cluster fit
+        self.std       = np.nan                # momentum MACD scale of the last fit
+        self.epoch     = -1                    # carry epoch of the last row
+        self.carries   = [_carry(), _carry()]  # started at the epoch before / at `epoch`
+        self.centers   = np.empty((0, N_CENTROIDS))
+        self.succ      = np.zeros(N_CLUSTERS, dtype=np.int64)
+        self.tot       = np.zeros(N_CLUSTERS, dtype=np.int64)
+        self.cents     = np.empty((0, N_CENTROIDS))
+        self.rows      = {k: np.empty(0, dtype=t) for k, t in _ROW_FIELDS.items()}
+
+    # -- persistence ------------------------------------------------------------
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        meta = {"period": self.period, "n": self.n, "watermark": self.watermark,
+                "fit_block": self.fit_block, "std": self.std, "epoch": self.epoch,
+                "mom": [c[1].to_dict() for c in self.carries]}
+        hists = {f"hist_{i}": c[0] if c[0] is not None else np.empty(0)
+                 for i, c in enumerate(self.carries)}
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, meta=np.array(json.dumps(meta)), centers=self.centers,
+                 succ=self.succ, tot=self.tot, cents=self.cents, **hists,
+                 **{f"row_{k}": v for k, v in self.rows.items()})
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SeriesState":
+        with np.load(path) as z:
+            meta = json.loads(str(z["meta"]))
+            st = cls(meta["period"])
+            st.centers, st.succ, st.tot, st.cents = z["centers"], z["succ"], z["tot"], z["cents"]
+            st.carries = [[z[f"hist_{i}"] if len(z[f"hist_{i}"]) else None,
+                           MomentumState.from_dict(mom)] for i, mom in enumerate(meta["mom"])]
+            st.rows = {k: z[f"row_{k}"] for k in _ROW_FIELDS}
+        st.n, st.watermark, st.fit_block = meta["n"], meta["watermark"], meta["fit_block"]
+        st.std, st.epoch = meta["std"], meta["epoch"]
+        return st
+
+    # -- update -----------------------------------------------------------------
+    def advance(self, recs: np.ndarray, trace: list | None = None, plan: list | None = None) -> int:
+        """
+        Consume candle_store records newer than the watermark.  Returns rows added.
+        With `trace`, the current() result after each new row is appended to it.
+        With `plan`, every walked segment is appended as (a, b, mid, labels,
+        momentum, refit labels of rows lo..b or None): everything the walk
+        used that does not depend on the trade parameters (scripts/sweep.py).
+        """
+        if self.watermark is not None:
+            recs = recs[recs["timestamp"] > self.watermark]
+        m = len(recs)
+        if m == 0:
+            return 0
+
+        ohlc  = np.column_stack([recs[c] for c in ("open", "high", "low", "close")]).astype(np.float32)
+        ts    = recs["timestamp"].astype(np.int64)
+        hists, raw = self._features(ohlc, ts)
+        close = ohlc[:, 3].astype(np.float64)
+        new = {
+            "ts":      ts,
+            "close":   close,
+            "mid":     np.median(ohlc.astype(np.float64), axis=1),
+            "gidx":    np.arange(self.n, self.n + m, dtype=np.int64),
+            "label":   np.full(m, -1, dtype=np.int32),
+            "entry":   np.zeros(m), "sl": np.zeros(m),
+            "raised":  np.zeros(m, dtype=bool),
+            "outcome": np.full(m, OPEN, dtype=np.int8),
+        }
+        cents = np.concatenate([self.cents, lookup_centroids(hists)])
+        rows  = {k: np.concatenate([self.rows[k], new[k]]) for k in _ROW_FIELDS}
+        block = rows["ts"] // (self.period * REFIT_EVERY)
+
+        lo = 0
+        t, end = len(self.rows["ts"]), len(rows["ts"])
+        mid = rows["mid"]
+        rows["entry"][t:] = mid[t:] * (1.0 + BUY_FEE)
+        rows["sl"][t:] = rows["entry"][t:] * (1.0 - STOP_LOSS)
+        while t < end:
+            # rows up to the next refit share the centres and momentum scale
+            if self.fit_block < 0:
+                stop = max(t, lo + MIN_FIT_ROWS - 1)
+            else:                                       # first row of the next block
+                moved = np.flatnonzero(block[t:] != self.fit_block)
+                stop = t + int(moved[0]) if len(moved) else end - 1
+            stop = min(stop, end - 1)
+            seg = slice(t, stop + 1)
+            if len(self.centers):
+                rows["label"][seg] = nearest(self.centers, cents[seg])
+            first = t - (end - m)
+            mom = momentum_score(raw[first:first + stop + 1 - t], rows["close"][seg], self.std)
+            out = np.empty((stop + 1 - t if trace is not None else 0, 3), dtype=np.int64)
+            if plan is not None:
+                plan.append([t, stop, mid[seg], rows["label"][seg].copy(), mom, None])
+            lo = _walk(rows["label"], mid, rows["entry"], rows["sl"], rows["raised"],
+                       rows["outcome"], rows["gidx"], mom, self.succ, self.tot, lo, t, stop, out,
+                       TRIGGER, MOM_WINDOW, _NO_EXITS)
+            self.n += stop + 1 - t
+            if ((self.fit_block < 0 and stop - lo + 1 >= MIN_FIT_ROWS) or
+                    (self.fit_block >= 0 and block[stop] != self.fit_block)):
+                self._refit(rows, cents, lo, stop, int(block[stop]))
+                if trace is not None:                   # the refit relabelled row `stop`
+                    out[-1] = self._current(rows, lo, stop) or (-1, 0, 0)
+                if plan is not None and len(self.centers):
+                    plan[-1][-1] = rows["label"][lo:stop + 1].copy()
+            if trace is not None:
+                trace.extend(tuple(r) if r[0] >= 0 else None for r in out.tolist())
+            t = stop + 1
+
+        self.rows  = {k: v[lo:] for k, v in rows.items()}
+        self.cents = cents[lo:]
+        self.watermark = int(self.rows["ts"][-1])
+        return m
+
+    def _features(self, ohlc, ts) -> tuple[np.ndarray, np.ndarray]:
+        """Decayed histograms and raw momentum rows of new rows, from the carry of the epoch before theirs."""
+        epoch = ts // (self.period * EPOCH)
+        hists = np.empty((len(ts), N_BINS))
+        raw   = np.empty((len(ts), 4))
+        start = 0
+        for stop in [*(np.flatnonzero(np.diff(epoch)) + 1).tolist(), len(ts)]:
+            if epoch[start] != self.epoch:              # the older carry retires
+                self.carries = [self.carries[1], _carry()]
+                self.epoch = int(epoch[start])
+            seg = slice(start, stop)
+            for i, carry in enumerate(self.carries):
+                h = decayed_histograms(ohlc[seg], carry=carry[0])
+                r = carry[1].update_many(ohlc[seg, 3].astype(np.float64))
+                carry[0] = h[-1].copy()
+                if i == 0:
+                    hists[seg], raw[seg] = h, r
+            start = stop
+        return hists, raw
+
+    def _refit(self, rows, cents, lo, t, block) -> None:
+        window = slice(lo, t + 1)
+        self.centers = fit_centers(cents[window])
+        self.std = float(np.std(rows["close"][window], ddof=1))
+        self.fit_block = block
+        if not len(self.centers):
+            return
+        labels = nearest(self.centers, cents[window])
+        rows["label"][window] = labels
+        outcome = rows["outcome"][window]
+        done = outcome != OPEN
+        self.tot  = np.bincount(labels[done], minlength=N_CLUSTERS).astype(np.int64)
+        self.succ = np.bincount(labels[done], weights=outcome[done] == 1,
+                                minlength=N_CLUSTERS).astype(np.int64)
+
+    # -- result -----------------------------------------------------------------
+    def current(self) -> tuple[int, int, int] | None:
+        """(cluster of the last row, successes, trades) - open trades valued at the last price."""
+        if not len(self.rows["ts"]):
+            return None
+        return self._current(self.rows, 0, len(self.rows["ts"]) - 1)
+
+    def _current(self, rows, lo, t) -> tuple[int, int, int] | None:
+        label, succ, tot = _current(rows["label"], rows["mid"], rows["entry"], rows["outcome"],
+                                    self.succ, self.tot, lo, t)
+        return None if label < 0 else (int(label), int(succ), int(tot))
+
+
+def _carry() -> list:
+    """[histogram carry (None: not started), MomentumState] of one epoch."""
+    return [None, MomentumState()]
+
+
+# ───────────────────────────── Kernels ───────────────────────────────────────
+@njit(cache=True)
+def _current(label, mid, entry, outcome, succ, tot, lo, t):
+    """(label of row t, successes, trades) with open trades in [lo, t) valued at mid[t]."""
+    c = label[t]
+    if c < 0:
+        return -1, 0, 0
+    s, n = succ[c], tot[c]
+    for i in range(lo, t):
+        if label[i] == c and outcome[i] == OPEN:
+            n += 1
+            s += mid[t] - entry[i] > 0
+    return c, s, n
+
+
+@njit(cache=True)
+def _walk(label, mid, entry, sl, raised, outcome, gidx, mom, succ, tot, lo, a, b, out,
+          trig, mom_win, exits):
+    """
+    Rows a..b (labels, entries and momentum already set): slide the window,
+    then apply one bar of rank._simulate's exit rules to every open trade in
+    [lo, t).  out[t - a] gets _current() when `out` has rows, exits[i] the
+    exit price of trade i when `exits` has rows.  Returns lo.
+    """
+    for t in range(a, b + 1):
+        if t - lo + 1 > WINDOW:                         # oldest row leaves the window
+            if label[lo] >= 0 and outcome[lo] != OPEN:
+                tot[label[lo]] -= 1
+                succ[label[lo]] -= outcome[lo]
+            lo += 1
+        px, m, g = mid[t], mom[t - a], gidx[t]
+        for i in range(lo, t):
+            if outcome[i] != OPEN:
+                continue
+            if not raised[i] and px >= entry[i] * (1.0 + trig):
+                sl[i] = entry[i] * (1.0 + trig)
+                raised[i] = True
+            if (raised[i] and g - mom_win >= 0 and m < 0) or px <= sl[i]:
+                won = px - entry[i] > 0
+                outcome[i] = won
+                if exits.shape[0]:
+                    exits[i] = px
+                if label[i] >= 0:
+                    tot[label[i]] += 1
+                    succ[label[i]] += won
+        if out.shape[0]:
+            out[t - a, 0], out[t - a, 1], out[t - a, 2] = _current(
+                label, mid, entry, outcome, succ, tot, lo, t)
+    return lo
+
+
+def replay(recs: np.ndarray, period: int) -> list[tuple[int, int, int] | None]:
+    """current() after every row of `recs` (`period`-ms candles), fed to a fresh state (backtests)."""
+    trace: list = []
+    SeriesState(period).advance(np.asarray(recs), trace)
+    return trace
+
+
+# ───────────────────────────── Store glue ────────────────────────────────────
+def state_path(coin_dir: str, tf: str, base: str = STATE_DIR) -> str:
+    return os.path.join(base, os.path.basename(os.path.normpath(coin_dir)), f"{tf}.npz")
+
+
+def update_series(coin_dir: str, tf: str, base: str = STATE_DIR,
+                  now_ms: int | None = None) -> tuple[int, int, int] | None:
+    """
+    Advance the saved state of <coin_dir>/<tf>.ohlcv to the store's last
+    closed candle.  The still-forming candle is left for a later cycle: the
+    watermark must not pass it before its close is final.
+    """
+    store = os.path.join(coin_dir, f"{tf}{candle_store.EXTENSION}")
+    path  = state_path(coin_dir, tf, base)
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+
+    last = candle_store.last_timestamp(store)
+    if last is None:
+        return None
+    try:
+        state = SeriesState.load(path)
+        if state.watermark is not None and last < state.watermark:
+            raise ValueError("store rewritten behind the watermark")
+    except (OSError, ValueError, KeyError) as e:
+        if not isinstance(e, FileNotFoundError):
+            logger.info("Rebuilding rank state %s (%s)", path, e)
+        state = SeriesState(period_ms(tf))
+
+    if state.watermark is None:
+        recs = candle_store.read(store, tail=SPAN + 1)
+    else:
+        recs = candle_store.read(store)
+        recs = recs[np.searchsorted(recs["timestamp"], state.watermark, side="right"):]
+    recs = recs[recs["timestamp"] + period_ms(tf) <= now_ms]     # closed candles only
+    if state.watermark is None:
+        recs = recs[-SPAN:]
+    if state.advance(np.asarray(recs)):
+        state.save(path)
+    return state.current()
@@ -0,0 +1,179 @@
+"""
+replay_server.py  -  Offline stand-in for Kraken's WebSocket v2 feed
+--------------------------------------------------------------------
+• Speaks the subset of the v2 protocol scripts/stream.py uses: `subscribe`
+  to `ticker` and `ohlc`, then snapshot/update messages and heartbeats.
+• Source `store` replays recorded 15m candles from data/historical (each
+  candle becomes a few ticker ticks walking open → high/low → close, then
+  its ohlc update); source `synthetic` generates a random walk.
+• `--speed` is candles per second, so a day of history replays in seconds;
+  the synthetic walk starts 720 candles back and then keeps pace with the
+  clock.
+
+    python -m scripts.replay_server --source synthetic --port 8765
+    KRAKEN_WS_URL=ws://127.0.0.1:8765/v2 python main.py
+"""
+
+from __future__ import annotations
+
+import json
+import asyncio
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import Iterator
+
+import numpy as np
+from aiohttp import web, WSMsgType    # type: ignore
+
+from scripts import candle_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+INTERVAL     = 15                       # minutes per replayed candle
+
+
+# ───────────────────────────── Sources ───────────────────────────────────────
+def synthetic_candles(symbol: str, start_ms: int, seed: int = 0,
+                      price: float = 100.0) -> Iterator[tuple]:
+    """Endless geometric random walk of 15m candles."""
+    rng = np.random.default_rng(seed + sum(map(ord, symbol)))
+    ts = start_ms - start_ms % (INTERVAL * 60_000)
+    while True:
+        path = price * np.exp(np.cumsum(rng.normal(0, 0.002, 4)))
+        o, c = price, float(path[-1])
+        yield (ts, o, max(o, float(path.max())), min(o, float(path.min())), c,
+               float(rng.uniform(1, 50)))
+        price, ts = c, ts + INTERVAL * 60_000
+
+
+def store_candles(symbol: str, base: str = candle_store.BASE_OUTPUT_DIR) -> Iterator[tuple]:
+    """Recorded candles from the local 15m store."""
+    for r in candle_store.read(candle_store.store_path(symbol, f"{INTERVAL}m", base)):
+        yield tuple(r.tolist())
+
+
+def _iso(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000000000Z")
+
+
+def candle_messages(symbol: str, candle: tuple) -> list[dict]:
+    """Ticker ticks inside one candle followed by its ohlc update."""
+    ts, o, h, l, c, v = candle
+    walk = [o, l, h, c] if c >= o else [o, h, l, c]
+    msgs = [{"channel": "ticker", "type": "update",
+             "data": [{"symbol": symbol, "last": p, "bid": p, "ask": p}]} for p in walk]
+    msgs.append({"channel": "ohlc", "type": "update", "data": [{
+        "symbol": symbol, "open": o, "high": h, "low": l, "close": c, "volume": v,
+        "interval_begin": _iso(ts), "interval": INTERVAL, "timestamp": _iso(ts)}]})
+    return msgs
+
+
+# ───────────────────────────── Server ────────────────────────────────────────
+class ReplayServer:
+    """aiohttp app serving one replay stream per connection at /v2."""
+
+    def __init__(self, source: str = "synthetic", speed: float = 4.0,
+                 base: str = candle_store.BASE_OUTPUT_DIR, start_ms: int | None = None,
+                 seed: int = 0):
+        self.source   = source
+        self.speed    = speed
+        self.base     = base
+        self.start_ms = start_ms
+        self.seed     = seed
+        self.app      = web.Application()
+        self.app.router.add_get("/v2", self._handle)
+
+    def _candles(self, symbol: str) -> Iterator[tuple]:
+        if self.source == "store":
+            return store_candles(symbol, self.base)
+        start = self.start_ms if self.start_ms is not None else int(
+            datetime.now(timezone.utc).timestamp() * 1000) - 720 * INTERVAL * 60_000
+        return synthetic_candles(symbol, start, self.seed)
+
+    async def _handle(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(heartbeat=20)
+        await ws.prepare(request)
+        symbols: set[str] = set()
+        feeds: dict[str, Iterator[tuple]] = {}
+        pump = asyncio.ensure_future(self._pump(ws, symbols, feeds))
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    break
+                req = json.loads(msg.data)
+                params = req.get("params", {})
+                if req.get("method") == "subscribe":
+                    for sym in params.get("symbol", []):
+                        symbols.add(sym)
+                        feeds.setdefault(sym, self._candles(sym))
+                    await ws.send_json({"method": "subscribe", "success": True,
+                                        "result": {"channel": params.get("channel"),
+                                                   "symbol": params.get("symbol")}})
+                elif req.get("method") == "ping":
+                    await ws.send_json({"method": "pong"})
+        finally:
+            pump.cancel()
+        return ws
+
+    async def _pump(self, ws: web.WebSocketResponse, symbols: set[str],
+                    feeds: dict[str, Iterator[tuple]]) -> None:
+        delay = 1.0 / self.speed if self.speed > 0 else 0.0
+        pending: dict[str, tuple | None] = {}
+        while not ws.closed:
+            sent = False
+            now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+            for sym in list(symbols):
+                candle = pending.pop(sym, None) or next(feeds[sym], None)
+                if candle is None:
+                    continue
+                if candle[0] > now_ms:              # caught up: synthetic walk goes real-time
+                    pending[sym] = candle
+                    continue
+                for m in candle_messages(sym, candle):
+                    await ws.send_json(m)
+                sent = True
+            if not sent:
+                await ws.send_json({"channel": "heartbeat"})
+            await asyncio.sleep(delay if sent else 1.0)
+
+
+def serve_in_thread(server: ReplayServer, host: str = "127.0.0.1",
+                    port: int = 0) -> tuple[str, threading.Event]:
+    """Run `server` on a daemon thread; returns (ws url, stop event)."""
+    ready, stop = threading.Event(), threading.Event()
+    bound: dict[str, int] = {}
+
+    async def run():
+        runner = web.AppRunner(server.app)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        bound["port"] = site._server.sockets[0].getsockname()[1]
+        ready.set()
+        while not stop.is_set():
+            await asyncio.sleep(0.05)
+        await runner.cleanup()
+
+    threading.Thread(target=lambda: asyncio.run(run()), name="replay-server", daemon=True).start()
+    ready.wait(5)
+    return f"ws://{host}:{bound['port']}/v2", stop
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay market data over a Kraken-style WebSocket")
+    parser.add_argument("--source", choices=["synthetic", "store"], default="synthetic")
+    parser.add_argument("--base", default=candle_store.BASE_OUTPUT_DIR)
+    parser.add_argument("--speed", type=float, default=4.0, help="candles per second")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    server = ReplayServer(args.source, args.speed, args.base)
+    web.run_app(server.app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+resample.py  -  Derive coarse candles from the finest stored timeframe
+----------------------------------------------------------------------
+• 30m / 1h / 4h / 1d / 1w bars are aggregated from the 15m store with
+  NumPy reduceat (no Python per-row loop).
+• Incremental: only the last stored coarse bucket (possibly still forming)
+  and the buckets after it are recomputed; the store overwrites the last
+  record in place and appends the rest.
+• Buckets are epoch-aligned like Kraken's (its weekly bars open on Thursday
+  00:00 UTC, i.e. the epoch weekday).
+"""
+
+from __future__ import annotations
+
+import logging
+
+import ccxt                           # type: ignore
+import numpy as np
+
+from scripts import candle_store
+
+logger = logging.getLogger(__name__)
+
+FINE_TF      = "15m"
+DERIVED_TFS  = ["30m", "1h", "4h", "1d", "1w"]
+
+
+def period_ms(tf: str) -> int:
+    return int(ccxt.Exchange.parse_timeframe(tf) * 1000)
+
+
+def resample(recs: np.ndarray, period: int) -> np.ndarray:
+    """
+    Aggregate fine OHLCV records (sorted by timestamp) into `period`-ms buckets.
+    Returns records of the same dtype, one per non-empty bucket.
+    """
+    out_dtype = recs.dtype
+    if len(recs) == 0:
+        return np.empty(0, dtype=out_dtype)
+
+    ts      = np.asarray(recs["timestamp"])
+    bucket  = ts - ts % period
+    starts  = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends    = np.r_[starts[1:], len(recs)] - 1
+
+    out = np.empty(len(starts), dtype=out_dtype)
+    out["timestamp"] = bucket[starts]
+    out["open"]      = recs["open"][starts]
+    out["high"]      = np.maximum.reduceat(np.asarray(recs["high"]), starts)
+    out["low"]       = np.minimum.reduceat(np.asarray(recs["low"]), starts)
+    out["close"]     = recs["close"][ends]
+    out["volume"]    = np.add.reduceat(np.asarray(recs["volume"]), starts)
+    return out
+
+
+def derive_timeframe(symbol: str, tf: str, base: str = candle_store.BASE_OUTPUT_DIR,
+                     fine_tf: str = FINE_TF, since_ms: int | None = None) -> int:
+    """
+    Update <tf> from <fine_tf> for one symbol.  Recomputes from the last stored
+    coarse bucket (or `since_ms`, e.g. after a hole in the fine series was
+    repaired).  Buckets that start before the fine series are left to the
+    remote back-fill.  Returns the number of coarse rows appended.
+    """
+    fine_path   = candle_store.store_path(symbol, fine_tf, base)
+    coarse_path = candle_store.store_path(symbol, tf, base)
+    fine = candle_store.read(fine_path)
+    if len(fine) == 0:
+        return 0
+
+    period   = period_ms(tf)
+    fine_ts  = fine["timestamp"]
+    first_ok = -(-int(fine_ts[0]) // period) * period        # first complete bucket
+
+    last  = candle_store.last_timestamp(coarse_path)
+    start = last
+    if since_ms is not None:
+        since_bucket = since_ms - since_ms % period
+        start = since_bucket if start is None else min(start, since_bucket)
+    start = first_ok if start is None else max(start, first_ok)
+
+    lo = int(np.searchsorted(fine_ts, start, side="left"))
+    bars = resample(fine[lo:], period)
+    if len(bars) == 0:
+        return 0
+    if last is not None and bars["timestamp"][0] < last:
+        return candle_store.merge(coarse_path, bars)     # repaired history
+    return candle_store.append(coarse_path, bars)
+
+
+def derive_all(symbol: str, base: str = candle_store.BASE_OUTPUT_DIR,
+               timeframes: list[str] | None = None, since_ms: int | None = None) -> dict[str, int]:
+    """Derive every coarse timeframe of `symbol` from the fine store."""
+    added = {}
+    for tf in timeframes or DERIVED_TFS:
+        added[tf] = derive_timeframe(symbol, tf, base, since_ms=since_ms)
+        if added[tf]:
+            logger.info("%s [%s] derived %d rows from %s", symbol, tf, added[tf], FINE_TF)
+    return added
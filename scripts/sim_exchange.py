@@ -0,0 +1,227 @@
+"""
+sim_exchange.py  -  Simulated Kraken for backtests
+--------------------------------------------------
+• Serves the part of the ccxt client the bot calls: fetch_tickers,
+  fetch_ohlcv, fetch_balance, fetch_open_orders, fetch_closed_orders,
+  fetch_order, create_limit_buy_order, create_market_sell_order,
+  create_order (incl. stop-loss sells via params["stopLossPrice"]),
+  edit_order and cancel_order.  It reads stored candles and reports the
+  state at a simulated time.
+• `advance(now_ms, bars)` closes one bar per symbol.  A resting limit buy
+  fills if the bar trades through its price: at the limit, or at the open
+  if the bar opens below it.  The bar's close becomes the symbol's last
+  price.  A resting stop-loss sell triggers the same way when the bar's
+  low reaches its stop, and fills at the stop or at a lower open.  Open
+  sells reserve their base currency.
+• Market orders fill at once at the last price, so PnL carries no latency.
+  Every fill pays FEE on its notional in USD.  Each fill is appended to
+  `fills`.
+• Install with exchange.set_exchange(); fetch_ohlcv only returns candles that
+  have closed by the simulated time.
+"""
+
+from __future__ import annotations
+
+import itertools
+
+import ccxt                           # type: ignore
+import numpy as np
+
+from scripts.resample import FINE_TF, period_ms, resample
+
+FEE   = 0.0025                         # rank_state.BUY_FEE
+QUOTE = "USD"
+EPS   = 1e-9
+OHLCV = ("timestamp", "open", "high", "low", "close", "volume")
+CLOSED_PAGE = 50                       # Kraken ClosedOrders page size
+
+
+class SimExchange:
+    """In-memory order book and balances over `candles[symbol]` fine records."""
+
+    def __init__(self, candles: dict[str, np.ndarray], cash: float,
+                 fee: float = FEE, fine_tf: str = FINE_TF):
+        self.fine_tf  = fine_tf
+        self.fee      = fee
+        self.now      = 0                                    # ms, close of the last bar
+        self.markets  = {s: {"symbol": s, "base": s.split("/")[0], "quote": QUOTE}
+                         for s in candles}
+        self._bars    = {s: {fine_tf: np.asarray(r)} for s, r in candles.items()}
+        self.last: dict[str, float] = {}
+        self.balance: dict[str, float] = {QUOTE: float(cash)}
+        self.orders: dict[str, dict] = {}
+        self.open_ids: list[str] = []
+        self.fills: list[dict] = []
+        self._ids = itertools.count(1)
+
+    # -- market data ------------------------------------------------------------
+    def series(self, symbol: str, timeframe: str) -> np.ndarray:
+        """All bars of `symbol` at `timeframe`, resampled from the fine series once."""
+        by_tf = self._bars[symbol]
+        if timeframe not in by_tf:
+            by_tf[timeframe] = resample(by_tf[self.fine_tf], period_ms(timeframe))
+        return by_tf[timeframe]
+
+    def closed(self, symbol: str, timeframe: str) -> int:
+        """How many `timeframe` bars of `symbol` have closed by now."""
+        ts = self.series(symbol, timeframe)["timestamp"]
+        return int(np.searchsorted(ts, self.now - period_ms(timeframe), side="right"))
+
+    def fetch_ohlcv(self, symbol, timeframe="1m", since=None, limit=None, params=None):
+        if symbol not in self.markets:
+            raise ccxt.BadSymbol(f"unknown symbol {symbol}")
+        recs = self.series(symbol, timeframe)[:self.closed(symbol, timeframe)]
+        if since is not None:                                # Kraken pages forward from since
+            recs = recs[np.searchsorted(recs["timestamp"], since):]
+            recs = recs[:limit] if limit else recs
+        elif limit:
+            recs = recs[-limit:]
+        rows = np.column_stack([recs[c].astype(np.float64) for c in OHLCV]).tolist()
+        for row, t in zip(rows, recs["timestamp"].tolist()):
+            row[0] = t                                       # ccxt gives integer ms
+        return rows
+
+    def fetch_tickers(self, symbols=None, params=None):
+        return {s: {"symbol": s, "last": px, "timestamp": self.now}
+                for s, px in self.last.items() if symbols is None or s in symbols}
+
+    def fetch_balance(self, params=None):
+        used = {QUOTE: sum(self._reserved(o) for o in self._open() if o["side"] == "buy")}
+        for o in self._open():
+            if o["side"] == "sell":
+                base = self.markets[o["symbol"]]["base"]
+                used[base] = used.get(base, 0.0) + o["amount"]
+        total = dict(self.balance)
+        free = {c: v - used.get(c, 0.0) for c, v in total.items()}
+        return {"free": free, "used": used, "total": total}
+
+    # -- orders -----------------------------------------------------------------
+    def create_limit_buy_order(self, symbol, amount, price, params=None):
+        if symbol not in self.markets:
+            raise ccxt.BadSymbol(f"unknown symbol {symbol}")
+        amount, price = float(amount), float(price)
+        if amount <= 0 or price <= 0:
+            raise ccxt.InvalidOrder(f"invalid order {amount} @ {price}")
+        order = self._new_order(symbol, "limit", "buy", amount, price)
+        if self.fetch_balance()["free"][QUOTE] < self._reserved(order) - EPS:
+            raise ccxt.InsufficientFunds(f"{QUOTE} balance too low for {amount} {symbol} @ {price}")
+        self.orders[order["id"]] = order
+        self.open_ids.append(order["id"])
+        return dict(order)
+
+    def create_market_sell_order(self, symbol, amount, params=None):
+        price = self.last.get(symbol)
+        if price is None:
+            raise ccxt.BadSymbol(f"no price for {symbol}")
+        amount = float(amount)
+        self._check_base(symbol, amount)
+        order = self._new_order(symbol, "market", "sell", amount, price)
+        self.orders[order["id"]] = order
+        self._fill(order, price)
+        return dict(order)
+
+    def create_order(self, symbol, type, side, amount, price=None, params=None):
+        stop = (params or {}).get("stopLossPrice")
+        if stop is not None and side == "sell":
+            return self._create_stop(symbol, float(amount), float(stop))
+        if type == "limit" and side == "buy":
+            return self.create_limit_buy_order(symbol, amount, price)
+        if type == "market" and side == "sell":
+            return self.create_market_sell_order(symbol, amount)
+        raise ccxt.NotSupported(f"{type} {side} orders are not simulated")
+
+    def edit_order(self, id, symbol, type, side, amount=None, price=None, params=None):
+        order = self.orders.get(id)
+        if order is None or order["status"] != "open":
+            raise ccxt.OrderNotFound(f"no open order {id}")
+        stop = (params or {}).get("stopLossPrice")
+        if stop is not None:
+            order["stopPrice"] = order["triggerPrice"] = float(stop)
+        if amount is not None:
+            order["amount"] = order["remaining"] = float(amount)
+        return dict(order)
+
+    def cancel_order(self, id, symbol=None, params=None):
+        order = self.orders.get(id)
+        if order is None or order["status"] != "open":
+            raise ccxt.OrderNotFound(f"no open order {id}")
+        order["status"] = "canceled"
+        self.open_ids.remove(id)
+        return dict(order)
+
+    def fetch_order(self, id, symbol=None, params=None):
+        if id not in self.orders:
+            raise ccxt.OrderNotFound(f"unknown order {id}")
+        return dict(self.orders[id])
+
+    def fetch_open_orders(self, symbol=None, since=None, limit=None, params=None):
+        return [dict(o) for o in self._open() if symbol is None or o["symbol"] == symbol]
+
+    def fetch_closed_orders(self, symbol=None, since=None, limit=None, params=None):
+        """Kraken ClosedOrders: newest first, pages of CLOSED_PAGE from params["ofs"]."""
+        done = [o for o in self.orders.values() if o["status"] != "open"
+                and (symbol is None or o["symbol"] == symbol)
+                and (since is None or o["timestamp"] >= since)]
+        ofs = (params or {}).get("ofs", 0)
+        return [dict(o) for o in done[::-1][ofs:ofs + min(limit or CLOSED_PAGE, CLOSED_PAGE)]]
+
+    # -- simulation -------------------------------------------------------------
+    def advance(self, now_ms: int, bars: dict[str, np.void]) -> None:
+        """Move the clock to `now_ms`, closing one bar per symbol in `bars`."""
+        self.now = int(now_ms)
+        for oid in list(self.open_ids):
+            order = self.orders[oid]
+            bar = bars.get(order["symbol"])
+            level = order["price"] if order["side"] == "buy" else order["stopPrice"]
+            if bar is None or order["timestamp"] > bar["timestamp"] or bar["low"] > level:
+                continue
+            self.open_ids.remove(oid)
+            self._fill(order, min(float(bar["open"]), level))
+        for symbol, bar in bars.items():
+            self.last[symbol] = float(bar["close"])
+
+    def equity(self) -> float:
+        """USD plus every holding at its last price."""
+        return self.balance[QUOTE] + sum(qty * self.last.get(f"{c}/{QUOTE}", 0.0)
+                                         for c, qty in self.balance.items() if c != QUOTE)
+
+    def _create_stop(self, symbol, amount: float, stop: float) -> dict:
+        if symbol not in self.markets:
+            raise ccxt.BadSymbol(f"unknown symbol {symbol}")
+        if amount <= 0 or stop <= 0:
+            raise ccxt.InvalidOrder(f"invalid stop {amount} @ {stop}")
+        self._check_base(symbol, amount)
+        order = self._new_order(symbol, "stop-loss", "sell", amount, None)
+        order["stopPrice"] = order["triggerPrice"] = stop
+        self.orders[order["id"]] = order
+        self.open_ids.append(order["id"])
+        return dict(order)
+
+    def _check_base(self, symbol, amount: float) -> None:
+        base = self.markets[symbol]["base"]
+        if amount <= 0 or self.fetch_balance()["free"].get(base, 0.0) < amount - EPS:
+            raise ccxt.InsufficientFunds(f"{base} balance too low to sell {amount}")
+
+    def _open(self):
+        return (self.orders[i] for i in self.open_ids)
+
+    def _reserved(self, order) -> float:
+        return order["amount"] * order["price"] * (1.0 + self.fee)
+
+    def _new_order(self, symbol, type_, side, amount, price) -> dict:
+        return {"id": f"SIM-{next(self._ids):06d}", "symbol": symbol, "type": type_,
+                "side": side, "price": price, "amount": amount, "filled": 0.0,
+                "remaining": amount, "average": None, "status": "open",
+                "timestamp": self.now, "fee": None}
+
+    def _fill(self, order, price: float) -> None:
+        qty, base = order["amount"], self.markets[order["symbol"]]["base"]
+        notional = qty * price
+        fee = notional * self.fee
+        sign = 1.0 if order["side"] == "buy" else -1.0
+        self.balance[QUOTE] -= sign * notional + fee
+        self.balance[base] = self.balance.get(base, 0.0) + sign * qty
+        order.update(status="closed", filled=qty, remaining=0.0, average=price,
+                     fee={"cost": fee, "currency": QUOTE}, lastTradeTimestamp=self.now)
+        self.fills.append({"time": self.now, "order_id": order["id"], "symbol": order["symbol"],
+                           "side": order["side"], "qty": qty, "price": price, "fee": fee})
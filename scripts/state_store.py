@@ -0,0 +1,356 @@
+"""
+state_store.py  -  Transactional SQLite store for the bot's mutable state
+-------------------------------------------------------------------------
+• positions, pending_orders, portfolio and monitor live in one SQLite
+  database (data/state.db) in WAL mode.  A dashboard or the sqlite3 CLI
+  can read it while the bot writes, without blocking either side.
+• Each table has one row per symbol / order.  Common fields have typed
+  columns and the remaining fields go into an `extra` JSON column, so
+  any dict round-trips unchanged.
+• `load()` is served from an in-memory cache, which is filled from the
+  database on first use.  `save()` writes only the rows that changed
+  since the calling thread last loaded the table, all in one
+  transaction.  As a result, a full rewrite by the monitor thread cannot
+  drop a row that the main thread added in the meantime.
+  `upsert()`/`delete()` edit single rows.  `transaction()` groups several
+  writes into one commit.
+• Tables touched by a commit are exported to data/<table>.json for the
+  Go dashboard.  A background thread does this at most every
+  EXPORT_EVERY seconds and writes each file atomically, so the export
+  never runs in the trading loop.  `flush()` exports immediately.  On
+  the first open the same files are imported, which migrates the old
+  JSON books.
+• utilities.load_json / save_json send these four paths here, so callers
+  keep their dict / list shapes.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# ───────────────────────────── Config ────────────────────────────────────────
+DB_FILE        = "data/state.db"
+SCHEMA_VERSION = 1
+EXPORT_EVERY   = 1.0          # s, dashboard JSON refresh at most this often
+
+
+@dataclass(frozen=True)
+class Table:
+    name:    str
+    columns: dict[str, str]          # typed fields: name → "REAL" / "TEXT"
+    listed:  bool = False            # a JSON list keyed by order_id, else a dict
+    scalar:  str | None = None       # dict of plain values, stored in this column
+
+    @property
+    def export(self) -> str:
+        return f"data/{self.name}.json"
+
+
+TABLES = {t.name: t for t in (
+    Table("positions", {"qty": "REAL", "entry_price": "REAL", "stop_price": "REAL",
+                        "peak_price": "REAL", "filled_at": "TEXT", "stop_order_id": "TEXT"}),
+    Table("pending_orders", {"order_id": "TEXT", "symbol": "TEXT", "price": "REAL",
+                             "qty": "REAL", "placed_at": "TEXT"}, listed=True),
+    Table("portfolio", {"usd": "REAL"}, scalar="usd"),
+    Table("monitor", {"timestamp": "TEXT", "price": "REAL", "momentum_score": "REAL",
+                      "stop_loss": "REAL", "peak_price": "REAL"}),
+)}
+
+
+_EXPORTS = {os.path.normpath(t.export): t.name for t in TABLES.values()}
+
+
+def table_for(path) -> str | None:
+    """Name of the table behind a data/*.json path, if it is one."""
+    return _EXPORTS.get(os.path.normpath(path))
+
+
+def _copy(value):
+    """deepcopy for JSON-shaped values (much cheaper on flat rows)."""
+    if isinstance(value, dict):
+        return {k: _copy(v) if isinstance(v, (dict, list)) else v for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) if isinstance(v, (dict, list)) else v for v in value]
+    return value
+
+
+def _typed(value, kind: str) -> bool:
+    if kind == "TEXT":
+        return isinstance(value, str)
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class StateStore:
+    """One SQLite database plus its read-through cache; safe to share between threads."""
+
+    def __init__(self, base):
+        self.base = Path(base)
+        path = self.base / DB_FILE
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock  = threading.RLock()
+        self._local = threading.local()              # per-thread base snapshots for save()
+        self._rows: dict[str, dict[str, dict]] = {}  # cache: table → key → row
+        self._next: dict[str, int] = {}              # next seq (list order) per table
+        self._depth = 0
+        self._begun = False
+        self._touched: set[str] = set()
+        self._dirty: set[str] = set()                # committed, not yet exported
+        self._export_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._exporter: threading.Thread | None = None
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")   # WAL: durable at checkpoints, never torn
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            self._migrate()
+
+    # -- whole tables (load_json / save_json) -------------------------------------
+    def load(self, name: str):
+        """The table as its JSON shape (a copy); remembered as this thread's base."""
+        with self._lock:
+            rows = self._cached(name)
+            self._bases()[name] = dict(rows)
+            return self._shape(TABLES[name], [(k, _copy(row)) for k, row in rows.items()])
+
+    def save(self, name: str, obj) -> int:
+        """
+        Write `obj` as the new content of the table; returns the rows written.
+        Only rows that differ from this thread's last load() are touched.
+        """
+        table = TABLES[name]
+        with self.transaction():
+            current = self._cached(name)
+            base = self._bases().get(name, current)
+            new, changed = {}, []
+            for key, row in self._rows_of(table, obj):
+                old = base.get(key)
+                if old != row:
+                    old = _copy(row)
+                    changed.append((key, old))
+                new[key] = old                       # never aliases the caller's objects
+            gone = [k for k in base if k not in new and k in current]
+            for key, row in changed:
+                self._upsert(table, key, row)
+            for key in gone:
+                self._delete(table, key)
+            self._bases()[name] = new
+        return len(changed) + len(gone)
+
+    # -- single rows ------------------------------------------------------------------
+    def get(self, name: str, key: str):
+        with self._lock:
+            row = self._cached(name).get(key)
+            return None if row is None else self._value(TABLES[name], _copy(row))
+
+    def upsert(self, name: str, key: str, value) -> None:
+        table = TABLES[name]
+        row = {table.scalar: value} if table.scalar else _copy(value)
+        with self.transaction():
+            self._upsert(table, key, row)
+
+    def delete(self, name: str, key: str) -> None:
+        with self.transaction():
+            self._delete(TABLES[name], key)
+
+    @contextmanager
+    def transaction(self):
+        """Group writes into one commit (re-entrant); queues touched tables for export."""
+        with self._lock:
+            outer = self._depth == 0
+            if outer:
+                self._touched = set()
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._depth -= 1
+                if outer and self._begun:
+                    self._begun = False
+                    self._conn.execute("ROLLBACK")
+                    for name in self._touched:          # reload from the database
+                        self._rows.pop(name, None)
+                        self._bases().pop(name, None)
+                raise
+            self._depth -= 1
+            if outer and self._begun:
+                self._begun = False
+                self._conn.execute("COMMIT")
+                if self._touched:
+                    self._dirty |= self._touched
+                    self._start_exporter()
+
+    def flush(self) -> None:
+        """Export every table changed since the last export, now."""
+        with self._export_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+                snaps = {name: list(self._cached(name).items()) for name in dirty}
+            for name in sorted(snaps):                   # cache rows are never mutated in place
+                self._export(TABLES[name], snaps[name])
+
+    def close(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._exporter is not None:
+            self._exporter.join()
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+    # -- internals --------------------------------------------------------------------
+    def _start_exporter(self) -> None:
+        if self._exporter is None:
+            self._exporter = threading.Thread(target=self._export_loop, name="state-export", daemon=True)
+            self._exporter.start()
+        self._wake.set()
+
+    def _export_loop(self) -> None:
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            self.flush()
+            if self._stop.wait(EXPORT_EVERY):            # coalesce bursts of commits
+                return
+
+    def _begin(self) -> None:
+        """Open the SQLite transaction on the first write (no-op saves cost no commit)."""
+        if not self._begun:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._begun = True
+
+    def _bases(self) -> dict:
+        if not hasattr(self._local, "bases"):
+            self._local.bases = {}
+        return self._local.bases
+
+    def _cached(self, name: str) -> dict[str, dict]:
+        rows = self._rows.get(name)
+        if rows is None:
+            table = TABLES[name]
+            cols = list(table.columns)
+            cur = self._conn.execute(f"SELECT key, {', '.join(cols)}, extra, seq FROM {name} ORDER BY seq")
+            rows, last = {}, 0
+            for key, *vals, extra, seq in cur:
+                row = {c: v for c, v in zip(cols, vals) if v is not None}
+                row.update(json.loads(extra) if extra else {})
+                rows[key], last = row, seq
+            self._rows[name], self._next[name] = rows, last + 1
+        return rows
+
+    def _upsert(self, table: Table, key: str, row: dict) -> None:
+        rows = self._cached(table.name)
+        if rows.get(key) == row:
+            return
+        self._begin()
+        cols = list(table.columns)
+        typed = [row.get(c) if _typed(row.get(c), table.columns[c]) else None for c in cols]
+        extra = {k: v for k, v in row.items() if k not in table.columns
+                 or not _typed(v, table.columns[k])}
+        self._conn.execute(
+            f"INSERT INTO {table.name} (key, seq, {', '.join(cols)}, extra) "
+            f"VALUES (?, ?, {', '.join('?' * len(cols))}, ?) ON CONFLICT(key) DO UPDATE SET "
+            + ", ".join(f"{c} = excluded.{c}" for c in cols + ["extra"]),
+            [key, self._next[table.name], *typed, json.dumps(extra) if extra else None])
+        if key not in rows:
+            self._next[table.name] += 1
+        rows[key] = row
+        self._touched.add(table.name)
+
+    def _delete(self, table: Table, key: str) -> None:
+        rows = self._cached(table.name)
+        if rows.pop(key, None) is not None:
+            self._begin()
+            self._conn.execute(f"DELETE FROM {table.name} WHERE key = ?", (key,))
+            self._touched.add(table.name)
+
+    def _rows_of(self, table: Table, obj):
+        """(key, row) pairs of a JSON-shaped table; rows are the caller's objects."""
+        if table.listed:
+            items = obj.values() if isinstance(obj, dict) else obj    # {} = empty book
+            return ((str(r.get("order_id") or json.dumps(r, sort_keys=True)), r) for r in items)
+        if table.scalar:
+            return ((str(k), {table.scalar: v}) for k, v in obj.items())
+        return ((str(k), v) for k, v in obj.items())
+
+    def _value(self, table: Table, row: dict):
+        return row[table.scalar] if table.scalar else row
+
+    def _shape(self, table: Table, items: list):
+        if table.listed:
+            return [row for _, row in items]
+        return {k: self._value(table, row) for k, row in items}
+
+    def _export(self, table: Table, items: list) -> None:
+        """Atomically rewrite data/<table>.json (the dashboard's view)."""
+        path = self.base / table.export
+        tmp = path.with_name(path.name + ".tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._shape(table, items), f, indent=2)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("Export of %s failed: %s", path, e)
+
+    def _migrate(self) -> None:
+        """Create the schema and import the legacy JSON books (first open only)."""
+        with self.transaction():
+            for table in TABLES.values():
+                cols = ", ".join(f"{c} {kind}" for c, kind in table.columns.items())
+                self._conn.execute(f"CREATE TABLE IF NOT EXISTS {table.name} "
+                                   f"(key TEXT PRIMARY KEY, seq INTEGER NOT NULL, {cols}, extra TEXT)")
+                legacy = self.base / table.export
+                if not legacy.exists():
+                    continue
+                try:
+                    with open(legacy, encoding="utf-8") as f:
+                        data = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning("Legacy %s not imported: %s", legacy, e)
+                    continue
+                for key, row in self._rows_of(table, data):
+                    self._upsert(table, key, row)
+                logger.info("Imported %s into %s", legacy, DB_FILE)
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+_stores: dict[str, StateStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(base) -> StateStore:
+    """The store under `base` (utilities.BASE; swapped by backtests and tests)."""
+    key = os.path.abspath(base)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = StateStore(base)
+        return store
+
+
+@atexit.register
+def _flush_all() -> None:
+    """The exporter is a daemon thread; write pending dashboard exports on exit."""
+    for store in list(_stores.values()):
+        store.flush()
+
+
+def close_store(base) -> None:
+    """Close and forget the store under `base` (before its directory is removed)."""
+    with _stores_lock:
+        store = _stores.pop(os.path.abspath(base), None)
+    if store is not None:
+        store.close()
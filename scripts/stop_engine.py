@@ -0,0 +1,259 @@
+"""
+stop_engine.py  -  Tick-driven hard and trailing stops
+------------------------------------------------------
+• StopEngine keeps entry, peak and stop level for every open position in a
+  trigger table keyed by symbol.  A tick is O(1): it raises the peak, and
+  the trailing stop with it once price has reached TRIGGER_PROFIT.  A
+  position fires only when the tick is at or below its stop.
+• Subscribed to the MarketBus, so an exit is decided in the stream thread
+  as soon as the crossing price arrives.  The market sell is handed to a
+  small thread pool, which keeps the feed from waiting on REST.
+  monitor_portfolio feeds the same engine the price it polls each loop,
+  so stops still fire when the feed is down.
+• Positions with a resting exchange stop (protective_orders.py) fire
+  BACKSTOP_SLACK below it, and the resting order is released first.
+• A position fires once.  After a failed sell it re-arms, and the next
+  crossing tick at least RETRY_AFTER later retries.  Completed exits wait
+  in `closed` until the monitor thread moves them out of positions.json,
+  so only that thread writes the position files.
+• Each exit records tick → order sent and tick → exchange ack into
+  LatencyHistograms; `latency()` summarises them for data/stop_latency.json.
+"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable
+
+from scripts.exchange import get_exchange
+from scripts.protective_orders import BACKSTOP_SLACK, get_protection
+
+logger = logging.getLogger(__name__)
+
+# ───────────────────────────── Config ────────────────────────────────────────
+HARD_SL_PCT    = 0.08        # 8% max loss
+TRIGGER_PROFIT = 0.04        # 4% to activate trailing
+TRAIL_SL_PCT   = 0.03        # 3% trail below peak
+RETRY_AFTER    = 5.0         # seconds before a failed exit may fire again
+SELL_WORKERS   = 2
+LATENCY_FILE   = "data/stop_latency.json"
+
+
+# ───────────────────────────── Latency ───────────────────────────────────────
+class LatencyHistogram:
+    """Counts of latencies in power-of-two millisecond buckets (0.125 ms … ~65 s)."""
+
+    BOUNDS_MS = [2.0 ** k for k in range(-3, 17)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS_MS) + 1)
+        self.n = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, seconds: float) -> None:
+        ms = max(seconds, 0.0) * 1000
+        self.counts[bisect.bisect_left(self.BOUNDS_MS, ms)] += 1
+        self.n += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q: float) -> float:
+        """Upper bound (ms) of the bucket holding the q-quantile; nan when empty."""
+        if not self.n:
+            return math.nan
+        rank, seen = q * self.n, 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if c and seen >= rank:
+                return self.BOUNDS_MS[i] if i < len(self.BOUNDS_MS) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> dict:
+        return {"n": self.n,
+                "mean_ms": self.total_ms / self.n if self.n else None,
+                "p50_ms": self.percentile(0.5) if self.n else None,
+                "p99_ms": self.percentile(0.99) if self.n else None,
+                "max_ms": self.max_ms,
+                "buckets_ms": {f"<={b:g}": c for b, c in zip(self.BOUNDS_MS, self.counts) if c}}
+
+
+# ───────────────────────────── Engine ────────────────────────────────────────
+@dataclass
+class Stop:
+    entry: float
+    qty: float
+    stop: float
+    peak: float
+    filled_at: str | None = None
+    order_id: str | None = None            # resting exchange stop (protective_orders)
+    exiting: bool = False
+    retry_at: float = 0.0
+
+
+class StopEngine:
+    """Trigger table of open positions; fires market sells on crossing ticks."""
+
+    def __init__(self, hard_sl: float = HARD_SL_PCT, trigger: float = TRIGGER_PROFIT,
+                 trail: float = TRAIL_SL_PCT, workers: int | None = SELL_WORKERS,
+                 clock: Callable[[], float] = time.time):
+        self.hard_sl  = hard_sl
+        self.trigger  = trigger
+        self.trail    = trail
+        self._clock   = clock
+        self._lock    = threading.Lock()
+        self._stops: dict[str, Stop] = {}
+        self._pool    = ThreadPoolExecutor(workers, thread_name_prefix="stop") if workers else None
+        self._futures: set = set()
+        self.closed: dict[str, dict] = {}
+        self.order_latency = LatencyHistogram()
+        self.ack_latency   = LatencyHistogram()
+
+    # -- positions --------------------------------------------------------------
+    def add(self, symbol: str, data: dict) -> None:
+        """Track a positions.json entry (levels default as in monitor_portfolio)."""
+        entry = float(data["entry_price"])
+        stop = Stop(entry, float(data["qty"]),
+                    float(data.get("stop_price", entry * (1 - self.hard_sl))),
+                    float(data.get("peak_price", entry)), data.get("filled_at"),
+                    data.get("stop_order_id"))
+        with self._lock:
+            done = self.closed.get(symbol)
+            if done is not None and done["filled_at"] == stop.filled_at:
+                return                                     # sold, not yet drained
+            old = self._stops.get(symbol)
+            if old is None or old.filled_at != stop.filled_at or old.qty != stop.qty:
+                self._stops[symbol] = stop
+            else:
+                old.order_id = stop.order_id
+
+    def sync(self, positions: dict) -> None:
+        """Track exactly `positions`; levels the engine already holds are kept."""
+        for symbol, data in positions.items():
+            self.add(symbol, data)
+        with self._lock:
+            for symbol in [s for s, st in self._stops.items()
+                           if s not in positions and not st.exiting]:
+                del self._stops[symbol]
+
+    def levels(self, symbol: str) -> tuple[float, float] | None:
+        """(stop, peak) of a tracked position."""
+        with self._lock:
+            st = self._stops.get(symbol)
+            return None if st is None else (st.stop, st.peak)
+
+    def exiting(self, symbol: str) -> bool:
+        with self._lock:
+            st = self._stops.get(symbol)
+            return symbol in self.closed or (st is not None and st.exiting)
+
+    def drain_closed(self) -> dict[str, dict]:
+        """Exits completed since the last call (symbol → exit record)."""
+        with self._lock:
+            closed, self.closed = self.closed, {}
+        return closed
+
+    # -- ticks ------------------------------------------------------------------
+    def on_tick(self, symbol: str, price: float, received_at: float | None = None) -> bool:
+        """MarketBus listener; True if this tick fired an exit."""
+        received_at = self._clock() if received_at is None else received_at
+        with self._lock:
+            st = self._stops.get(symbol)
+            if st is None or st.exiting:
+                return False
+            if price > st.peak:
+                st.peak = price
+            if price >= st.entry * (1 + self.trigger):
+                st.stop = max(st.stop, st.peak * (1 - self.trail))
+            level = st.stop * (1 - BACKSTOP_SLACK) if st.order_id else st.stop
+            if price > level or received_at < st.retry_at:
+                return False
+            st.exiting = True
+            reason = f"SL hit: price={price:.4f}, stop={st.stop:.4f}, peak={st.peak:.4f}"
+        self._submit(symbol, st, price, received_at, reason)
+        return True
+
+    def exit(self, symbol: str, price: float, reason: str,
+             received_at: float | None = None) -> bool:
+        """Sell a tracked position now (e.g. a momentum exit); False if already exiting."""
+        received_at = self._clock() if received_at is None else received_at
+        with self._lock:
+            st = self._stops.get(symbol)
+            if st is None or st.exiting:
+                return False
+            st.exiting = True
+        self._submit(symbol, st, price, received_at, reason)
+        return True
+
+    def _submit(self, symbol, st, price, received_at, reason) -> None:
+        if self._pool is None:
+            self._sell(symbol, st, price, received_at, reason)
+            return
+        fut = self._pool.submit(self._sell, symbol, st, price, received_at, reason)
+        with self._lock:
+            self._futures.add(fut)
+        fut.add_done_callback(self._done)
+
+    def _done(self, fut) -> None:
+        with self._lock:
+            self._futures.discard(fut)
+
+    def _sell(self, symbol: str, st: Stop, price: float, received_at: float, reason: str) -> None:
+        logger.warning("Exit %s @ %.4f ‒ %s", symbol, price, reason)
+        try:
+            order = get_protection().release(symbol, st.order_id)    # frees the coins
+            sent = None
+            if order is not None:
+                reason = f"resting stop {st.order_id} executed"
+            else:
+                sent = self._clock()
+                order = get_exchange().create_market_sell_order(symbol, st.qty)
+        except Exception as e:
+            logger.error("Sell error for %s: %s", symbol, e)
+            with self._lock:
+                st.exiting = False                     # re-arm; the position stays
+                st.retry_at = self._clock() + RETRY_AFTER
+            return
+        acked = self._clock()
+        fill = float((order or {}).get("average") or price)
+        with self._lock:
+            if sent is not None:                       # not the exchange's own stop
+                self.order_latency.record(sent - received_at)
+                self.ack_latency.record(acked - received_at)
+            if self._stops.get(symbol) is st:
+                del self._stops[symbol]
+            self.closed[symbol] = {"price": fill, "qty": st.qty, "reason": reason,
+                                   "filled_at": st.filled_at,
+                                   "order_id": (order or {}).get("id")}
+        logger.info("Sold %.4f %s for ≈ %.2f USD (%s)", st.qty, symbol, fill * st.qty,
+                    reason if sent is None else f"{(sent - received_at) * 1000:.1f} ms after the tick")
+
+    def latency(self) -> dict:
+        with self._lock:
+            return {"tick_to_order": self.order_latency.to_dict(),
+                    "tick_to_ack": self.ack_latency.to_dict()}
+
+    def wait(self) -> None:
+        """Block until every submitted sell has finished (tests, shutdown)."""
+        with self._lock:
+            futures = list(self._futures)
+        wait(futures)
+
+
+_engine = StopEngine()
+
+
+def get_engine() -> StopEngine:
+    return _engine
+
+
+def set_engine(engine: StopEngine | None) -> None:
+    """Install an engine (backtests); None restores a fresh default one."""
+    global _engine
+    _engine = engine if engine is not None else StopEngine()
@@ -0,0 +1,242 @@
+"""
+stream.py  -  Live market data from Kraken's WebSocket v2 feed
+--------------------------------------------------------------
+• KrakenStream subscribes to the public `ticker` and `ohlc` channels in a
+  background thread (own asyncio loop, aiohttp client) and reconnects with
+  back-off.
+• MarketBus keeps the latest price per symbol and a short candle history
+  per symbol/interval; listeners get a callback on every price tick.
+• `flush_to_store()` hands closed streamed candles to the 15m store, so the
+  next historical() cycle has nothing left to fetch for live symbols.
+• Readers fall back to REST (the shared ticker snapshot) whenever the feed
+  is down or a price is older than STALE_AFTER.
+• Point KRAKEN_WS_URL at scripts/replay_server.py to run everything offline.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Callable, Iterable
+
+import aiohttp                        # type: ignore
+import numpy as np
+
+from scripts import candle_store
+from scripts.prices import get_snapshot
+from scripts.resample import FINE_TF, period_ms
+
+logger = logging.getLogger(__name__)
+
+# ───────────────────────────── Config ────────────────────────────────────────
+WS_URL          = os.getenv("KRAKEN_WS_URL", "wss://ws.kraken.com/v2")
+STALE_AFTER     = 30.0              # seconds before a streamed price is distrusted
+CANDLE_HISTORY  = 720               # candles kept per symbol/interval
+OHLC_INTERVALS  = [period_ms(FINE_TF) // 60_000]     # minutes; the finest stored timeframe
+RECONNECT_MAX   = 60.0              # back-off ceiling (s)
+
+PriceListener = Callable[[str, float, float], None]     # symbol, price, received_at
+
+
+# ───────────────────────────── Bus ───────────────────────────────────────────
+class MarketBus:
+    """Thread-safe latest-price and candle cache fed by the stream."""
+
+    def __init__(self, history: int = CANDLE_HISTORY,
+                 clock: Callable[[], float] = time.time):
+        self._clock     = clock
+        self._history   = history
+        self._lock      = threading.Lock()
+        self._prices: dict[str, tuple[float, float]] = {}
+        self._candles: dict[tuple[str, int], deque] = {}
+        self._listeners: list[PriceListener] = []
+        self.connected  = False
+
+    # -- writers (stream thread) ------------------------------------------------
+    def publish_price(self, symbol: str, price: float, received_at: float | None = None) -> None:
+        received_at = self._clock() if received_at is None else received_at
+        with self._lock:
+            self._prices[symbol] = (price, received_at)
+            listeners = list(self._listeners)
+        for fn in listeners:
+            try:
+                fn(symbol, price, received_at)
+            except Exception as e:
+                logger.error("Price listener failed for %s: %s", symbol, e)
+
+    def publish_candle(self, symbol: str, interval: int, candle: tuple) -> None:
+        """candle = (ts_ms, open, high, low, close, volume); same ts replaces the forming bar."""
+        with self._lock:
+            buf = self._candles.setdefault((symbol, interval), deque(maxlen=self._history))
+            if buf and buf[-1][0] == candle[0]:
+                buf[-1] = candle
+            elif not buf or candle[0] > buf[-1][0]:
+                buf.append(candle)
+
+    def subscribe(self, listener: PriceListener) -> None:
+        with self._lock:
+            self._listeners.append(listener)
+
+    # -- readers ----------------------------------------------------------------
+    def price(self, symbol: str, max_age: float = STALE_AFTER) -> float | None:
+        """Streamed price, or None if the feed is down or the tick is too old."""
+        with self._lock:
+            hit = self._prices.get(symbol)
+        if not self.connected or hit is None or self._clock() - hit[1] > max_age:
+            return None
+        return hit[0]
+
+    def candles(self, symbol: str, interval: int, closed_only: bool = True) -> np.ndarray:
+        """Buffered candles as candle_store records (forming bar excluded by default)."""
+        with self._lock:
+            rows = list(self._candles.get((symbol, interval), ()))
+        if closed_only and rows:
+            now_ms = self._clock() * 1000
+            rows = [r for r in rows if r[0] + interval * 60_000 <= now_ms]
+        return np.array(rows, dtype=candle_store.record_dtype())
+
+
+_bus = MarketBus()
+
+
+def get_bus() -> MarketBus:
+    return _bus
+
+
+def get_price(symbol: str) -> float | None:
+    """Streamed price when live, else the REST ticker snapshot."""
+    price = _bus.price(symbol)
+    return price if price is not None else get_snapshot().get(symbol)
+
+
+def flush_to_store(symbol: str, base: str = candle_store.BASE_OUTPUT_DIR,
+                   tf: str = FINE_TF, bus: MarketBus | None = None) -> int:
+    """Append the closed streamed candles of `symbol` newer than its <tf> store."""
+    rows = (bus or _bus).candles(symbol, period_ms(tf) // 60_000)
+    store = candle_store.store_path(symbol, tf, base)
+    last = candle_store.last_timestamp(store) if candle_store.exists(store) else None
+    if last is not None:
+        rows = rows[rows["timestamp"] > last]       # the buffer overlaps what is stored
+    if not len(rows):
+        return 0
+    return candle_store.append(store, rows)
+
+
+# ───────────────────────────── Feed ──────────────────────────────────────────
+def _parse_ts(iso: str) -> int:
+    """'2025-05-01T12:15:00.000000000Z' → ms since epoch."""
+    return int(datetime.fromisoformat(iso[:26].rstrip("Z") + "+00:00").timestamp() * 1000)
+
+
+def handle_message(bus: MarketBus, msg: dict, received_at: float | None = None) -> None:
+    """Apply one Kraken v2 message to the bus."""
+    channel = msg.get("channel")
+    if channel == "ticker":
+        for t in msg.get("data", []):
+            if t.get("last") is not None:
+                bus.publish_price(t["symbol"], float(t["last"]), received_at)
+    elif channel == "ohlc":
+        for c in msg.get("data", []):
+            bus.publish_candle(c["symbol"], int(c["interval"]), (
+                _parse_ts(c["interval_begin"]), float(c["open"]), float(c["high"]),
+                float(c["low"]), float(c["close"]), float(c["volume"])))
+
+
+class KrakenStream:
+    """Background WebSocket client feeding a MarketBus."""
+
+    def __init__(self, symbols: Iterable[str], bus: MarketBus | None = None,
+                 url: str = WS_URL, intervals: Iterable[int] = OHLC_INTERVALS):
+        self.symbols   = list(symbols)
+        self.bus       = bus or _bus
+        self.url       = url
+        self.intervals = list(intervals)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stop: asyncio.Event | None = None
+        self._thread: threading.Thread | None = None
+        self.ready     = threading.Event()
+
+    def start(self) -> "KrakenStream":
+        self._thread = threading.Thread(target=self._thread_main, name="kraken-ws", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self._loop and self._stop:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _thread_main(self) -> None:
+        asyncio.run(self._run())
+
+    def _subscriptions(self) -> list[dict]:
+        subs = [{"method": "subscribe",
+                 "params": {"channel": "ticker", "symbol": self.symbols}}]
+        for interval in self.intervals:
+            subs.append({"method": "subscribe",
+                         "params": {"channel": "ohlc", "symbol": self.symbols,
+                                    "interval": interval}})
+        return subs
+
+    async def _run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        delay = 1.0
+        async with aiohttp.ClientSession() as session:
+            while not self._stop.is_set():
+                try:
+                    async with session.ws_connect(self.url, heartbeat=20) as ws:
+                        for sub in self._subscriptions():
+                            await ws.send_json(sub)
+                        self.bus.connected = True
+                        self.ready.set()
+                        delay = 1.0
+                        logger.info("Stream connected to %s (%d symbols)", self.url, len(self.symbols))
+                        await self._read(ws)
+                except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                    logger.warning("Stream error: %s", e)
+                finally:
+                    self.bus.connected = False      # readers fall back to REST
+                if self._stop.is_set():
+                    break
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                delay = min(delay * 2, RECONNECT_MAX)
+
+    async def _read(self, ws) -> None:
+        stop = asyncio.ensure_future(self._stop.wait())
+        try:
+            while not self._stop.is_set():
+                recv = asyncio.ensure_future(ws.receive())
+                done, _ = await asyncio.wait({recv, stop}, return_when=asyncio.FIRST_COMPLETED)
+                if stop in done:
+                    recv.cancel()
+                    await ws.close()
+                    return
+                msg = recv.result()
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    logger.info("Stream closed (%s)", msg.type)
+                    return
+                handle_message(self.bus, json.loads(msg.data), time.time())
+        finally:
+            stop.cancel()
+
+
+_stream: KrakenStream | None = None
+
+
+def start_stream(symbols: Iterable[str], url: str = WS_URL) -> KrakenStream:
+    """Start (once) the process-wide feed for `symbols`."""
+    global _stream
+    if _stream is None:
+        _stream = KrakenStream(symbols, _bus, url).start()
+    return _stream
@@ -0,0 +1,214 @@
+"""
+sweep.py  -  Batched parameter sweep of the momentum strategy
+-------------------------------------------------------------
+• Evaluates a grid of (buy_fee, stop_loss_pct, trigger_profit,
+  momentum_window) combinations, each at every MIN_SCORE_THRESHOLD value, in
+  one pass per stored series, under the model the live ranking runs
+  (scripts/rank_state.py): refits every REFIT_EVERY rows, causal tallies of
+  closed trades over a sliding WINDOW.
+• Centroids, cluster labels, refits and momentum scores do not depend on the
+  trade parameters, so `prepare_series` replays a fresh SeriesState once
+  and keeps its walk plan.  `_sweep_series` is a numba prange over the
+  combinations that re-walks that plan with rank_state's `_walk` kernel and
+  the combination's parameters.
+• An entry is taken when the current() score of its row (succ / (trades +
+  2), as find_good_clusters_momentum ranks clusters) clears the threshold;
+  it is then summed: how many entries, how many won, and their return.
+  Trades still open at the end are valued at the last price.
+• Symbol scores are reduced across timeframes as analyze_coins does:
+  Σsucc / (Σtrades + 10) over each series' last current().  The result
+  gives how many symbols the buyer would pick at each threshold.
+• `python -m scripts.sweep` runs the grid over data/historical and writes one
+  CSV row per (combination, threshold).
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from numba import njit, prange
+
+from scripts import candle_store, rank, rank_state
+from scripts.resample import period_ms
+from scripts.rank_state import N_CLUSTERS, OPEN, _current, _walk
+
+logger = logging.getLogger(__name__)
+
+# ───────────────────────────── Config ────────────────────────────────────────
+HIST_DIR    = candle_store.BASE_OUTPUT_DIR
+OUTPUT_FILE = "data/sweep_results.csv"
+
+DEFAULT_GRID = {
+    "buy_fee":         [0.0025],
+    "stop_loss_pct":   [0.02, 0.04, 0.06, 0.08, 0.10, 0.12],
+    "trigger_profit":  [0.01, 0.02, 0.03, 0.05],
+    "momentum_window": [20, 40, 60, 90],
+}
+DEFAULT_THRESHOLDS = [0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8]
+
+PARAMS = list(DEFAULT_GRID)
+
+
+# ───────────────────────────── Kernel ────────────────────────────────────────
+@njit(cache=True, parallel=True)
+def _sweep_series(mid_px, labels, mom, bounds, refit_at, refit_labels, params, mom_wins, thresholds):
+    """
+    Per combination k: out[k, t] = (entries, wins, Σ return) of the entries
+    whose current() score clears thresholds[t], and current[k] = (successes,
+    trades) of current() after the last row.
+    """
+    n_comb, n_thr, n = params.shape[0], thresholds.size, mid_px.size
+    out     = np.zeros((n_comb, n_thr, 3))
+    current = np.zeros((n_comb, 2), dtype=np.int64)
+    gidx    = np.arange(n)
+
+    for k in prange(n_comb):
+        buy_fee, sl_pct, trig_pct = params[k, 0], params[k, 1], params[k, 2]
+        label   = labels.copy()
+        entry   = mid_px * (1.0 + buy_fee)
+        sl      = entry * (1.0 - sl_pct)
+        raised  = np.zeros(n, dtype=np.bool_)
+        outcome = np.full(n, OPEN, dtype=np.int8)
+        exits   = np.full(n, mid_px[n - 1])
+        succ    = np.zeros(N_CLUSTERS, dtype=np.int64)
+        tot     = np.zeros(N_CLUSTERS, dtype=np.int64)
+        cur     = np.zeros((n, 3), dtype=np.int64)
+
+        lo = 0
+        for s in range(bounds.shape[0]):
+            a, b = bounds[s, 0], bounds[s, 1]
+            lo = _walk(label, mid_px, entry, sl, raised, outcome, gidx, mom[a:b + 1], succ, tot,
+                       lo, a, b, cur[a:b + 1], trig_pct, mom_wins[k], exits)
+            if refit_at[s + 1] > refit_at[s]:           # SeriesState._refit: relabel, recount
+                label[lo:b + 1] = refit_labels[refit_at[s]:refit_at[s + 1]]
+                succ[:] = 0
+                tot[:] = 0
+                for i in range(lo, b + 1):
+                    if label[i] >= 0 and outcome[i] != OPEN:
+                        tot[label[i]] += 1
+                        succ[label[i]] += outcome[i]
+                cur[b, 0], cur[b, 1], cur[b, 2] = _current(label, mid_px, entry, outcome,
+                                                           succ, tot, lo, b)
+
+        for i in range(n - 1):
+            if cur[i, 0] < 0:
+                continue
+            score = cur[i, 1] / (cur[i, 2] + 2)
+            ret   = exits[i] / entry[i] - 1.0
+            for t in range(n_thr):
+                if score >= thresholds[t]:
+                    out[k, t, 0] += 1
+                    out[k, t, 1] += exits[i] - entry[i] > 0
+                    out[k, t, 2] += ret
+        if n and cur[n - 1, 0] >= 0:
+            current[k, 0], current[k, 1] = cur[n - 1, 1], cur[n - 1, 2]
+    return out, current
+
+
+# ───────────────────────────── Inputs ────────────────────────────────────────
+def expand_grid(grid: dict[str, list]) -> pd.DataFrame:
+    """One row per combination, columns in PARAMS order."""
+    return pd.DataFrame(list(itertools.product(*(grid[p] for p in PARAMS))), columns=PARAMS)
+
+
+def prepare_series(recs: np.ndarray, period: int) -> dict[str, np.ndarray]:
+    """A fresh SeriesState's walk plan over `recs` (`period`-ms candles), shared by every combination."""
+    plan: list = []
+    rank_state.SeriesState(period).advance(np.asarray(recs), plan=plan)
+    refits = [p[5] if p[5] is not None else np.empty(0, dtype=np.int32) for p in plan]
+    return {
+        "mid":          np.concatenate([p[2] for p in plan]),
+        "labels":       np.concatenate([p[3] for p in plan]),
+        "mom":          np.concatenate([p[4] for p in plan]),
+        "bounds":       np.array([p[:2] for p in plan], dtype=np.int64),
+        "refit_at":     np.r_[0, np.cumsum([len(r) for r in refits])].astype(np.int64),
+        "refit_labels": np.concatenate(refits).astype(np.int32),
+    }
+
+
+def sweep_series(series: dict[str, np.ndarray], combos: pd.DataFrame,
+                 thresholds) -> tuple[np.ndarray, np.ndarray]:
+    params = combos[["buy_fee", "stop_loss_pct", "trigger_profit"]].to_numpy(np.float64)
+    return _sweep_series(series["mid"], series["labels"], series["mom"], series["bounds"],
+                         series["refit_at"], series["refit_labels"], np.ascontiguousarray(params),
+                         combos["momentum_window"].to_numpy(np.int64),
+                         np.asarray(thresholds, dtype=np.float64))
+
+
+# ───────────────────────────── Driver ────────────────────────────────────────
+def run_sweep(
+        grid: dict[str, list] = DEFAULT_GRID,
+        thresholds=DEFAULT_THRESHOLDS,
+        base: str = HIST_DIR,
+        timeframes=tuple(rank.MAX_LOOKBACK_FOR_720_HOURS),
+        rows: int = rank.TARGET_ROWS,
+) -> pd.DataFrame:
+    """Sweep every symbol/timeframe under `base`; one row per (combination, threshold)."""
+    combos = expand_grid(grid)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    totals = np.zeros((len(combos), len(thresholds), 3))
+    symbol_scores = []
+
+    for name in sorted(os.listdir(base)) if os.path.isdir(base) else []:
+        succ = np.zeros(len(combos), dtype=np.int64)
+        trades = np.zeros(len(combos), dtype=np.int64)
+        for tf in timeframes:
+            path = os.path.join(base, name, f"{tf}{candle_store.EXTENSION}")
+            if not candle_store.exists(path):
+                continue
+            recs = candle_store.read(path, tail=rows)
+            if len(recs) < 2:
+                continue
+            out, current = sweep_series(prepare_series(recs, period_ms(tf)), combos, thresholds)
+            totals += out
+            succ += current[:, 0]
+            trades += current[:, 1]
+        if trades.any():
+            symbol_scores.append(np.where(trades > 0, succ / (trades + 10), -np.inf))
+        logger.info("Swept %s", name)
+
+    scores = np.array(symbol_scores).reshape(-1, len(combos))
+    table = combos.loc[combos.index.repeat(len(thresholds))].reset_index(drop=True)
+    table["min_score"]   = np.tile(thresholds, len(combos))
+    entries, wins, ret   = totals.reshape(-1, 3).T
+    table["entries"]     = entries.astype(np.int64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        table["win_rate"]    = wins / entries
+        table["mean_return"] = ret / entries
+    table["symbols"]     = (scores[:, :, None] >= thresholds[None, None, :]).sum(axis=0).reshape(-1)
+    return table
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Parameter sweep over the stored candle history")
+    ap.add_argument("--buy-fee", type=float, nargs="+", default=DEFAULT_GRID["buy_fee"])
+    ap.add_argument("--stop-loss", type=float, nargs="+", default=DEFAULT_GRID["stop_loss_pct"])
+    ap.add_argument("--trigger", type=float, nargs="+", default=DEFAULT_GRID["trigger_profit"])
+    ap.add_argument("--mom-window", type=int, nargs="+", default=DEFAULT_GRID["momentum_window"])
+    ap.add_argument("--min-score", type=float, nargs="+", default=DEFAULT_THRESHOLDS)
+    ap.add_argument("--timeframes", nargs="+", default=list(rank.MAX_LOOKBACK_FOR_720_HOURS))
+    ap.add_argument("--base", default=HIST_DIR)
+    ap.add_argument("--out", default=OUTPUT_FILE)
+    return ap.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    grid = {"buy_fee": args.buy_fee, "stop_loss_pct": args.stop_loss,
+            "trigger_profit": args.trigger, "momentum_window": args.mom_window}
+    t0 = time.perf_counter()
+    table = run_sweep(grid, args.min_score, args.base, args.timeframes)
+    table.to_csv(args.out, index=False, float_format="%.6g")
+    best = table[table["entries"] > 0].sort_values("mean_return", ascending=False).head(10)
+    print(best.to_string(index=False))
+    print(f"{len(table)} rows -> {args.out} in {time.perf_counter() - t0:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
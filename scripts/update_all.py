@@ -1,7 +1,9 @@
 """
 Neptune trading‑bot maintenance script
 -------------------------------------
-• Keeps local JSON books (portfolio, positions, pending orders) in sync with Kraken.
+• Keeps the local books (portfolio, positions, pending orders) in sync with Kraken.
+  They live in the SQLite state store (scripts/state_store.py); only changed rows
+  are written.
 • Survives API hiccups by retrying and, if necessary, skipping balance/position refresh for
   the current cycle.
 • All runtime messages are written to *log.txt* instead of stdout.
@@ -9,19 +11,20 @@ Neptune trading‑bot maintenance script
 
 from __future__ import annotations
 
-import json
-import os
 import time
 import logging
 from typing import Optional, Dict, Any
 
-import ccxt  # type: ignore
 from dotenv import load_dotenv  # type: ignore
 from datetime import datetime
 
-from scripts.historical import historical, update_events
-from scripts.utilities import update_log_status
+from scripts.historical import historical, update_events, sync_fills
+from scripts.utilities import update_log_status, load_json, save_json
 from scripts.buyer import sync_open_orders
+from scripts.order_sync import reconcile_orders
+from scripts.exchange import get_exchange
+from scripts.prices import get_price
+from scripts.ledger import get_ledger
 
 
 # ---------------------------------------------------------------------------
@@ -46,36 +49,12 @@ POSITIONS_FILE = "data/positions.json"
 PENDING_FILE = "data/pending_orders.json"
 
 # ---------------------------------------------------------------------------
-# 2.  Kraken client (with legacy balance endpoint fallback)
+# 2.  Kraken client: the shared gateway (scripts.exchange) already uses the
+#     legacy /0/private/Balance endpoint and a 20 s time-out.
 # ---------------------------------------------------------------------------
-kraken = ccxt.kraken({
-    "apiKey": os.getenv("KRAKEN_API_KEY"),
-    "secret": os.getenv("KRAKEN_API_SECRET"),
-    "enableRateLimit": True,
-    # Use the stable /0/private/Balance endpoint rather than BalanceEx
-    "options": {"fetchBalanceMethod": "privatePostBalance"},
-    # Increase time‑out for slow responses (ms)
-    "timeout": 20_000,
-})
 
 # ---------------------------------------------------------------------------
-# 3.  JSON helpers
-# ---------------------------------------------------------------------------
-
-def load_json(path: str) -> Dict[str, Any]:
-    if not os.path.exists(path):
-        return {}
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-
-def save_json(data: Dict[str, Any], path: str) -> None:
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
-
-# ---------------------------------------------------------------------------
-# 4.  Resilient Kraken wrappers
+# 3.  Resilient Kraken wrappers
 # ---------------------------------------------------------------------------
 
 def _retry_delay(attempt: int, base: float = 1.0) -> float:
@@ -86,7 +65,7 @@ def _retry_delay(attempt: int, base: float = 1.0) -> float:
 def safe_fetch_balances(max_attempts: int = 3) -> Optional[Dict[str, Any]]:
     for attempt in range(1, max_attempts + 1):
         try:
-            return kraken.fetch_balance()
+            return get_exchange().fetch_balance()
         except Exception as exc:
             logging.warning("fetch_balance attempt %d/%d failed: %s", attempt, max_attempts, exc)
             if attempt < max_attempts:
@@ -96,9 +75,12 @@ def safe_fetch_balances(max_attempts: int = 3) -> Optional[Dict[str, Any]]:
 
 
 def fetch_and_save_positions():
+    """positions.json from the balance and the FIFO ledger (only new fills are fetched)."""
+    kraken = get_exchange()
+    ledger = get_ledger()
     try:
         balances = kraken.fetch_balance()
-        trades = kraken.fetch_my_trades()
+        sync_fills(kraken)                 # ledger + events logs, one account-wide pass
     except Exception as e:
         logging.error("Could not fetch positions: %s", e)
         return
@@ -111,39 +93,30 @@ def fetch_and_save_positions():
     }
 
     cleaned = {}
+    prices = {}
+
+    for coin in owned:
+        symbol = f"{coin}/USD"
+        current_price = get_price(symbol) if symbol in (kraken.markets or {}) else None
+        if current_price is not None:
+            prices[symbol] = current_price
 
-    for symbol in owned:
-        # infer trade symbol, e.g. XBT/USD → XXBTZUSD
-        market = kraken.market(symbol + "/USD") if symbol != "USD" else None
-        current_price = None
-        if market:
-            ticker = kraken.fetch_ticker(market["symbol"])
-            current_price = ticker["last"]
-
-        # aggregate trades to estimate entry price and time
-        total_qty = 0
-        total_cost = 0
-        last_trade_time = None
-
-        for t in trades:
-            if t["symbol"].startswith(symbol) and t["side"] == "buy":
-                total_qty += t["amount"]
-                total_cost += t["amount"] * t["price"]
-                last_trade_time = t["timestamp"]
-
-        entry_price = total_cost / total_qty if total_qty else None
+        pos = ledger.position(symbol, current_price)
+        entry_price = pos["entry_price"]
         filled_at = (
-            datetime.utcfromtimestamp(last_trade_time / 1000).isoformat()
-            if last_trade_time else None
+            datetime.utcfromtimestamp(pos["last_buy"] / 1000).isoformat()
+            if pos["last_buy"] else None
         )
 
-        cleaned[symbol] = {
-            "qty": float(owned[symbol]),
+        cleaned[coin] = {
+            "qty": float(owned[coin]),
             "entry_price": round(entry_price, 4) if entry_price else None,
             "current_price": round(current_price, 4) if current_price else None,
             "filled_at": filled_at,
         }
 
+    ledger.mark(prices)
+    ledger.save()
     save_json(cleaned, POSITIONS_FILE)
     logging.info("positions.json populated (%d active).", len(cleaned))
 
@@ -151,14 +124,13 @@ def fetch_and_save_positions():
 
 
 def fetch_current_price(symbol: str) -> Optional[float]:
-    try:
-        return kraken.fetch_ticker(symbol)["last"]
-    except Exception as exc:
-        logging.warning("Failed to fetch price for %s: %s", symbol, exc)
-        return None
+    price = get_price(symbol)              # shared bulk-ticker snapshot
+    if price is None:
+        logging.warning("No price for %s in ticker snapshot", symbol)
+    return price
 
 # ---------------------------------------------------------------------------
-# 5.  Update routines
+# 4.  Update routines
 # ---------------------------------------------------------------------------
 
 def update_portfolio() -> None:
@@ -180,7 +152,6 @@ def update_portfolio() -> None:
             usd_value = amount * price
             updated[symbol] = round(usd_value, 6)
             logging.info("%s: %.6f ≈ $%.2f", symbol, amount, usd_value)
-        time.sleep(0.3)  # polite rate limit
 
     save_json(updated, PORTFOLIO_FILE)
     logging.info("portfolio.json updated (%d assets).", len(updated))
@@ -230,32 +201,11 @@ def verify_positions() -> None:
 
 
 def clean_pending_orders() -> None:
-    pending = load_json(PENDING_FILE)
-    if not pending:
-        return
-
-    updated: list[Dict[str, Any]] = []
-    for order in pending:
-        order_id = order.get("order_id")
-        if not order_id:
-            logging.warning("Pending order missing 'order_id': %s", order)
-            continue
-
-        try:
-            status = kraken.fetch_order(order_id)
-            if status["status"] in ("open", "pending"):
-                updated.append(order)
-            else:
-                logging.info("Order %s is %s - removing from pending list", order_id, status["status"])
-        except Exception as exc:
-            logging.warning("Could not fetch order %s: %s", order_id, exc)
-        time.sleep(0.3)
-
-    save_json(updated, PENDING_FILE)
-    logging.info("pending_orders.json cleaned (%d remaining).", len(updated))
+    """Drop resolved pending orders; sync_open_orders' bulk pass already does this."""
+    reconcile_orders()
 
 # ---------------------------------------------------------------------------
-# 6.  Orchestration
+# 5.  Orchestration
 # ---------------------------------------------------------------------------
 
 def update_all(assets, status) -> None:
@@ -267,9 +217,6 @@ def update_all(assets, status) -> None:
     sync_open_orders()
     verify_positions()
 
-    update_log_status(status=status, message="Cleaning pending orders...")
-    clean_pending_orders()
-
     update_log_status(status=status, message="Updating historical data...")
     historical(assets=assets, status=status)
 
@@ -1,11 +1,15 @@
 import json
 import os
-import ccxt #type: ignore
 from dotenv import load_dotenv        # type: ignore
 from rich.console import Console        # type: ignore
 from rich.logging import RichHandler    # type: ignore
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
+from pathlib import Path
+
+from scripts import state_store
+from scripts.exchange import get_exchange
+from scripts import stream
 
 console = Console()
 
@@ -38,12 +42,19 @@ def update_log_status(status, message: str) -> None:
 
 
 # --- Utilities ---
-from pathlib import Path
 
 BASE = Path(__file__).parent.parent   # neptune/scripts → neptune/
 
 
+def state() -> state_store.StateStore:
+    """The SQLite state store under BASE (positions, pending orders, portfolio, monitor)."""
+    return state_store.get_store(BASE)
+
+
 def load_json(path):
+    table = state_store.table_for(path)
+    if table is not None:
+        return state().load(table)
     full = os.path.join(BASE, path)
     if os.path.exists(full):
         with open(full, "r", encoding="utf-8") as f:
@@ -52,34 +63,50 @@ def load_json(path):
         return {}
 
 def save_json(obj, path):
+    table = state_store.table_for(path)
+    if table is not None:
+        state().save(table, obj)             # changed rows only, one transaction
+        return
     full = os.path.join(BASE, path)
     # ensure the directory exists
     os.makedirs(os.path.dirname(full), exist_ok=True)
     with open(full, "w", encoding="utf-8") as f:
         json.dump(obj, f, indent=2)
-        
-        
-kraken = ccxt.kraken({
-    "apiKey":  os.getenv("KRAKEN_API_KEY"),
-    "secret":  os.getenv("KRAKEN_API_SECRET"),
-    "enableRateLimit": True,
-})
-        
+
+
+
+# --- Clock (swappable, e.g. by the backtester) ---
+_clock = None
+
+
+def utc_now() -> datetime:
+    """Timezone-aware current UTC time, from the installed clock if any."""
+    return _clock() if _clock is not None else datetime.now(timezone.utc)
+
+
+def set_clock(clock) -> None:
+    """Install a callable returning an aware UTC datetime; None restores the wall clock."""
+    global _clock
+    _clock = clock
+
+
+# --- Exchange helpers (shared gateway client) ---
+
 def fetch_order_status(order_id: str):
     try:
-        return kraken.fetch_order(order_id)
+        return get_exchange().fetch_order(order_id)
     except Exception as e:
         logger.warning("Could not fetch order %s: %s", order_id, e)
         return None
 
 def get_price(symbol: str):
-    try:
-        return kraken.fetch_ticker(symbol)["last"]
-    except Exception as e:
-        logger.warning("Failed to fetch price for %s: %s", symbol, e)
-        return None
+    """Live streamed price, else the shared bulk-ticker snapshot (one request per TTL)."""
+    price = stream.get_price(symbol)
+    if price is None:
+        logger.warning("Failed to fetch price for %s", symbol)
+    return price
 
 def get_quantity(symbol: str):
     base = symbol.split("/")[0]
-    balances = kraken.fetch_balance()
+    balances = get_exchange().fetch_balance()
     return balances["free"].get(base, 0)
\ No newline at end of file
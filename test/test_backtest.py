@@ -0,0 +1,82 @@
+import ccxt  # type: ignore
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts import candle_store, exchange, prices, quantizer, rank_state, utilities
+from scripts.backtest import Backtest, round_trips
+from scripts.sim_exchange import SimExchange
+
+
+@pytest.fixture(autouse=True)
+def small_lut(monkeypatch):
+    monkeypatch.setattr(quantizer, "_lut", quantizer.LloydMaxLUT.build(size=24))
+
+
+def _series(n, seed=0, drift=0.0003):
+    rng = np.random.default_rng(seed)
+    close = 2.0 * np.exp(np.cumsum(rng.normal(drift, 0.01, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    wick = np.abs(rng.normal(0, 0.005, (2, n))) * close
+    recs = np.empty(n, dtype=candle_store.record_dtype())
+    recs["timestamp"] = 1_699_999_200_000 + np.arange(n) * 900_000
+    recs["open"], recs["close"] = open_, close
+    recs["high"] = np.maximum(open_, close) + wick[0]
+    recs["low"] = np.minimum(open_, close) - wick[1]
+    recs["volume"] = 1.0
+    return recs
+
+
+def _bar(ts, o, h, l, c):
+    bar = np.zeros(1, dtype=candle_store.record_dtype())
+    bar["timestamp"], bar["open"], bar["high"], bar["low"], bar["close"] = ts, o, h, l, c
+    return bar[0]
+
+
+def test_sim_exchange_fills():
+    bars = [_bar(0, 10, 10, 10, 10), _bar(900_000, 10, 11, 9.5, 10),
+            _bar(1_800_000, 8.5, 9, 8, 8.8)]
+    sim = SimExchange({"ABC/USD": np.array(bars)}, cash=1000.0, fee=0.01)
+    sim.advance(900_000, {"ABC/USD": bars[0]})
+    oid = sim.create_limit_buy_order("ABC/USD", 50, 9.0)["id"]
+    with pytest.raises(ccxt.InsufficientFunds):                 # 450 USD reserved
+        sim.create_limit_buy_order("ABC/USD", 60, 9.5)
+
+    sim.advance(1_800_000, {"ABC/USD": bars[1]})
+    assert sim.fetch_order(oid)["status"] == "open"
+    sim.advance(2_700_000, {"ABC/USD": bars[2]})                  # opens through the limit
+    order = sim.fetch_order(oid)
+    assert order["status"] == "closed" and order["average"] == 8.5
+    assert sim.balance == pytest.approx({"USD": 1000 - 50 * 8.5 * 1.01, "ABC": 50})
+
+    sim.create_market_sell_order("ABC/USD", 50)
+    assert sim.balance["USD"] == pytest.approx(1000 - 50 * 8.5 * 1.01 + 50 * 8.8 * 0.99)
+    with pytest.raises(ccxt.InsufficientFunds):
+        sim.create_market_sell_order("ABC/USD", 1)
+    assert [r[0] for r in sim.fetch_ohlcv("ABC/USD", "15m")] == [0, 900_000, 1_800_000]
+    assert [r[0] for r in sim.fetch_ohlcv("ABC/USD", "30m")] == [0]      # closed bars only
+
+    trades = round_trips(pd.DataFrame(sim.fills))
+    assert trades["pnl"].iloc[0] == pytest.approx(50 * 8.8 * 0.99 - 50 * 8.5 * 1.01)
+
+
+def test_backtest_replays_the_bot(tmp_path):
+    n = rank_state.SPAN + 300
+    candles = {"AAA/USD": _series(n, 1, 0.001), "BBB/USD": _series(n, 2),
+               "CCC/USD": _series(n - 50, 3, -0.0005)}
+    base = utilities.BASE
+
+    res = Backtest(candles, cash=10_000, workers=1, workspace=str(tmp_path)).run()
+
+    assert utilities.BASE == base and exchange._exchange is None and prices._snapshot is None
+    assert len(res.equity) == 300 and res.equity.index.is_monotonic_increasing
+    assert res.equity.iloc[0] == pytest.approx(10_000, rel=0.01)
+    assert len(res.fills) and set(res.fills["side"]) <= {"buy", "sell"}
+
+    # every buy went through buyer() at BUY_PORTFOLIO_PERCENT, every sell closes one
+    buys, sells = res.fills[res.fills["side"] == "buy"], res.fills[res.fills["side"] == "sell"]
+    assert (buys["qty"] * buys["price"] <= 0.1 * 10_000 * 1.5).all()
+    assert len(res.trades) == len(sells)
+    s = res.summary()
+    assert s["pnl"] == pytest.approx(s["end_equity"] - s["start_equity"])
+    assert (tmp_path / "data" / "ranked_coins.json").exists()           # state in the workspace
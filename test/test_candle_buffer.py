@@ -0,0 +1,86 @@
+import numpy as np
+
+from scripts import candle_buffer, candle_store, exchange, indicators, utilities
+from scripts.backtest import to_datetime
+from scripts.candle_buffer import CandleBuffers
+from scripts.resample import period_ms, resample
+from scripts.sim_exchange import SimExchange
+
+FINE, COARSE = period_ms("15m"), period_ms("30m")
+
+
+def _fine(n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 3.0 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    recs = np.zeros(n, dtype=candle_store.record_dtype())
+    recs["timestamp"] = 1_700_000_000_000 - 1_700_000_000_000 % COARSE + np.arange(n) * FINE
+    recs["open"] = np.r_[close[0], close[:-1]]
+    recs["close"] = close
+    recs["high"] = np.maximum(recs["open"], close) * 1.001
+    recs["low"] = np.minimum(recs["open"], close) * 0.999
+    return recs
+
+
+def test_seeded_buffer_tracks_the_batch_score(tmp_path):
+    fine = _fine(1200)
+    coarse = resample(fine, COARSE)
+    store = candle_store.store_path("ABC/USD", "30m", str(tmp_path))
+    candle_store.create(store)
+    candle_store.append(store, coarse[:400])                    # the rest only via REST
+
+    sim = SimExchange({"ABC/USD": fine}, cash=0.0)
+    sim.advance(int(fine["timestamp"][900]), {})
+    exchange.set_exchange(sim)
+    utilities.set_clock(lambda: to_datetime(sim.now))
+    try:
+        buffers = CandleBuffers(base=str(tmp_path))
+        buf = buffers.get("ABC/USD")
+        first = 450 - candle_buffer.SEED_BARS                   # 900 fine bars = 450 closed
+        assert [b[0] for b in buf.bars] == coarse["timestamp"][390:450].tolist()
+
+        for i in range(900, 1200):
+            sim.advance(int(fine["timestamp"][i]) + FINE, {})
+            buffers.on_candle("ABC/USD", fine[i])
+            closes = resample(fine[:i + 1], COARSE)["close"][first:]
+            if sim.now % COARSE == 0:                           # the tick opens the next bar
+                closes = np.r_[closes, closes[-1]]
+            raw = indicators.momentum_raw(closes)[-1:]
+            std = np.std(closes[-candle_buffer.WINDOW:], ddof=1)
+            expected = indicators.momentum_score(raw, closes[-1:], std)[0]
+            assert abs(buffers.score("ABC/USD", float(fine["close"][i])) - expected) < 1e-12
+
+        buffers.retain([])
+        assert buffers._buffers == {}
+    finally:
+        exchange.set_exchange(None)
+        utilities.set_clock(None)
+
+
+def test_stale_store_seeds_from_the_newest_bars(tmp_path):
+    fine = _fine(2000, seed=1)
+    coarse = resample(fine, COARSE)
+    store = candle_store.store_path("ABC/USD", "30m", str(tmp_path))
+    candle_store.create(store)
+    candle_store.append(store, coarse[:500])                    # 500 bars behind
+
+    sim = SimExchange({"ABC/USD": fine}, cash=0.0)
+    sim.advance(int(fine["timestamp"][-1]) + FINE, {})
+    exchange.set_exchange(sim)
+    try:
+        recs = candle_buffer.load_history("ABC/USD", "30m", bars=240, base=str(tmp_path),
+                                          now_ms=sim.now)
+    finally:
+        exchange.set_exchange(None)
+    np.testing.assert_array_equal(recs["timestamp"], coarse["timestamp"][-240:])
+
+
+def test_ticks_build_the_forming_bar():
+    buf = candle_buffer.CandleBuffer("30m", window=3)
+    for ts, px in ((0, 10.0), (60_000, 12.0), (120_000, 9.0), (COARSE, 11.0),
+                   (COARSE - 1, 99.0), (2 * COARSE + 5, 8.0)):
+        buf.tick(px, ts)
+
+    assert [b[:5] for b in buf.bars] == [(0, 10.0, 12.0, 9.0, 9.0), (COARSE, 11.0, 11.0, 11.0, 11.0)]
+    assert buf.forming[:5] == [2 * COARSE, 8.0, 8.0, 8.0, 8.0]
+    np.testing.assert_array_equal(buf.closes(), [9.0, 11.0, 8.0])
+    assert buf.score() == 0.0                                   # fewer than MIN_ROWS bars
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from scripts import candle_store
+
+
+def _frame(start, periods):
+    idx = pd.date_range(start, periods=periods, freq="15min", tz="UTC", name="timestamp")
+    return pd.DataFrame({c: np.arange(periods, dtype=float) + k
+                         for k, c in enumerate(candle_store.COLUMNS)}, index=idx)
+
+
+def test_append_merge_roundtrip(tmp_path):
+    path = candle_store.store_path("BTC/USD", "15m", tmp_path)
+    df = _frame("2025-01-01", 10)
+
+    assert candle_store.append(path, df.iloc[:6]) == 6
+    assert candle_store.append(path, df.iloc[4:]) == 4           # overlap ignored
+    assert candle_store.row_count(path) == 10
+
+    forming = df.iloc[-1:].copy()
+    forming["close"] = 99.0
+    assert candle_store.append(path, forming) == 0               # rewritten in place
+    assert candle_store.read(path)["close"][-1] == 99.0
+
+    older = _frame("2024-12-31 23:30", 2)
+    assert candle_store.merge(path, older) == 2
+    out = candle_store.read_frame(path)
+    assert out.index.is_monotonic_increasing and len(out) == 12
+
+
+def test_migrate_csv_tree(tmp_path):
+    df = _frame("2025-01-01", 5)
+    (tmp_path / "eth_usd").mkdir()
+    df.to_csv(tmp_path / "eth_usd" / "1h.csv")
+
+    assert candle_store.migrate_csv_tree(str(tmp_path)) == 1
+    out = candle_store.read_frame(str(tmp_path / "eth_usd" / "1h.ohlcv"))
+    pd.testing.assert_frame_equal(out, df, check_freq=False)
@@ -0,0 +1,69 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts import candle_store, centroids, quantizer
+
+
+@pytest.fixture(autouse=True)
+def small_lut(monkeypatch):
+    monkeypatch.setattr(quantizer, "_lut", quantizer.LloydMaxLUT.build(size=24))
+
+
+def _legacy_success(mid, boundary=centroids.BOUNDARY):
+    """The per-row look-ahead find_good_clusters() replaced."""
+    out = []
+    for i in range(len(mid)):
+        upper, lower = (1 + boundary) * mid[i], (1 - boundary) * mid[i]
+        future = mid[i + 1:]
+        hit_upper = np.argmax(future >= upper) if np.any(future >= upper) else None
+        hit_lower = np.argmax(future <= lower) if np.any(future <= lower) else None
+        if hit_upper is not None and hit_lower is not None:
+            out.append(hit_upper < hit_lower)
+        else:
+            out.append(hit_upper is not None)
+    return np.array(out)
+
+
+def _candles(n, seed=0, tick=None):
+    rng = np.random.default_rng(seed)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    if tick:                                     # coarse prices: exact touches
+        close = np.round(close / tick) * tick
+    open_ = np.r_[close[0], close[:-1]]
+    return pd.DataFrame({"open": open_, "high": np.maximum(open_, close) * 1.005,
+                         "low": np.minimum(open_, close) * 0.995, "close": close})
+
+
+def test_first_touch_matches_look_ahead_loop():
+    for seed, tick in ((0, None), (1, 0.5), (2, 2.0)):
+        df = _candles(900, seed, tick)
+        df["laplace_cluster"] = np.random.default_rng(seed).integers(0, 8, len(df))
+        out, summary = centroids.find_good_clusters(df)
+        success = _legacy_success(out["mid_price"].to_numpy())
+        np.testing.assert_array_equal(
+            centroids._first_touch_success(out["mid_price"].to_numpy(), centroids.BOUNDARY), success)
+        for row in summary.itertuples():
+            mask = df["laplace_cluster"].to_numpy() == row.cluster
+            assert (row.total, row.successes) == (mask.sum(), success[mask].sum())
+
+
+def test_ranked_scores_local_history_offline(tmp_path, monkeypatch):
+    monkeypatch.setattr(centroids, "fetch_kraken_ohlcv",
+                        lambda *a, **k: pytest.fail("network fetch in local mode"))
+    base = tmp_path / "historical"
+    for i, sym in enumerate(("BTC/USD", "ETH/USD")):
+        df = _candles(1000, seed=i)
+        df.index = pd.date_range("2024-01-01", periods=len(df), freq="1h", tz="UTC", name="timestamp")
+        df["volume"] = 1.0
+        path = candle_store.store_path(sym, "1h", base)
+        candle_store.create(path)
+        candle_store.append(path, candle_store.to_records(df))
+
+    out = tmp_path / "ranked.json"
+    result = centroids.ranked(base=str(base), output=str(out))
+    assert set(result) == {"BTC/USD", "ETH/USD"}
+    assert json.loads(out.read_text()) == result
+    assert len(centroids.load_local_ohlcv("BTC/USD", base=str(base))) == 720
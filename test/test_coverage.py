@@ -0,0 +1,44 @@
+import time
+
+import numpy as np
+
+from scripts import candle_store, coverage
+
+P = 15 * 60_000
+
+
+class Exchange:
+    """fetch_ohlcv over a fixed 15m series with an outage (no candles) inside."""
+
+    def __init__(self, now, outage):
+        last = now - now % P - P
+        self.ts = np.array([t for t in range(last - 699 * P, last + 1, P)
+                            if not outage[0] <= t < outage[1]])
+        self.calls = []
+
+    def fetch_ohlcv(self, symbol, timeframe, since, limit):
+        self.calls.append((since, limit))
+        ts = self.ts[self.ts >= since][:limit]
+        return [[int(t), 1.0, 2.0, 0.5, 1.5, 10.0] for t in ts]
+
+
+def test_plan_fills_holes_once(tmp_path):
+    now = int(time.time() * 1000)
+    start, end = now - 700 * P, now
+    outage = (now - now % P - 300 * P, now - now % P - 290 * P)
+    ex = Exchange(now, outage)
+
+    coverage.fill("BTC/USD", "15m", start, end, ex, str(tmp_path))
+    store = candle_store.store_path("BTC/USD", "15m", tmp_path)
+    assert candle_store.row_count(store) == len(ex.ts)
+
+    # punch a hole, as if an old cycle had missed some candles
+    recs = np.array(candle_store.read(store))
+    candle_store.write(store, np.concatenate([recs[:100], recs[140:]]))
+    assert coverage.plan(store, "15m", start, end) == [(int(recs["timestamp"][100]), 40)]
+
+    ex.calls.clear()
+    assert coverage.fill("BTC/USD", "15m", start, end, ex, str(tmp_path)) == 40
+    assert len(ex.calls) == 1
+    # outage is remembered as empty: nothing left to request
+    assert coverage.plan(store, "15m", start, end) == []
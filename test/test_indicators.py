@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+from ta.momentum import RSIIndicator, ROCIndicator
+from ta.trend import MACD
+
+from scripts import indicators
+from scripts.indicators import MomentumState
+
+
+def _close(n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 50 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    close[len(close) // 2:][:10] = close[len(close) // 2 - 1]          # flat run
+    return close
+
+
+def test_batch_matches_ta():
+    close = _close(2000)
+    s = pd.Series(close)
+    raw = indicators.momentum_raw(close)
+    macd = MACD(s)
+
+    np.testing.assert_allclose(raw[:, 0], RSIIndicator(s, 14).rsi(), rtol=0, atol=1e-12)
+    np.testing.assert_allclose(raw[:, 1], macd.macd() - macd.macd_signal(), rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(raw[:, 2], ROCIndicator(s, 5).roc())
+    np.testing.assert_array_equal(raw[:, 3], s.rolling(20).mean())
+
+
+def test_streaming_chunked_and_batch_agree():
+    close = _close(600, seed=1)
+    batch = indicators.momentum_raw(close)
+
+    st = MomentumState()
+    stream = np.array([st.update(c) for c in close])
+    np.testing.assert_array_equal(stream, batch)
+
+    st, parts = MomentumState(), []
+    for chunk in np.array_split(close, [3, 4, 40, 41, 300]):
+        parts.append(st.update_many(chunk))
+        st = MomentumState.from_dict(st.to_dict())              # survives persistence
+    np.testing.assert_array_equal(np.vstack(parts), batch)
+
+
+def test_latest_score_matches_monitor_formula():
+    close = _close(60, seed=2)
+    s = pd.Series(close)
+    macd = MACD(s)
+    expected = np.clip(((RSIIndicator(s, 14).rsi().iloc[-1] - 50) / 50
+                        + np.tanh((macd.macd() - macd.macd_signal()).iloc[-1] / s.std())
+                        + np.tanh(ROCIndicator(s, 5).roc().iloc[-1] / 10)
+                        + np.tanh((close[-1] / s.rolling(20).mean().iloc[-1] - 1) * 10)) / 4, -1, 1)
+
+    assert abs(indicators.latest_score(close) - expected) < 1e-12
+    assert indicators.latest_score(close[:29]) == 0.0
@@ -0,0 +1,41 @@
+import numpy as np
+from sklearn.cluster import KMeans
+
+from scripts import rank
+from scripts.kmeans import align, kmeans
+
+
+def _blobs(n, seed=0, shift=0.0):
+    rng = np.random.default_rng(seed)
+    means = np.arange(8)[:, None] * np.linspace(0.5, 1.5, 8)[None, :]
+    return means[rng.integers(0, 8, n)] + shift + rng.normal(0, 0.3, (n, 8))
+
+
+def test_matches_sklearn_inertia_and_is_deterministic():
+    x = _blobs(700)
+    fit = kmeans(x, 8)
+    ref = KMeans(n_clusters=8, random_state=42).fit(x)
+    assert fit.inertia_ <= ref.inertia_ * 1.01
+    again = kmeans(x, 8)
+    np.testing.assert_array_equal(fit.cluster_centers_, again.cluster_centers_)
+    np.testing.assert_array_equal(fit.predict(x), fit.labels_)
+
+
+def test_warm_start_keeps_cluster_identities():
+    prev = kmeans(_blobs(700, seed=1), 8)
+    drifted = _blobs(700, seed=2, shift=0.05)
+    warm = kmeans(drifted, 8, init=prev.cluster_centers_)
+    # every centre stays closest to its own previous centre
+    d = ((warm.cluster_centers_[:, None] - prev.cluster_centers_[None]) ** 2).sum(axis=2)
+    np.testing.assert_array_equal(d.argmin(axis=1), np.arange(8))
+    assert warm.n_iter_ < kmeans(drifted, 8).n_iter_ + 5
+
+    cold = kmeans(drifted, 8, seed=7).cluster_centers_
+    np.testing.assert_allclose(align(prev.cluster_centers_, cold), warm.cluster_centers_, atol=1e-6)
+
+
+def test_safe_cluster_skips_zero_rows_and_caps_k():
+    x = np.vstack([np.zeros((3, 8)), _blobs(5)])
+    labels, fit, quantize = rank.safe_cluster(x, k=8)
+    assert (labels[:3] == -1).all() and fit.n_clusters == 5
+    np.testing.assert_array_equal(quantize(x[3:]), labels[3:])
@@ -0,0 +1,89 @@
+import pytest
+
+from scripts.ledger import Ledger, TRADES_PAGE
+
+
+def _trade(i, ts, side, qty, price, symbol="BTC/USD"):
+    return {"id": f"T{i:04d}", "timestamp": ts, "symbol": symbol, "side": side,
+            "amount": qty, "price": price, "fee": {"cost": 0.1, "currency": "USD"}}
+
+
+class FakeKraken:
+    """TradesHistory stand-in: newest-first pages of TRADES_PAGE, `since` in seconds."""
+
+    def __init__(self, trades):
+        self.trades = trades
+        self.calls = 0
+
+    def fetch_my_trades(self, since=None, params={}):
+        self.calls += 1
+        hits = [t for t in self.trades if since is None or t["timestamp"] >= since // 1000 * 1000]
+        hits.sort(key=lambda t: t["timestamp"], reverse=True)
+        ofs = params.get("ofs", 0)
+        return sorted(hits[ofs:ofs + TRADES_PAGE], key=lambda t: t["timestamp"])
+
+
+def test_fifo_realized_and_unrealized(tmp_path):
+    ledger = Ledger(str(tmp_path / "ledger.json"))
+    ledger.apply_all([
+        _trade(1, 1_000, "buy", 1.0, 100.0),
+        _trade(2, 2_000, "buy", 1.0, 200.0),
+        _trade(3, 3_000, "sell", 1.5, 300.0),
+    ])
+    pos = ledger.position("BTC/USD", price=400.0)
+    # first lot fully sold (+200), half of the second (+50)
+    assert pos["realized"] == pytest.approx(250.0)
+    assert pos["qty"] == pytest.approx(0.5)
+    assert pos["entry_price"] == pytest.approx(200.0)
+    assert pos["unrealized"] == pytest.approx(100.0)
+    assert pos["fees"] == pytest.approx(0.3)
+
+
+def test_sync_is_incremental_and_idempotent(tmp_path):
+    path = str(tmp_path / "ledger.json")
+    trades = [_trade(i, 1_000_000 + i * 500, "buy" if i % 3 else "sell", 1.0, 100.0 + i)
+              for i in range(120)]
+    kraken = FakeKraken(trades[:70])
+
+    first = Ledger.load(path)
+    assert len(first.sync(kraken)) == 70
+
+    # restart from disk; same-second fills at the cursor are not re-applied
+    kraken.trades = trades
+    kraken.calls = 0
+    second = Ledger.load(path)
+    assert len(second.sync(kraken)) == 50
+    assert kraken.calls == 2                    # one full page + the tail page
+
+    full = Ledger(str(tmp_path / "full.json"))
+    full.apply_all(trades)
+    assert second.position("BTC/USD", 200.0) == full.position("BTC/USD", 200.0)
+    assert second.sync(kraken) == []
+
+
+def test_fills_partition_into_append_only_event_logs(tmp_path):
+    from scripts.historical import append_events, events_path, load_events
+
+    base = str(tmp_path / "historical")
+    trades = [_trade(i, 1_000_000 + i * 1000, "buy", 1.0, 10.0 + i,
+                     symbol="ETH/USD" if i % 2 else "SOL/USD") for i in range(6)]
+    kraken = FakeKraken(trades[:4])
+    ledger = Ledger(str(tmp_path / "ledger.json"))
+    sink = lambda fills: append_events(fills, base)
+
+    ledger.sync(kraken, on_fills=sink)
+    eth_log = events_path("ETH/USD", base)
+    assert len(load_events(eth_log)) == 2
+
+    # one new SOL fill: only SOL's log is touched
+    kraken.trades = trades[:5]
+    before = open(eth_log).read()
+    ledger.sync(kraken, on_fills=sink)
+    assert open(eth_log).read() == before
+    sol = load_events(events_path("SOL/USD", base))
+    assert list(sol["price"]) == [10.0, 12.0, 14.0]
+
+    # nothing new: one request, no writes
+    kraken.calls = 0
+    assert ledger.sync(kraken, on_fills=sink) == []
+    assert kraken.calls == 1
@@ -0,0 +1,71 @@
+import threading
+import time
+
+import ccxt  # type: ignore
+import pytest
+
+from scripts import buyer as buyer_mod
+from scripts import exchange, order_submit, utilities
+from scripts.order_submit import OrderRequest, OrderSubmitter
+
+
+class FakeKraken:
+    """Limit buys that take `delay` seconds; symbols in `reject` fail."""
+
+    def __init__(self, delay=0.0, reject=()):
+        self.delay = delay
+        self.reject = set(reject)
+        self.buys = []
+        self._lock = threading.Lock()
+
+    def create_limit_buy_order(self, symbol, amount, price):
+        time.sleep(self.delay)
+        if symbol in self.reject:
+            raise ccxt.InsufficientFunds(f"rejected {symbol}")
+        with self._lock:
+            self.buys.append((symbol, amount, price))
+            return {"id": f"O-{symbol}"}
+
+    def fetch_open_orders(self):
+        return []
+
+
+@pytest.fixture
+def kraken():
+    fake = FakeKraken()
+    exchange.set_exchange(fake)
+    yield fake
+    exchange.set_exchange(None)
+
+
+def test_batch_costs_about_one_round_trip(kraken, monkeypatch):
+    monkeypatch.setattr(exchange, "NONCE_WINDOW", 5.0)          # private calls may overlap
+    kraken.delay, kraken.reject = 0.2, {"BBB/USD"}
+    reqs = [OrderRequest(s, 1.0, 2.0) for s in ("AAA/USD", "BBB/USD", "CCC/USD", "DDD/USD")]
+
+    t0 = time.perf_counter()
+    results = OrderSubmitter(workers=4).submit(reqs)
+    assert time.perf_counter() - t0 < 0.4
+    assert [r.request for r in results] == reqs
+    assert [r.order_id for r in results] == ["O-AAA/USD", None, "O-CCC/USD", "O-DDD/USD"]
+    assert isinstance(results[1].error, ccxt.InsufficientFunds) and not results[1].ok
+
+
+def test_buyer_refunds_failed_orders_to_the_next_candidates(kraken, tmp_path, monkeypatch):
+    monkeypatch.setattr(utilities, "BASE", tmp_path)
+    order_submit.set_submitter(OrderSubmitter(workers=4))
+    kraken.reject = {"AAA/USD"}
+    ranked = {s: {"score": 0.9 - i / 100, "price": 10.0} for i, s in
+              enumerate(["AAA/USD", "BBB/USD", "CCC/USD", "DDD/USD", "EEE/USD"])}
+    ranked["LOW/USD"] = {"score": 0.1, "price": 10.0}
+    utilities.save_json(ranked, "data/ranked_coins.json")
+    utilities.save_json({"USD": 30.0, "XYZ/USD": 70.0}, "data/portfolio.json")
+    utilities.save_json({"CCC/USD": {"entry_price": 9.0, "qty": 1.0}}, "data/positions.json")
+    try:
+        buyer_mod.buyer()
+    finally:
+        order_submit.set_submitter(None)
+
+    pending = utilities.load_json("data/pending_orders.json")
+    assert [o["symbol"] for o in pending] == ["BBB/USD", "DDD/USD", "EEE/USD"]   # AAA's 10 USD refunded
+    assert all(o["qty"] == 1.0 and o["order_id"] == f"O-{o['symbol']}" for o in pending)
@@ -0,0 +1,86 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from scripts import candle_store, exchange, protective_orders, stop_engine, utilities
+from scripts.backtest import to_datetime
+from scripts.order_sync import PENDING_FILE, POSITION_FILE, reconcile_orders
+from scripts.protective_orders import ProtectionManager
+from scripts.sim_exchange import SimExchange
+from scripts.stop_engine import StopEngine
+
+T0, HOUR = 1_700_000_000_000, 3_600_000
+SYMBOLS = ("ABC/USD", "XYZ/USD", "DEF/USD", "GHI/USD")
+
+
+class Counting:
+    """Passes calls through to the sim exchange and counts them by name."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.calls = Counter()
+
+    def __getattr__(self, name):
+        attr = getattr(self.inner, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self.calls[name] += 1
+            return attr(*args, **kwargs)
+        return call
+
+
+def _bar(ts, price):
+    bar = np.zeros(1, dtype=candle_store.record_dtype())
+    bar["timestamp"] = ts
+    bar["open"] = bar["high"] = bar["low"] = bar["close"] = price
+    return bar[0]
+
+
+@pytest.fixture
+def sim(tmp_path, monkeypatch):
+    sim = SimExchange({s: np.empty(0, dtype=candle_store.record_dtype()) for s in SYMBOLS},
+                      cash=10_000.0, fee=0.0)
+    sim.advance(T0, {s: _bar(T0 - HOUR, 50.0) for s in SYMBOLS})
+    counting = Counting(sim)
+    monkeypatch.setattr(utilities, "BASE", tmp_path)
+    utilities.set_clock(lambda: to_datetime(sim.now))
+    exchange.set_exchange(counting)
+    protective_orders.set_protection(ProtectionManager(enabled=True))
+    stop_engine.set_engine(StopEngine(workers=None))
+    yield counting
+    exchange.set_exchange(None)
+    protective_orders.set_protection(None)
+    stop_engine.set_engine(None)
+    utilities.set_clock(None)
+
+
+def test_one_pass_resolves_every_pending_order_in_two_calls(sim):
+    inner = sim.inner
+    ids = {s: inner.create_limit_buy_order(s, 2.0, 40.0)["id"] for s in SYMBOLS}
+    placed = to_datetime(T0).isoformat()
+    utilities.save_json([{"order_id": ids[s], "symbol": s, "price": 40.0, "qty": 2.0, "placed_at": placed}
+                         for s in SYMBOLS[:3]] +
+                        [{"order_id": "GONE", "symbol": "ABC/USD", "placed_at": placed}], PENDING_FILE)
+    inner.cancel_order(ids["XYZ/USD"])
+    inner.advance(T0 + 4 * HOUR, {"ABC/USD": _bar(T0, 39.0)})
+
+    counts = reconcile_orders()
+    assert counts == {"filled": 1, "dropped": 2, "cancelled": 1,   # XYZ cancelled empty, GONE unknown
+                      "adopted": 1, "open": 0, "looked_up": 1}
+    assert (sim.calls["fetch_open_orders"], sim.calls["fetch_closed_orders"]) == (1, 1)
+    assert sim.calls["fetch_order"] == 1                          # only the order in neither set
+
+    position = utilities.load_json(POSITION_FILE)["ABC/USD"]
+    assert position["entry_price"] == 39.0 and position["qty"] == 2.0
+    assert inner.fetch_order(position["stop_order_id"])["stopPrice"] == pytest.approx(39.0 * 0.92)
+    assert stop_engine.get_engine().levels("ABC/USD") == pytest.approx((39.0 * 0.92, 39.0))
+    pending = utilities.load_json(PENDING_FILE)
+    assert [o["order_id"] for o in pending] == [ids["DEF/USD"], ids["GHI/USD"]]
+
+    counts = reconcile_orders()                                   # DEF cancelled last pass, GHI now
+    assert (counts["dropped"], counts["cancelled"]) == (1, 1)
+    assert [o["order_id"] for o in utilities.load_json(PENDING_FILE)] == [ids["GHI/USD"]]
+    assert reconcile_orders()["dropped"] == 1 and utilities.load_json(PENDING_FILE) == []
@@ -0,0 +1,26 @@
+from scripts.prices import PriceSnapshot
+
+
+class FlakyKraken:
+    def __init__(self):
+        self.down = False
+
+    def fetch_tickers(self):
+        if self.down:
+            raise ConnectionError("down")
+        return {"ABC/USD": {"last": 2.0}}
+
+
+def test_snapshot_expires_after_failed_refreshes():
+    now, kraken = [0.0], FlakyKraken()
+    snap = PriceSnapshot(ttl=10, exchange=lambda: kraken, clock=lambda: now[0], max_age=30)
+    assert snap.get("ABC/USD") == 2.0
+
+    kraken.down = True
+    now[0] = 25.0
+    assert snap.get("ABC/USD") == 2.0                 # stale but within max_age
+    now[0] = 31.0
+    assert snap.get("ABC/USD") is None                # dead prices are not served
+
+    kraken.down = False
+    assert snap.get("ABC/USD") == 2.0
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from scripts import candle_store, exchange
+from scripts.protective_orders import BACKSTOP_SLACK, ProtectionManager
+from scripts.sim_exchange import SimExchange
+from scripts.stop_engine import StopEngine
+
+
+def _bar(ts, o, h, l, c):
+    bar = np.zeros(1, dtype=candle_store.record_dtype())
+    bar["timestamp"], bar["open"], bar["high"], bar["low"], bar["close"] = ts, o, h, l, c
+    return bar[0]
+
+
+@pytest.fixture
+def sim():
+    sim = SimExchange({"ABC/USD": np.empty(0, dtype=candle_store.record_dtype()),
+                       "XYZ/USD": np.empty(0, dtype=candle_store.record_dtype())},
+                      cash=0.0, fee=0.0)
+    sim.balance.update(ABC=10.0, XYZ=5.0)
+    sim.advance(900_000, {"ABC/USD": _bar(0, 100, 100, 100, 100), "XYZ/USD": _bar(0, 20, 20, 20, 20)})
+    exchange.set_exchange(sim)
+    yield sim
+    exchange.set_exchange(None)
+
+
+def test_resting_stop_ratchets_triggers_and_reconciles(sim):
+    pm = ProtectionManager(enabled=True)
+    positions = {"ABC/USD": {"entry_price": 100.0, "qty": 10.0, "stop_price": 92.0}}
+    assert pm.place("ABC/USD", positions["ABC/USD"])
+    oid = positions["ABC/USD"]["stop_order_id"]
+    assert sim.fetch_balance()["free"]["ABC"] == 0.0             # coins reserved
+
+    positions["ABC/USD"]["stop_price"] = 92.1                     # below AMEND_STEP: no call
+    pm.amend("ABC/USD", positions["ABC/USD"])
+    assert sim.fetch_order(oid)["stopPrice"] == 92.0
+    positions["ABC/USD"]["stop_price"] = 106.7
+    pm.amend("ABC/USD", positions["ABC/USD"])
+    assert sim.fetch_order(oid)["stopPrice"] == 106.7
+
+    orphan = sim.create_order("XYZ/USD", "market", "sell", 5.0, None, {"stopLossPrice": 15.0})["id"]
+    sim.advance(1_800_000, {"ABC/USD": _bar(900_000, 108, 109, 104, 105)})
+    assert sim.fetch_order(oid)["average"] == 106.7               # filled at the stop
+
+    portfolio = {"USD": 0.0}
+    pm.reconcile(positions, portfolio)
+    assert positions == {} and portfolio["USD"] == pytest.approx(1067.0)
+    assert sim.fetch_order(orphan)["status"] == "canceled"
+
+
+def test_reconcile_replaces_missing_stop_and_backstop_releases_it(sim):
+    pm = ProtectionManager(enabled=True)
+    positions = {"ABC/USD": {"entry_price": 100.0, "qty": 10.0, "stop_price": 92.0,
+                             "stop_order_id": "GONE", "stop_order_price": 92.0}}
+    pm.reconcile(positions, {})
+    data = positions["ABC/USD"]
+    assert data["stop_order_id"] != "GONE" and sim.fetch_open_orders()[0]["stopPrice"] == 92.0
+
+    sim.cancel_order(data["stop_order_id"])                     # an exit released it ...
+    pm.reconcile(positions, {}, exiting=lambda s: True)
+    assert sim.fetch_open_orders() == []                        # ... so no new stop reserves the coins
+    pm.reconcile(positions, {})
+    assert sim.fetch_open_orders()[0]["stopPrice"] == 92.0
+
+    engine = StopEngine(workers=None)
+    engine.sync(positions)
+    assert not engine.on_tick("ABC/USD", 92.0 * (1 - BACKSTOP_SLACK / 2))   # the exchange's job
+    assert engine.on_tick("ABC/USD", 90.0)
+    assert sim.fetch_order(data["stop_order_id"])["status"] == "canceled"
+    assert sim.balance["ABC"] == 0.0 and engine.drain_closed()["ABC/USD"]["price"] == 100.0
@@ -0,0 +1,22 @@
+import numpy as np
+
+from scripts import quantizer
+
+
+def test_lut_within_bound_and_fallback(tmp_path):
+    lut = quantizer.LloydMaxLUT.build(size=32)
+    path = str(tmp_path / "lut.npz")
+    lut.save(path)
+    lut = quantizer.LloydMaxLUT.load(path)
+    assert lut.max_error <= quantizer.LUT_ERROR_BOUND
+
+    rng = np.random.default_rng(3)
+    b_l, b_r = np.exp(rng.uniform(np.log(quantizer.B_MIN), np.log(quantizer.B_MAX), (2, 500)))
+    exact = quantizer.solve(b_l, b_r, **lut.SOLVE_KW)
+    assert np.abs(lut.lookup(b_l, b_r) - exact).max() <= quantizer.LUT_ERROR_BOUND
+
+    # on the grid the table is the solve; off the table it falls back to it
+    axis = np.geomspace(quantizer.B_MIN, quantizer.B_MAX, 32)
+    np.testing.assert_allclose(lut.lookup(axis[[3, 7]], axis[[5, 0]]), lut.table[[3, 7], [5, 0]])
+    out = np.array([0.01, 2.0]), np.array([0.3, 0.3])
+    np.testing.assert_array_equal(lut.lookup(*out), quantizer.solve(*out, **lut.SOLVE_KW))
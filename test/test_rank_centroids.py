@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts import rank, quantizer
+
+
+@pytest.fixture(autouse=True)
+def small_lut(monkeypatch):
+    monkeypatch.setattr(quantizer, "_lut", quantizer.LloydMaxLUT.build(size=24))
+
+
+def _legacy_centroids(df, grid_pts=300):
+    """The original per-row loop at step=1."""
+    ohlc = df[["open", "high", "low", "close"]].to_numpy(dtype=np.float32)
+    hist = np.zeros(rank.n_bins)
+    x_grid = np.linspace(rank.bin_centers[0], rank.bin_centers[-1], grid_pts)
+    out = []
+    for row in ohlc:
+        hist *= rank.decay_rate
+        hist += np.histogram(row - row[0], bins=rank.bins)[0]
+        b_l, b_r = rank.fit_asymmetric_laplace_from_histogram(rank.bin_centers, hist)
+        y = np.where(x_grid < 0, 0.5 * np.exp(x_grid / b_l) / b_l,
+                     0.5 * np.exp(-x_grid / b_r) / b_r)
+        y *= hist.sum() * rank.bin_width
+        out.append(rank.lloyd_max_quantizer(x_grid, y, rank.n_centroids))
+    return np.array(out)
+
+
+def _candles(n, scale, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 1.0 + np.cumsum(rng.normal(0, scale, n))
+    open_ = np.r_[close[0], close[:-1]]
+    wick = np.abs(rng.normal(0, scale, (2, n)))
+    return pd.DataFrame({"open": open_, "high": np.maximum(open_, close) + wick[0],
+                         "low": np.minimum(open_, close) - wick[1], "close": close})
+
+
+def test_batched_centroids_match_per_row_loop():
+    # scale 0.3 spreads deltas across and beyond the histogram range
+    for scale in (0.05, 0.3):
+        df = _candles(300, scale)
+        got = rank.get_centroids(df, exact=True)
+        assert got.shape == (len(df), rank.n_centroids) and got.flags.c_contiguous
+        np.testing.assert_allclose(got, _legacy_centroids(df), rtol=1e-9, atol=1e-12)
+        assert np.abs(rank.get_centroids(df, exact=False) - got).max() <= quantizer.LUT_ERROR_BOUND
+
+
+def test_step_reuses_every_step_th_row():
+    df = _candles(23, 0.05)
+    full, stepped = rank.get_centroids(df), rank.get_centroids(df, step=5)
+    np.testing.assert_array_equal(stepped, full[np.arange(23) // 5 * 5])
@@ -0,0 +1,146 @@
+import numpy as np
+import pytest
+
+from scripts import candle_store, quantizer, rank_state
+from scripts.rank_state import SeriesState
+
+P = 900_000                                     # _series candle spacing
+
+
+@pytest.fixture(autouse=True)
+def small_lut(monkeypatch):
+    monkeypatch.setattr(quantizer, "_lut", quantizer.LloydMaxLUT.build(size=24))
+
+
+def _series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 2.0 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    wick = np.abs(rng.normal(0, 0.01, (2, n))) * close
+    recs = np.empty(n, dtype=candle_store.record_dtype())
+    recs["timestamp"] = 1_700_000_000_000 + np.arange(n) * 900_000
+    recs["open"], recs["close"] = open_, close
+    recs["high"] = np.maximum(open_, close) + wick[0]
+    recs["low"] = np.minimum(open_, close) - wick[1]
+    recs["volume"] = 1.0
+    return recs
+
+
+def _assert_same(a: SeriesState, b: SeriesState, same_origin: bool = True):
+    """Equal states; without `same_origin` the row counters (n, gidx) may differ."""
+    assert a.current() == b.current()
+    assert (a.watermark, a.fit_block, a.std, a.epoch) == (b.watermark, b.fit_block, b.std, b.epoch)
+    if same_origin:
+        assert a.n == b.n
+    for k in a.rows:
+        if same_origin or k != "gidx":
+            np.testing.assert_array_equal(a.rows[k], b.rows[k], err_msg=k)
+    for k in ("centers", "succ", "tot", "cents"):
+        np.testing.assert_array_equal(getattr(a, k), getattr(b, k), err_msg=k)
+    for ca, cb in zip(a.carries, b.carries):
+        np.testing.assert_array_equal(ca[0], cb[0])
+        assert ca[1].to_dict() == cb[1].to_dict()
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_incremental_matches_full_recompute(tmp_path, seed):
+    recs = _series(3000, seed)
+
+    full = SeriesState(P)
+    full.advance(recs)
+    assert full.current() is not None and len(full.rows["ts"]) == rank_state.WINDOW
+
+    # same candles arriving over many cycles, persisted between them
+    path = str(tmp_path / "state.npz")
+    SeriesState(P).save(path)
+    for end in [*range(37, len(recs), 37), len(recs)]:
+        st = SeriesState.load(path)
+        st.advance(recs[:end])                  # already-seen rows are skipped
+        st.save(path)
+    _assert_same(SeriesState.load(path), full)
+
+    # a fresh state over the last SPAN rows (a rebuild) lands on the same state
+    for start in (len(recs) - rank_state.SPAN, 1234):
+        fresh = SeriesState(P)
+        fresh.advance(recs[start:])
+        _assert_same(fresh, full, same_origin=False)
+
+
+def test_replay_traces_current_after_every_row():
+    recs = _series(2000, seed=2)
+    trace = rank_state.replay(recs, P)
+    assert len(trace) == len(recs)
+
+    st = SeriesState(P)
+    for end in (1, 49, 50, 51, 120, 701, 900, 2000):
+        st.advance(recs[:end])
+        assert trace[end - 1] == st.current()
+    for end in (rank_state.SPAN, 1700, 1913):
+        fresh = SeriesState(P)
+        fresh.advance(recs[end - rank_state.SPAN:end])
+        assert trace[end - 1] == fresh.current()
+
+
+def test_update_series_reads_only_new_candles(tmp_path):
+    coin = tmp_path / "historical" / "abc_usd"
+    store = str(coin / "15m.ohlcv")
+    candle_store.create(store)
+    recs = _series(1700, seed=1)
+    candle_store.append(store, recs[:1600])
+    state_dir = str(tmp_path / "state")
+
+    rank_state.update_series(str(coin), "15m", state_dir)
+    candle_store.append(store, recs[1600:])
+    got = rank_state.update_series(str(coin), "15m", state_dir)
+
+    ref = SeriesState(P)
+    ref.advance(recs[1600 - rank_state.SPAN:])      # a fresh state starts SPAN rows back
+    assert got == ref.current()
+    assert SeriesState.load(rank_state.state_path(str(coin), "15m", state_dir)).n == rank_state.SPAN + 100
+
+
+def test_update_series_waits_for_the_forming_candle(tmp_path):
+    coin = tmp_path / "historical" / "abc_usd"
+    store = str(coin / "15m.ohlcv")
+    candle_store.create(store)
+    recs = _series(900, seed=3)
+    forming = recs[-1:].copy()
+    forming["close"] *= 1.05                        # provisional close, re-sent until final
+    forming["high"] = np.maximum(forming["high"], forming["close"])
+    candle_store.append(store, np.concatenate([recs[:-1], forming]))
+    state_dir = str(tmp_path / "state")
+    ts = int(recs["timestamp"][-1])
+
+    got = rank_state.update_series(str(coin), "15m", state_dir, now_ms=ts + 1)
+    ref = SeriesState(P)
+    ref.advance(recs[-1 - rank_state.SPAN:-1])
+    assert got == ref.current()
+    assert SeriesState.load(rank_state.state_path(str(coin), "15m", state_dir)).watermark == ts - 900_000
+
+    candle_store.append(store, recs[-1:])           # the candle closes
+    got = rank_state.update_series(str(coin), "15m", state_dir, now_ms=ts + 900_000)
+    ref.advance(recs)
+    assert got == ref.current()
+    _assert_same(SeriesState.load(rank_state.state_path(str(coin), "15m", state_dir)), ref)
+
+
+def test_parallel_rank_matches_serial(tmp_path):
+    from scripts import rank
+
+    hist = tmp_path / "historical"
+    for i, name in enumerate(("abc_usd", "xyz_usd", "foo_usd")):
+        for j, tf in enumerate(("1h", "15m")):
+            store = str(hist / name / f"{tf}.ohlcv")
+            candle_store.create(store)
+            candle_store.append(store, _series(300 + 50 * i, seed=10 * i + j))
+
+    out = {}
+    try:
+        for workers in (1, 2):
+            out[workers] = tmp_path / f"ranked_{workers}.json"
+            rank.rank_coins(workers=workers, hist_dir=hist, output=out[workers],
+                            state_dir=str(tmp_path / f"state_{workers}"))
+    finally:
+        rank.shutdown_pool()
+    assert out[1].read_text() == out[2].read_text()
+    assert "ABC/USD" in out[1].read_text()
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from scripts import candle_store
+from scripts.resample import derive_timeframe, period_ms, resample
+
+
+def _fine(start, periods, seed=0):
+    rng = np.random.default_rng(seed)
+    idx = pd.date_range(start, periods=periods, freq="15min", tz="UTC", name="timestamp")
+    close = 100 + rng.standard_normal(periods).cumsum()
+    return pd.DataFrame({"open": close + rng.standard_normal(periods) * 0.1,
+                         "high": close + 1, "low": close - 1,
+                         "close": close, "volume": rng.random(periods)}, index=idx)
+
+
+def test_resample_matches_pandas():
+    df = _fine("2025-01-01", 500)
+    bars = candle_store.to_frame(resample(candle_store.to_records(df), period_ms("4h")))
+    ref = df.resample("4h").agg({"open": "first", "high": "max", "low": "min",
+                                 "close": "last", "volume": "sum"})
+    pd.testing.assert_frame_equal(bars, ref, check_freq=False, check_names=False)
+
+
+def test_incremental_derive_equals_full(tmp_path):
+    df = _fine("2025-01-01 00:45", 400, seed=1)
+    fine = candle_store.store_path("BTC/USD", "15m", tmp_path)
+
+    candle_store.append(fine, df.iloc[:150])
+    derive_timeframe("BTC/USD", "1h", str(tmp_path))
+    for stop in (151, 230, 400):                       # bars close in chunks
+        candle_store.append(fine, df.iloc[:stop])
+        derive_timeframe("BTC/USD", "1h", str(tmp_path))
+
+    out = candle_store.read_frame(candle_store.store_path("BTC/USD", "1h", tmp_path))
+    ref = df.loc["2025-01-01 01:00":].resample("1h").agg(
+        {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"})
+    pd.testing.assert_frame_equal(out, ref, check_freq=False, check_names=False)
@@ -0,0 +1,78 @@
+import numpy as np
+from numba import njit
+
+from scripts import rank
+from scripts.first_passage import band_tree, first_outside, next_true
+
+
+@njit(cache=True, fastmath=True)
+def _legacy_simulate(mid_px, clusters, mom, buy_fee, sl_pct, trig_pct, mom_win):
+    """The forward-scan kernel _simulate replaced."""
+    n = mid_px.size
+    successes = np.zeros(n, dtype=np.int32)
+    totals = np.zeros(n, dtype=np.int32)
+    for i in range(n - 1):
+        c = clusters[i]
+        entry_px = mid_px[i] * (1.0 + buy_fee)
+        sl_price = entry_px * (1.0 - sl_pct)
+        sl_raised = False
+        exit_px = mid_px[-1]
+        j = i + 1
+        while j < n:
+            cur_px = mid_px[j]
+            if (not sl_raised) and cur_px >= entry_px * (1.0 + trig_pct):
+                sl_price = entry_px * (1.0 + trig_pct)
+                sl_raised = True
+            if sl_raised and j - mom_win >= 0:
+                if mom[j] < 0:
+                    exit_px = cur_px
+                    break
+            if cur_px <= sl_price:
+                exit_px = cur_px
+                break
+            j += 1
+        totals[c] += 1
+        if exit_px - entry_px > 0:
+            successes[c] += 1
+    return successes, totals
+
+
+def _inputs(n, seed, tick=None):
+    rng = np.random.default_rng(seed)
+    mid = 10.0 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    if tick:                                   # coarse prices: many exact touches
+        mid = np.round(mid / tick) * tick
+    mom = np.tanh(rng.normal(0, 1, n))
+    mom[:30] = np.nan
+    return mid, rng.integers(0, 8, n).astype(np.int32), mom
+
+
+def test_matches_forward_scan():
+    params = [(0.0025, 0.08, 0.02, 60), (0.0, 0.0, 0.0, 0), (0.001, 0.02, 0.05, 5),
+              (0.0, -0.01, -0.01, 3)]
+    for seed, tick in ((0, None), (1, 0.05), (2, 0.5)):
+        for n in (1, 2, 700, 5000):
+            mid, clusters, mom = _inputs(n, seed, tick)
+            for p in params:
+                got = rank._simulate(mid, clusters, mom, *p)
+                want = _legacy_simulate(mid, clusters, mom, *p)
+                np.testing.assert_array_equal(got[0], want[0])
+                np.testing.assert_array_equal(got[1], want[1])
+
+
+def test_first_outside_and_next_true():
+    rng = np.random.default_rng(3)
+    x = rng.integers(0, 20, 300).astype(np.float64)
+    x[5] = np.nan
+    tree = band_tree(x)
+    for lo in range(-1, 305):
+        for hi in (lo + 1, lo + 70, 1000):
+            for low, high in ((-1.0, np.nan), (3.0, np.nan), (3.0, 15.0), (10.0, 12.0), (-1.0, 25.0)):
+                hits = [j for j in range(max(lo, 0), min(hi, len(x))) if x[j] <= low or x[j] >= high]
+                want = hits[0] if hits and lo >= 0 else -1
+                assert first_outside(x, tree, lo, hi, low, high) == want
+    mask = x > 15
+    nxt = next_true(mask)
+    for i in range(len(x) + 1):
+        hits = np.flatnonzero(mask[i:])
+        assert nxt[i] == (i + hits[0] if len(hits) else -1)
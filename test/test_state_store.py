@@ -0,0 +1,72 @@
+import json
+import sqlite3
+import threading
+
+import pytest
+
+from scripts.state_store import close_store, get_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data/portfolio.json").write_text(json.dumps({"USD": 10.5, "SOL/USD": 13.6}))
+    yield get_store(tmp_path)
+    close_store(tmp_path)
+
+
+def test_rows_round_trip_and_only_changes_are_written(store, tmp_path):
+    assert store.load("portfolio") == {"USD": 10.5, "SOL/USD": 13.6}      # legacy JSON imported
+    positions = {"ABC/USD": {"qty": 2, "entry_price": 39.0, "stop_price": None, "triggered": False,
+                             "filled_at": "2024-01-01T00:00:00", "stop_order_id": "S1"},
+                 "XYZ/USD": {"qty": 1.5, "entry_price": None, "current_price": 3.2}}
+    assert store.save("positions", positions) == 2
+    assert store.save("positions", positions) == 0
+    positions["ABC/USD"]["stop_price"] = 40.1
+    assert store.save("positions", positions) == 1
+    pending = [{"order_id": "O2", "symbol": "B/USD", "price": 1.0}, {"order_id": "O1", "symbol": "A/USD"}]
+    store.save("pending_orders", pending)
+
+    store.flush()
+    assert json.loads((tmp_path / "data/positions.json").read_text()) == positions  # dashboard export
+    con = sqlite3.connect(tmp_path / "data/state.db")
+    assert con.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    assert con.execute("SELECT stop_price, extra FROM positions WHERE key = 'ABC/USD'").fetchone() == \
+        (40.1, '{"triggered": false}')
+    close_store(tmp_path)
+
+    store = get_store(tmp_path)                                          # reread from the database
+    assert store.load("positions") == positions and store.load("pending_orders") == pending
+    assert store.get("portfolio", "USD") == 10.5
+
+
+def test_saves_merge_with_other_threads(store):
+    store.save("positions", {"AAA/USD": {"qty": 1.0}, "BBB/USD": {"qty": 2.0}})
+    mine = store.load("positions")                                       # e.g. the monitor loop
+
+    def main_thread():
+        theirs = store.load("positions")
+        theirs["CCC/USD"] = {"qty": 3.0}                                 # a fill booked meanwhile
+        theirs["BBB/USD"]["stop_price"] = 1.5
+        store.save("positions", theirs)
+    t = threading.Thread(target=main_thread)
+    t.start()
+    t.join()
+
+    del mine["AAA/USD"]                                                  # sold
+    mine["BBB/USD"]["peak_price"] = 2.5
+    store.save("positions", mine)
+    assert store.load("positions") == {"BBB/USD": {"qty": 2.0, "peak_price": 2.5},
+                                       "CCC/USD": {"qty": 3.0}}
+
+
+def test_failed_transaction_leaves_state_untouched(store, tmp_path):
+    store.save("monitor", {"AAA/USD": {"price": 1.0}})
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            store.upsert("monitor", "BBB/USD", {"price": 2.0})
+            store.delete("monitor", "AAA/USD")
+            raise RuntimeError("boom")
+    assert store.load("monitor") == {"AAA/USD": {"price": 1.0}}
+    store.flush()
+    assert json.loads((tmp_path / "data/monitor.json").read_text()) == {"AAA/USD": {"price": 1.0}}
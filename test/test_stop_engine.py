@@ -0,0 +1,98 @@
+import time
+
+import ccxt  # type: ignore
+import pytest
+
+from scripts import exchange
+from scripts.monitor_portfolio import apply_exits
+from scripts.stop_engine import RETRY_AFTER, LatencyHistogram, StopEngine
+
+
+class FakeKraken:
+    """Market sells at a fixed fill price; the first `fail` calls are rejected."""
+
+    def __init__(self, fail=0, delay=0.0):
+        self.sells = []
+        self.fail = fail
+        self.delay = delay
+
+    def create_market_sell_order(self, symbol, amount):
+        time.sleep(self.delay)
+        if self.fail:
+            self.fail -= 1
+            raise ccxt.NetworkError("timeout")
+        self.sells.append((symbol, amount))
+        return {"id": f"O{len(self.sells)}", "average": 99.0}
+
+
+@pytest.fixture
+def kraken():
+    fake = FakeKraken()
+    exchange.set_exchange(fake)
+    yield fake
+    exchange.set_exchange(None)
+
+
+def _positions():
+    return {"AAA/USD": {"entry_price": 100.0, "qty": 2.0, "filled_at": "t1"},
+            "BBB/USD": {"entry_price": 50.0, "qty": 4.0, "filled_at": "t2"}}
+
+
+def test_ticks_ratchet_and_fire_only_crossed_levels(kraken):
+    now = [1000.0]
+    engine = StopEngine(workers=None, clock=lambda: now[0])
+    positions = _positions()
+    engine.sync(positions)
+    assert engine.levels("AAA/USD") == (92.0, 100.0)
+
+    assert not engine.on_tick("AAA/USD", 103.0)                 # below TRIGGER_PROFIT
+    assert engine.levels("AAA/USD") == (92.0, 103.0)
+    assert not engine.on_tick("AAA/USD", 110.0)
+    assert engine.levels("AAA/USD") == pytest.approx((106.7, 110.0))
+    assert not engine.on_tick("BBB/USD", 47.0) and not engine.on_tick("CCC/USD", 1.0)
+
+    assert engine.on_tick("AAA/USD", 106.5, received_at=999.9)
+    assert not engine.on_tick("AAA/USD", 100.0)                 # fires once
+    assert kraken.sells == [("AAA/USD", 2.0)]
+    assert engine.latency()["tick_to_order"]["n"] == 1
+
+    engine.sync(positions)                                      # not drained yet: no re-arm
+    assert engine.levels("AAA/USD") is None and engine.exiting("AAA/USD")
+    portfolio = {"USD": 10.0}
+    apply_exits(positions, portfolio, engine.drain_closed())
+    assert list(positions) == ["BBB/USD"] and portfolio["USD"] == pytest.approx(10 + 2 * 99.0)
+
+
+def test_failed_exit_rearms_after_retry_delay(kraken):
+    now = [0.0]
+    kraken.fail = 1
+    engine = StopEngine(workers=None, clock=lambda: now[0])
+    engine.sync(_positions())
+
+    assert engine.on_tick("BBB/USD", 45.0)
+    assert kraken.sells == [] and engine.levels("BBB/USD") is not None
+    now[0] += RETRY_AFTER / 2
+    assert not engine.on_tick("BBB/USD", 45.0)
+    now[0] += RETRY_AFTER
+    assert engine.on_tick("BBB/USD", 45.0)
+    assert kraken.sells == [("BBB/USD", 4.0)] and list(engine.drain_closed()) == ["BBB/USD"]
+
+
+def test_tick_thread_hands_the_sell_off(kraken):
+    kraken.delay = 0.2
+    engine = StopEngine()
+    engine.sync(_positions())
+
+    t0 = time.perf_counter()
+    assert engine.on_tick("AAA/USD", 90.0)
+    assert time.perf_counter() - t0 < 0.1                       # not waiting on REST
+    engine.wait()
+    lat = engine.latency()
+    assert lat["tick_to_order"]["max_ms"] < 100 <= lat["tick_to_ack"]["max_ms"]
+
+
+def test_latency_histogram_percentiles():
+    h = LatencyHistogram()
+    for ms in [0.3] * 98 + [3.0, 700.0]:
+        h.record(ms / 1000)
+    assert h.percentile(0.5) == 0.5 and h.percentile(0.99) == 4.0 and h.max_ms == 700.0
@@ -0,0 +1,68 @@
+import os
+import time
+
+from scripts import candle_store
+from scripts.stream import MarketBus, KrakenStream, flush_to_store
+from scripts.replay_server import ReplayServer, serve_in_thread
+
+START_MS = 1_700_000_100_000 - 1_700_000_100_000 % 900_000
+
+
+def _wait(cond, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if cond():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_replay_feeds_bus_and_store(tmp_path):
+    url, stop_server = serve_in_thread(ReplayServer("synthetic", speed=200, start_ms=START_MS))
+    bus = MarketBus()
+    feed = KrakenStream(["BTC/USD", "ETH/USD"], bus, url).start()
+    try:
+        assert feed.ready.wait(5)
+        assert _wait(lambda: len(bus.candles("ETH/USD", 15)) >= 20)
+        assert bus.price("BTC/USD") is not None
+
+        added = flush_to_store("ETH/USD", str(tmp_path), bus=bus)
+        recs = candle_store.read(candle_store.store_path("ETH/USD", "15m", str(tmp_path)))
+        assert added == len(recs) >= 20
+        assert recs["timestamp"][0] == START_MS
+        assert (recs["timestamp"][1:] - recs["timestamp"][:-1] == 900_000).all()
+        assert (recs["high"] >= recs["close"]).all() and (recs["low"] <= recs["open"]).all()
+    finally:
+        feed.stop()
+        stop_server.set()
+
+    # feed down: the bus stops vouching for its prices
+    assert _wait(lambda: not bus.connected)
+    assert bus.price("BTC/USD") is None
+
+
+def test_stale_price_is_ignored():
+    now = [1000.0]
+    bus = MarketBus(clock=lambda: now[0])
+    bus.connected = True
+    bus.publish_price("SOL/USD", 150.0)
+    assert bus.price("SOL/USD") == 150.0
+    now[0] += 60
+    assert bus.price("SOL/USD") is None
+
+
+def test_flush_appends_only_new_candles(tmp_path):
+    now = [START_MS / 1000]
+    bus = MarketBus(clock=lambda: now[0])
+    store = candle_store.store_path("SOL/USD", "15m", str(tmp_path))
+    for i in range(4):
+        bus.publish_candle("SOL/USD", 15, (START_MS + i * 900_000, 1.0, 2.0, 0.5, 1.5, 10.0))
+    now[0] += 3 * 900                                   # three closed, one forming
+    assert flush_to_store("SOL/USD", str(tmp_path), bus=bus) == 3
+    inode = os.stat(store).st_ino
+    assert flush_to_store("SOL/USD", str(tmp_path), bus=bus) == 0
+
+    now[0] += 900                                       # the forming bar closes
+    assert flush_to_store("SOL/USD", str(tmp_path), bus=bus) == 1
+    assert os.stat(store).st_ino == inode               # appended, never rewritten
+    assert len(candle_store.read(store)) == 4
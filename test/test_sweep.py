@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts import candle_store, quantizer, rank_state, sweep
+
+
+@pytest.fixture(autouse=True)
+def small_lut(monkeypatch):
+    monkeypatch.setattr(quantizer, "_lut", quantizer.LloydMaxLUT.build(size=24))
+
+
+def _recs(n, seed):
+    rng = np.random.default_rng(seed)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    df = pd.DataFrame({"open": open_, "high": np.maximum(open_, close) * 1.005,
+                       "low": np.minimum(open_, close) * 0.995, "close": close, "volume": 1.0},
+                      index=pd.date_range("2024-01-01", periods=n, freq="1h", tz="UTC",
+                                          name="timestamp"))
+    return candle_store.to_records(df)
+
+
+GRID = {"buy_fee": [0.0, 0.0025], "stop_loss_pct": [0.04, 0.08],
+        "trigger_profit": [0.02], "momentum_window": [30, 60]}
+
+
+@pytest.mark.parametrize("n", [500, 900])                          # 900: the window slides
+def test_each_combination_matches_the_live_ranking(monkeypatch, n):
+    recs = _recs(n, 0)
+    combos = sweep.expand_grid(GRID)
+    out, current = sweep.sweep_series(sweep.prepare_series(recs, 3_600_000), combos, [0.0, 0.6, 2.0])
+    for k, p in enumerate(combos.itertuples(index=False)):
+        for name, value in zip(("BUY_FEE", "STOP_LOSS", "TRIGGER", "MOM_WINDOW"), p):
+            monkeypatch.setattr(rank_state, name, value)
+        trace = []
+        st = rank_state.SeriesState(3_600_000)
+        st.advance(recs, trace)
+        rows = st.rows
+        won = np.where(rows["outcome"] == rank_state.OPEN, rows["mid"][-1] > rows["entry"],
+                       rows["outcome"] == 1)
+        for t, threshold in enumerate((0.0, 0.6)):
+            taken = [i for i, c in enumerate(trace[:-1]) if c and c[1] / (c[2] + 2) >= threshold]
+            assert out[k, t, 0] == len(taken)
+            if n <= rank_state.WINDOW:                                    # every row still in st.rows
+                assert out[k, t, 1] == won[taken].sum()
+        assert out[k, 2, 0] == 0                                          # nothing scores >= 2
+        assert tuple(current[k]) == trace[-1][1:]
+
+
+def test_run_sweep_table(tmp_path):
+    base = tmp_path / "historical"
+    for i, sym in enumerate(("BTC/USD", "ETH/USD")):
+        for tf in ("1h", "4h"):
+            path = candle_store.store_path(sym, tf, base)
+            candle_store.create(path)
+            candle_store.append(path, _recs(300, 10 * i + len(tf)))
+
+    table = sweep.run_sweep(GRID, [0.0, 0.6], str(base), ("1h", "4h"))
+    assert len(table) == 8 * 2
+    assert list(table.columns[:5]) == sweep.PARAMS + ["min_score"]
+    everything = table[table["min_score"] == 0.0]
+    scored = 299 - (rank_state.MIN_FIT_ROWS - 1)                     # no current() before the first fit
+    assert (everything["entries"] == 2 * 2 * scored).all() and (everything["symbols"] == 2).all()
+    assert (table["win_rate"].dropna().between(0, 1)).all()